@@ -0,0 +1,95 @@
+import asyncio
+import statistics
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+
+from src.main import app
+from src.utils.settings import settings
+
+
+def _summary(latencies: List[float], elapsed: float, payload: int) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "payload_bytes": payload,
+    }
+
+
+async def _measure(
+    send: Callable[[int], Awaitable[httpx.Response]], requests: int, concurrency: int
+) -> Dict[str, float]:
+    """
+    Send `requests` requests with at most `concurrency` in flight, recording the latency of each.
+    """
+    latencies: List[float] = []
+    payload = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        nonlocal payload
+        async with semaphore:
+            start = time.perf_counter()
+            response = await send(i)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            payload = len(response.content)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return _summary(latencies, time.perf_counter() - start, payload)
+
+
+async def _seed(db: Any, count: int) -> List[str]:
+    now = datetime.utcnow()
+    result = await db["itemcollection"].insert_many([
+        {"name": f"Benchmark Item {i}", "type": f"Type {i % 10}", "created_time": now, "updated_time": now}
+        for i in range(count)
+    ])
+    return [str(_id) for _id in result.inserted_ids]
+
+
+async def run(requests: int = 200, concurrency: int = 10, sizes: List[int] = (1, 100, 1000, 10_000)) -> Dict[str, Any]:
+    """
+    Benchmark each item route in-process through httpx's ASGI transport, against the mock database
+    used by the tests. Measures throughput and latency percentiles per route, and for listings and
+    exports at each payload size.
+    """
+    results: Dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for size in sizes:
+            connection = AsyncMongoMockClient()
+            app.state.db = connection["benchmarkdatabase"]
+            await app.state.cache.clear()
+            ids = await _seed(app.state.db, size)
+
+            limit = min(size, settings.page_size_max)
+            results[f"GET /item/?limit={limit} [{size}]"] = await _measure(
+                lambda i: client.get("/item/", params={"limit": limit}), requests, concurrency
+            )
+            results[f"GET /item/export [{size}]"] = await _measure(
+                lambda i: client.get("/item/export"), max(requests // 10, 1), concurrency
+            )
+            if size != sizes[0]:
+                continue
+
+            # Single item routes only depend on the collection size through the indexes
+            results["GET /item/{id}"] = await _measure(
+                lambda i: client.get(f"/item/{ids[i % len(ids)]}"), requests, concurrency
+            )
+            results["POST /item/"] = await _measure(
+                lambda i: client.post("/item/", json={"name": f"New Item {i}", "type": "New"}), requests, concurrency
+            )
+            results["PUT /item/{id}"] = await _measure(
+                lambda i: client.put(f"/item/{ids[i % len(ids)]}", json={"name": f"Updated {i}"}), requests, concurrency
+            )
+            connection.close()
+    app.state.db = None
+    return results
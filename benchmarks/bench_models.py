@@ -0,0 +1,36 @@
+import timeit
+from datetime import datetime
+from typing import Callable, Dict
+
+from src.api.item.models import Item
+from src.utils.common_models import IdMixin, PyObjectId
+from src.utils.serialization import documents_to_json
+
+
+def _micro(function: Callable[[], object], number: int) -> Dict[str, float]:
+    """
+    Run `function` `number` times, five times over, and report the best run as nanoseconds per call
+    and calls per second.
+    """
+    best = min(timeit.repeat(function, number=number, repeat=5)) / number
+    return {"ns_per_op": best * 1e9, "ops_per_second": 1 / best}
+
+
+def run(number: int = 10_000) -> Dict[str, Dict[str, float]]:
+    """
+    Micro-benchmarks for the model code every item request goes through.
+    """
+    _id = PyObjectId()
+    id_str = str(_id)
+    now = datetime.utcnow()
+    document = {"_id": _id, "name": "Benchmark Item", "type": "Benchmark", "created_time": now, "updated_time": now}
+    documents = [dict(document) for _ in range(100)]
+
+    return {
+        "PyObjectId.validate": _micro(lambda: PyObjectId.validate(id_str, None), number),
+        "IdMixin(_id)": _micro(lambda: IdMixin(_id=_id), number),
+        "IdMixin(id)": _micro(lambda: IdMixin(id=id_str), number),
+        "Item(**document)": _micro(lambda: Item(**document), number),
+        "Item.model_dump_json": _micro(Item(**document).model_dump_json, number),
+        "documents_to_json[100]": _micro(lambda: documents_to_json(documents), number // 100 or 1),
+    }
@@ -0,0 +1,97 @@
+"""
+Run the benchmarks, write the results as JSON and compare them against a stored baseline.
+
+    python -m benchmarks.run [--output results.json] [--baseline baseline.json] [--threshold 0.2]
+
+Exits with status 1 if any benchmark regressed by more than the threshold compared to the baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+from typing import Any, Dict, List
+
+# Each metric, and whether a higher value is better
+METRICS = {
+    "throughput": True, "ops_per_second": True, "p50_ms": False, "p99_ms": False, "ns_per_op": False, "ms": False
+}
+# The groups of results which are compared against the baseline
+GROUPS = ("api", "models", "startup")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Compare two sets of results, returning a description of each metric which is worse than the
+    baseline by more than `threshold`, a fraction. Benchmarks missing from either set are ignored.
+    """
+    regressions = []
+    for group in GROUPS:
+        for name, current in results.get(group, {}).items():
+            previous = baseline.get(group, {}).get(name)
+            if previous is None:
+                continue
+            for metric, higher_is_better in METRICS.items():
+                if metric not in current or not previous.get(metric):
+                    continue
+                change = (current[metric] - previous[metric]) / previous[metric]
+                if (-change if higher_is_better else change) > threshold:
+                    regressions.append(f"{name} {metric}: {previous[metric]:.3f} -> {current[metric]:.3f} ({change:+.1%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the item API and models.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results.")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json", help="Results to compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results as the baseline.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Fractional change counted as a regression, default 0.2.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route benchmark.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight at once.")
+    parser.add_argument("--sizes", default="1,100,1000,10000", help="Collection sizes for listing benchmarks.")
+    parser.add_argument("--skip-api", action="store_true", help="Do not run the route benchmarks.")
+    parser.add_argument("--skip-startup", action="store_true", help="Do not measure the startup time.")
+    args = parser.parse_args()
+
+    # The app reads its settings on import, so import it only once the environment is final
+    os.environ.setdefault("MODE", "TEST")
+    os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+    from benchmarks import bench_api, bench_models, startup
+
+    results: Dict[str, Any] = {"python": platform.python_version(), "machine": platform.machine()}
+    results["models"] = bench_models.run()
+    if not args.skip_api:
+        sizes = [int(size) for size in args.sizes.split(",")]
+        results["api"] = asyncio.run(bench_api.run(args.requests, args.concurrency, sizes))
+    if not args.skip_startup:
+        report = startup.run()
+        results["startup"] = report["timings"]
+        results["imports"] = report["imports"]
+        for module in report["imports"]:
+            print(f"import {module['module']:38} cumulative_ms={module['cumulative_ms']:,.3f}  self_ms={module['self_ms']:,.3f}")
+
+    for group in GROUPS:
+        for name, values in results.get(group, {}).items():
+            print(f"{name:45} " + "  ".join(f"{metric}={value:,.3f}" for metric, value in values.items()))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+# The application is started in DEV mode, which serves the OpenAPI schema from a file if one has been
+# generated, without connecting to the database as lifespan is not run
+ENVIRONMENT = {**os.environ, "MODE": "DEV", "LOG_LEVEL": "CRITICAL"}
+
+# Run in a fresh interpreter, so nothing is imported already. Times are from the start of the script.
+FIRST_REQUEST = """
+import json, time
+start = time.perf_counter()
+import httpx, asyncio
+imported = time.perf_counter()
+from src.main import app
+app_ready = time.perf_counter()
+
+async def first(path):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        before = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        return time.perf_counter() - before
+
+root = asyncio.run(first("/"))
+openapi = asyncio.run(first("/openapi.json"))
+print(json.dumps({
+    "app_import_ms": (app_ready - imported) * 1000,
+    "first_request_ms": root * 1000,
+    "first_openapi_ms": openapi * 1000,
+}))
+"""
+
+
+def import_times(top: int) -> List[Dict[str, Any]]:
+    """
+    The modules imported by the application with the longest cumulative import times, from
+    `python -X importtime`.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.main"],
+        capture_output=True, text=True, check=True, env=ENVIRONMENT
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000
+        })
+    return sorted(modules, key=lambda module: module["cumulative_ms"], reverse=True)[:top]
+
+
+def run(top: int = 20, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Measure how long a worker takes to start: the time to import the application, to answer its
+    first request and to serve the OpenAPI schema for the first time. Each is the best of `repeat`
+    fresh processes. The slowest imports are reported separately as `imports`.
+    """
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", FIRST_REQUEST], capture_output=True, text=True, check=True, env=ENVIRONMENT
+        )
+        runs.append(json.loads(result.stdout))
+    results = {key: {"ms": min(run[key] for run in runs)} for key in runs[0]}
+    return {"timings": results, "imports": import_times(top)}
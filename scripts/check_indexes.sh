@@ -0,0 +1,4 @@
+#!/bin/bash
+
+export LOG_LEVEL="ERROR"
+python -m src.utils.indexes "$@"
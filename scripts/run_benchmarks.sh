@@ -0,0 +1,5 @@
+#!/bin/bash
+
+export LOG_LEVEL="CRITICAL"
+export MODE="TEST"
+python -m benchmarks.run "$@"
@@ -0,0 +1,6 @@
+#!/bin/bash
+
+export MODE="LIVE"
+# The memory caches of several workers would serve stale items, so only cache when a backend is set
+export CACHE_BACKEND="${CACHE_BACKEND:-NONE}"
+hypercorn --config python:src.hypercorn_config src.main:app
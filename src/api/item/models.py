@@ -1,9 +1,30 @@
 from datetime import datetime
-from typing import Optional
+from enum import Enum
+from typing import Dict, List, Optional
 
+from bson import ObjectId
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, TEXT, IndexModel
 
 from src.utils.common_models import IdMixin
+from src.utils.indexes import register_indexes
+
+# The weights of the fields searched by /item/search in the ranking of results
+ITEM_SEARCH_WEIGHTS = {"name": 10, "type": 2}
+
+# Indexes on the item collection. Each ends with _id so keyset pagination sorted on the field can
+# use it, and the name index also serves prefix searches.
+ITEM_INDEXES = register_indexes("itemcollection", [
+    IndexModel([("name", ASCENDING), ("_id", ASCENDING)], name="name_id"),
+    IndexModel([("type", ASCENDING), ("_id", ASCENDING)], name="type_id"),
+    IndexModel([("created_time", ASCENDING), ("_id", ASCENDING)], name="created_time_id"),
+    IndexModel([("updated_time", ASCENDING), ("_id", ASCENDING)], name="updated_time_id"),
+    IndexModel([(field, TEXT) for field in ITEM_SEARCH_WEIGHTS], name="search_text", weights=ITEM_SEARCH_WEIGHTS),
+])
+
+# Fields the item listing can be sorted on, each is covered by one of the indexes above, with the
+# type of their values, which the values in a cursor must have
+ITEM_SORT_FIELDS = {"_id": ObjectId, "name": str, "type": str, "created_time": datetime, "updated_time": datetime}
 
 
 class Item(IdMixin, BaseModel):
@@ -17,6 +38,17 @@ class Item(IdMixin, BaseModel):
     type: str = Field(...)
 
 
+class ItemPartial(IdMixin, BaseModel):
+    """
+    Represents an item returned from the database with a field projection applied. Only the id is
+    guaranteed to be present, fields which were not requested are left unset.
+    """
+    created_time: Optional[datetime] = None
+    updated_time: Optional[datetime] = None
+    name: Optional[str] = None
+    type: Optional[str] = None
+
+
 class ItemNew(BaseModel):
     """
     Model for creating a new item.
@@ -31,3 +63,44 @@ class ItemUpdate(BaseModel):
     """
     name: Optional[str] = None
     type: Optional[str] = None
+
+
+class ItemBulkUpdate(ItemUpdate):
+    """
+    Model for one entry of a bulk update, the fields to update along with the id of the item.
+    """
+    id: str = Field(...)
+
+
+class BulkItemResult(BaseModel):
+    """
+    The outcome of one entry of a bulk request. `index` is the position of the entry in the request
+    and `status` is the HTTP status code the equivalent single item request would have returned.
+    """
+    index: int
+    status: int
+    id: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class BulkResponse(BaseModel):
+    """
+    Response for bulk requests, one result per entry in the request in the same order.
+    """
+    results: List[BulkItemResult]
+
+
+class ItemStats(BaseModel):
+    """
+    The number of items, in total and for each type.
+    """
+    total: int
+    types: Dict[str, int]
+
+
+class ExportFormat(str, Enum):
+    """
+    Formats supported by the item export endpoint.
+    """
+    NDJSON = "ndjson"
+    JSON = "json"
@@ -1,12 +1,37 @@
+import asyncio
+from collections import Counter
 from datetime import datetime
+import json
 import logging
-from typing import List
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
 
-from fastapi import APIRouter, Body, Depends, HTTPException
+from bson import ObjectId
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorCursor
+from pydantic import ValidationError
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 
+from src.utils.cache import CachedResponse, ResponseCache, get_cache
+from src.utils.changefeed import ChangeFeed, get_changefeed, sse_events
+from src.utils.counters import count_values, increment, read_counts
 from src.utils.common_models import MessageResponse, PyObjectId
-from src.api.item.models import Item, ItemNew, ItemUpdate
-from src.utils.database import get_db, MongoDB
+from src.utils.conditional import (
+    document_etag, http_date, if_match_filter, listing_etag, not_modified, not_modified_response
+)
+from src.api.item.models import (
+    ITEM_SORT_FIELDS, BulkItemResult, BulkResponse, ExportFormat, Item, ItemBulkUpdate, ItemNew, ItemPartial,
+    ItemStats, ItemUpdate
+)
+from src.utils.database import BatchLoader, get_db, get_loader, MongoDB, utcnow
+from src.utils.ingest import IngestBuffer, get_ingest_buffer
+from src.utils.pagination import cursor_values, decode_cursor, encode_cursor, keyset_filter, parse_sort
+from src.utils.search import SearchIndex, get_search_index
+from src.utils.serialization import document_to_json, documents_to_json
+from src.utils.settings import settings
 
 
 logger = logging.getLogger(__name__)
@@ -17,79 +42,752 @@ router = APIRouter(
 )
 
 
+def item_cache_key(id: ObjectId) -> str:
+    return f"item:{id}"
+
+
+# Fields of an item which can be requested with the `fields` query parameter
+PROJECTABLE_FIELDS = set(ItemPartial.model_fields) - {"id"}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[dict]:
+    """
+    Translate a comma separated `fields` query parameter into a MongoDB projection. Returns None
+    when all fields are requested. Raises a 422 error for unknown fields.
+    """
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - PROJECTABLE_FIELDS
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return {field: 1 for field in requested}
+
+
+def item_filter(
+    name: Optional[str] = Query(None, description="Only items with exactly this name"),
+    name_prefix: Optional[str] = Query(None, description="Only items whose name starts with this"),
+    type: Optional[str] = Query(None, description="Only items of this type"),
+    created_after: Optional[datetime] = Query(None, description="Only items created at or after this time"),
+    created_before: Optional[datetime] = Query(None, description="Only items created before this time"),
+    updated_after: Optional[datetime] = Query(None, description="Only items updated at or after this time"),
+    updated_before: Optional[datetime] = Query(None, description="Only items updated before this time"),
+) -> Dict[str, Any]:
+    """
+    Dependency translating the filter query parameters of the item listing into a MongoDB filter.
+    Only indexed fields can be filtered on. The name prefix is an anchored, case sensitive regular
+    expression, which MongoDB answers with a range scan of the name index.
+    """
+    conditions: Dict[str, Dict[str, Any]] = {}
+    if name is not None:
+        conditions.setdefault("name", {})["$eq"] = name
+    if name_prefix:
+        conditions.setdefault("name", {})["$regex"] = f"^{re.escape(name_prefix)}"
+    if type is not None:
+        conditions.setdefault("type", {})["$eq"] = type
+    for field, after, before in (
+        ("created_time", created_after, created_before),
+        ("updated_time", updated_after, updated_before),
+    ):
+        if after is not None:
+            conditions.setdefault(field, {})["$gte"] = after
+        if before is not None:
+            conditions.setdefault(field, {})["$lt"] = before
+    return conditions
+
+
 @router.get(
     "/",
-    response_description="List all items",
+    response_description="List items, one page at a time",
+    response_model=List[ItemPartial],
+    response_model_exclude_unset=True,
+)
+async def get_items(
+    request: Request,
+    response: Response,
+    limit: int = Query(settings.page_size_default, ge=1, le=settings.page_size_max),
+    cursor: Optional[str] = Query(None, description="The `X-Next-Cursor` of the previous page"),
+    sort: str = Query("_id", description="Field to sort on, prefix with `-` for descending order"),
+    fields: Optional[str] = Query(None, description="Comma separated list of fields to return"),
+    query: Dict[str, Any] = Depends(item_filter),
+    if_none_match: Optional[str] = Header(None),
+    db: MongoDB = Depends(get_db)
+) -> List[ItemPartial]:
+    """
+    List items using keyset pagination, optionally filtered and sorted on indexed fields. When more
+    items are available the cursor for the next page is returned in the `X-Next-Cursor` header and
+    as a `Link` header with `rel="next"`. Each page has a weak ETag, a matching `If-None-Match` gets
+    a 304 response without a body. Unfiltered listings have the estimated number of items, read
+    from the collection metadata, in the `X-Total-Count` header.
+    """
+    filtered = bool(query)
+    try:
+        sort_spec = parse_sort(sort, ITEM_SORT_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    projection = parse_fields(fields)
+    # The sort keys are needed for the cursor and updated_time for the ETag, read them even when
+    # they were not requested
+    hidden = set()
+    if projection is not None:
+        for field in ["updated_time", *(field for field, _ in sort_spec)]:
+            if field not in projection and field != "_id":
+                projection[field] = 1
+                hidden.add(field)
+
+    if cursor is not None:
+        try:
+            after = keyset_filter(sort_spec, decode_cursor(cursor, sort_spec, ITEM_SORT_FIELDS))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = {"$and": [query, after]} if query else after
+
+    # Fetch one extra document to find out whether there is a next page
+    result = await db["itemcollection"].find(query, projection).sort(sort_spec).limit(limit + 1).to_list(limit + 1)
+    headers = {}
+    if not filtered:
+        headers["X-Total-Count"] = str(await db["itemcollection"].estimated_document_count())
+    if len(result) > limit:
+        result = result[:limit]
+        next_cursor = encode_cursor(cursor_values(result[-1], sort_spec), sort_spec)
+        headers["X-Next-Cursor"] = next_cursor
+        params = {**request.query_params, "limit": limit, "cursor": next_cursor}
+        headers["Link"] = f'<?{urlencode(params)}>; rel="next"'
+
+    etag = listing_etag(result, str(limit), ",".join(sorted(projection or {})))
+    if not_modified(if_none_match, None, etag):
+        return not_modified_response(etag)
+    headers["ETag"] = etag
+
+    if hidden:
+        result = [{k: v for k, v in item.items() if k not in hidden} for item in result]
+    if settings.fast_serialization:
+        return Response(content=documents_to_json(result), media_type="application/json", headers=headers)
+    response.headers.update(headers)
+    return [ItemPartial(**item) for item in result]
+
+
+async def stream_documents(cursor: AsyncIOMotorCursor, format: ExportFormat) -> AsyncIterator[bytes]:
+    """
+    Encode documents from a cursor and yield them one batch at a time, so only a single batch is
+    held in memory. Each yield waits for the client to accept the previous chunk, which gives slow
+    clients backpressure all the way back to the database cursor.
+    """
+    batch: List[bytes] = []
+    # In a JSON array every batch after the first needs a leading comma
+    prefix = b"[" if format == ExportFormat.JSON else b""
+
+    def encode_batch() -> bytes:
+        if format == ExportFormat.NDJSON:
+            return b"".join(line + b"\n" for line in batch)
+        return prefix + b",".join(batch)
+
+    async for document in cursor:
+        batch.append(document_to_json(document))
+        if len(batch) >= settings.export_batch_size:
+            yield encode_batch()
+            batch = []
+            prefix = b","
+    if batch:
+        yield encode_batch()
+        prefix = b","
+    if format == ExportFormat.JSON:
+        yield b"]" if prefix == b"," else b"[]"
+
+
+@router.get(
+    "/export",
+    response_description="Stream every item as NDJSON or a JSON array",
+    response_class=StreamingResponse,
+)
+async def export_items(
+    format: ExportFormat = Query(ExportFormat.NDJSON),
+    query: Dict[str, Any] = Depends(item_filter),
+    db: MongoDB = Depends(get_db)
+) -> StreamingResponse:
+    """
+    Export the item collection in id order, optionally filtered with the same query parameters as
+    the item listing. The response is streamed, memory use does not depend on the size of the
+    collection.
+    """
+    cursor = db["itemcollection"].find(query).sort("_id", 1).batch_size(settings.export_batch_size)
+    media_type = "application/x-ndjson" if format == ExportFormat.NDJSON else "application/json"
+    return StreamingResponse(stream_documents(cursor, format), media_type=media_type)
+
+
+def bulk_request_body(model: Any) -> Dict[str, Any]:
+    """
+    OpenAPI description of a bulk request body, which can be a JSON array or NDJSON.
+    """
+    schema = model if isinstance(model, dict) else model.model_json_schema()
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": schema}},
+                "application/x-ndjson": {"schema": schema},
+            },
+        }
+    }
+
+
+async def read_bulk_body(request: Request) -> List[Any]:
+    """
+    Read the entries of a bulk request. A body sent as `application/x-ndjson` is parsed one line at
+    a time so a malformed line only fails that entry, which is returned as a `ValueError` in its
+    place. Anything else must be a JSON array.
+    """
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        entries: List[Any] = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                entries.append(ValueError("Invalid JSON"))
+        return entries
+    try:
+        entries = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Request body must be a JSON array or NDJSON")
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=422, detail="Request body must be a JSON array or NDJSON")
+    return entries
+
+
+def validate_entry(model: Any, index: int, entry: Any) -> Tuple[Any, Optional[BulkItemResult]]:
+    """
+    Validate one entry of a bulk request against a model, returning either the model or a 422
+    result describing why the entry is invalid.
+    """
+    if isinstance(entry, ValueError):
+        return None, BulkItemResult(index=index, status=422, detail=str(entry))
+    try:
+        return model.model_validate(entry), None
+    except ValidationError as e:
+        detail = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'body'}: {err['msg']}" for err in e.errors())
+        return None, BulkItemResult(index=index, status=422, detail=detail)
+
+
+def chunked(entries: List[Any], size: int) -> List[List[Any]]:
+    return [entries[i:i + size] for i in range(0, len(entries), size)]
+
+
+def write_errors(error: BulkWriteError) -> Dict[int, Tuple[int, str]]:
+    """
+    Map the index of each failed operation in a bulk write to a status code and message.
+    """
+    return {
+        e["index"]: (409 if e.get("code") == 11000 else 500, e.get("errmsg", "Write error"))
+        for e in error.details.get("writeErrors", [])
+    }
+
+
+@router.post(
+    "/bulk",
+    response_description="Create many items, returning a result for each",
+    response_model=BulkResponse,
+    openapi_extra=bulk_request_body(ItemNew),
+)
+async def create_items(
+    request: Request,
+    db: MongoDB = Depends(get_db),
+    search: SearchIndex = Depends(get_search_index)
+) -> BulkResponse:
+    """
+    Create items from a JSON array or NDJSON body. Valid entries are inserted with unordered
+    `insert_many` calls of `BULK_CHUNK_SIZE` documents, so an invalid or failing entry does not
+    stop the others from being created.
+    """
+    entries = await read_bulk_body(request)
+    results: List[Optional[BulkItemResult]] = [None] * len(entries)
+    now = utcnow()
+
+    documents: List[Tuple[int, Dict[str, Any]]] = []
+    for index, entry in enumerate(entries):
+        item_new, results[index] = validate_entry(ItemNew, index, entry)
+        if item_new is not None:
+            document = {"_id": ObjectId(), **item_new.model_dump(by_alias=True), "created_time": now, "updated_time": now}
+            documents.append((index, document))
+
+    for chunk in chunked(documents, settings.bulk_chunk_size):
+        failed: Dict[int, Tuple[int, str]] = {}
+        try:
+            await db["itemcollection"].insert_many([document for _, document in chunk], ordered=False)
+        except BulkWriteError as e:
+            failed = write_errors(e)
+        for position, (index, document) in enumerate(chunk):
+            if position in failed:
+                status, detail = failed[position]
+                results[index] = BulkItemResult(index=index, status=status, detail=detail)
+            else:
+                results[index] = BulkItemResult(index=index, status=201, id=str(document["_id"]))
+        inserted = [document for position, (_, document) in enumerate(chunk) if position not in failed]
+        await increment(db, "itemstats", count_values(inserted, "type"))
+        search.add(*inserted)
+
+    return BulkResponse(results=results)
+
+
+@router.patch(
+    "/bulk",
+    response_description="Update many items, returning a result for each",
+    response_model=BulkResponse,
+    openapi_extra=bulk_request_body(ItemBulkUpdate),
+)
+async def update_items(
+    request: Request,
+    db: MongoDB = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+    search: SearchIndex = Depends(get_search_index)
+) -> BulkResponse:
+    """
+    Update individual fields of many items from a JSON array or NDJSON body, each entry holding the
+    id of the item and the fields to change. Updates are sent with unordered `bulk_write` calls.
+    """
+    entries = await read_bulk_body(request)
+    results: List[Optional[BulkItemResult]] = [None] * len(entries)
+    now = utcnow()
+
+    updates: List[Tuple[int, ObjectId, Dict[str, Any]]] = []
+    for index, entry in enumerate(entries):
+        item_update, results[index] = validate_entry(ItemBulkUpdate, index, entry)
+        if item_update is None:
+            continue
+        if not ObjectId.is_valid(item_update.id):
+            results[index] = BulkItemResult(index=index, status=422, detail=f"Invalid id {item_update.id}")
+            continue
+        fields = item_update.model_dump(exclude={"id"}, exclude_none=True)
+        updates.append((index, ObjectId(item_update.id), {**fields, "updated_time": now}))
+
+    for chunk in chunked(updates, settings.bulk_chunk_size):
+        # Look up which ids exist first, bulk_write only reports how many documents matched. The
+        # current types are needed to move changed items between the counts by type.
+        existing = {
+            document["_id"]: document.get("type")
+            async for document in db["itemcollection"].find({"_id": {"$in": [_id for _, _id, _ in chunk]}}, {"type": 1})
+        }
+        found = [(index, _id, fields) for index, _id, fields in chunk if _id in existing]
+        for index, _id, _ in chunk:
+            if _id not in existing:
+                results[index] = BulkItemResult(index=index, status=404, id=str(_id), detail=f"Item {_id} not found")
+
+        failed: Dict[int, Tuple[int, str]] = {}
+        if found:
+            try:
+                await db["itemcollection"].bulk_write(
+                    [UpdateOne({"_id": _id}, {"$set": fields}) for _, _id, fields in found],
+                    ordered=False
+                )
+            except BulkWriteError as e:
+                failed = write_errors(e)
+            await cache.delete(*(item_cache_key(_id) for _, _id, _ in found))
+        type_changes: Counter = Counter()
+        for position, (index, _id, fields) in enumerate(found):
+            if position in failed:
+                status, detail = failed[position]
+                results[index] = BulkItemResult(index=index, status=status, id=str(_id), detail=detail)
+                continue
+            results[index] = BulkItemResult(index=index, status=200, id=str(_id))
+            search.add({"_id": _id, **fields})
+            if "type" in fields and fields["type"] != existing[_id]:
+                type_changes[existing[_id]] -= 1
+                type_changes[fields["type"]] += 1
+                existing[_id] = fields["type"]
+        await increment(db, "itemstats", type_changes)
+
+    return BulkResponse(results=results)
+
+
+@router.delete(
+    "/bulk",
+    response_description="Delete many items, returning a result for each",
+    response_model=BulkResponse,
+    openapi_extra=bulk_request_body({"type": "string"}),
+)
+async def delete_items(
+    request: Request,
+    db: MongoDB = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+    search: SearchIndex = Depends(get_search_index)
+) -> BulkResponse:
+    """
+    Delete the items whose ids are given as a JSON array or NDJSON body.
+    """
+    entries = await read_bulk_body(request)
+    results: List[Optional[BulkItemResult]] = [None] * len(entries)
+
+    ids: List[Tuple[int, ObjectId]] = []
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str) and ObjectId.is_valid(entry):
+            ids.append((index, ObjectId(entry)))
+        else:
+            detail = str(entry) if isinstance(entry, ValueError) else f"Invalid id {entry}"
+            results[index] = BulkItemResult(index=index, status=422, detail=detail)
+
+    for chunk in chunked(ids, settings.bulk_chunk_size):
+        chunk_ids = [_id for _, _id in chunk]
+        documents = await db["itemcollection"].find({"_id": {"$in": chunk_ids}}, {"type": 1}).to_list(None)
+        existing = {document["_id"] for document in documents}
+        if existing:
+            await db["itemcollection"].delete_many({"_id": {"$in": list(existing)}})
+            await cache.delete(*(item_cache_key(_id) for _id in existing))
+            await increment(db, "itemstats", count_values(documents, "type", -1))
+            search.remove(*existing)
+        for index, _id in chunk:
+            if _id in existing:
+                results[index] = BulkItemResult(index=index, status=200, id=str(_id))
+                # Repeated ids are only deleted once
+                existing.discard(_id)
+            else:
+                results[index] = BulkItemResult(index=index, status=404, id=str(_id), detail=f"Item {_id} not found")
+
+    return BulkResponse(results=results)
+
+
+def item_headers(id: ObjectId, updated_time: datetime) -> Dict[str, str]:
+    """
+    Validator headers for a single item.
+    """
+    return {"ETag": document_etag(id, updated_time), "Last-Modified": http_date(updated_time)}
+
+
+async def check_precondition(db: MongoDB, id: ObjectId) -> None:
+    """
+    Called when a conditional write matched nothing, raises a 404 error if the item does not exist
+    or a 412 error if it exists but has changed since the client read it.
+    """
+    if await db["itemcollection"].find_one({"_id": id}, {"_id": 1}) is None:
+        raise HTTPException(status_code=404, detail=f"Item {id} not found")
+    raise HTTPException(status_code=412, detail=f"Item {id} has been modified")
+
+
+@router.get(
+    "/search",
+    response_description="Items matching a search, best matches first",
     response_model=List[Item],
 )
-async def get_items(db: MongoDB = Depends(get_db)) -> List[Item]:
-    result = await db["itemcollection"].find().to_list(100)
-    return [Item(**item) for item in result]
+async def search_items(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, description="Words to look for in the name and type of the items"),
+    limit: int = Query(settings.page_size_default, ge=1, le=settings.page_size_max),
+    offset: int = Query(0, ge=0, description="The number of results to skip"),
+    db: MongoDB = Depends(get_db),
+    search: SearchIndex = Depends(get_search_index)
+) -> List[Item]:
+    """
+    Search the names and types of the items, matches on the name ranking higher. Every word of `q`
+    has to match. With the `TEXT` search backend MongoDB's text index is used, which matches whole
+    words and their stems. With the `MEMORY` backend, or when the database has no text search, an
+    n-gram index held in memory is used, which also matches the start or part of a word. When more
+    results are available a `Link` header with `rel="next"` points at the next page.
+    """
+    result = None
+    if not search.use_memory:
+        try:
+            result = await db["itemcollection"].find(
+                {"$text": {"$search": q}}, {"score": {"$meta": "textScore"}}
+            ).sort([("score", {"$meta": "textScore"}), ("_id", 1)]).skip(offset).limit(limit + 1).to_list(limit + 1)
+        except (NotImplementedError, OperationFailure) as e:
+            # Code 27 is a missing text index, the mock database used by the tests has no $text
+            if isinstance(e, OperationFailure) and e.code != 27:
+                raise
+            logger.warning("Text search not available, using the in-memory search index: %s", e)
+            search.use_memory = True
+    if result is None:
+        await search.build()
+        ids = [id for id, _ in search.search(q, limit + 1, offset)]
+        documents = {
+            document["_id"]: document
+            for document in await db["itemcollection"].find({"_id": {"$in": ids}}).to_list(None)
+        }
+        result = [documents[id] for id in ids if id in documents]
+
+    headers = {}
+    if len(result) > limit:
+        result = result[:limit]
+        params = {**request.query_params, "limit": limit, "offset": offset + limit}
+        headers["Link"] = f'<?{urlencode(params)}>; rel="next"'
+    for document in result:
+        document.pop("score", None)
+    if settings.fast_serialization:
+        return Response(content=documents_to_json(result), media_type="application/json", headers=headers)
+    response.headers.update(headers)
+    return [Item(**document) for document in result]
+
+
+@router.get(
+    "/stats",
+    response_description="The number of items, in total and by type",
+    response_model=ItemStats,
+)
+async def get_item_stats(db: MongoDB = Depends(get_db)) -> ItemStats:
+    """
+    Get the number of items in total and of each type. The counts are kept up to date by every
+    write with `$inc` on the `itemstats` collection and recounted periodically, so reading them does
+    not scan the items.
+    """
+    counts = await read_counts(db, "itemstats")
+    return ItemStats(total=sum(counts.values()), types=counts)
+
+
+@router.get(
+    "/stream",
+    response_description="A Server-Sent Event for each change to the items",
+    response_class=StreamingResponse,
+)
+async def stream_items(
+    after: Optional[str] = Query(None, description="The id of the last event received, to resume after it"),
+    last_event_id: Optional[str] = Header(None),
+    feed: ChangeFeed = Depends(get_changefeed)
+) -> StreamingResponse:
+    """
+    Stream changes to the items as Server-Sent Events, replacing polling of the listing. Each event
+    has the operation (`insert`, `update`, `replace` or `delete`) as its type and the item, or only
+    its id when deleted, as its data. Clients resume after an event by sending its id in the
+    `Last-Event-ID` header, which browsers do when reconnecting, or the `after` parameter. A `reset`
+    event means the missed events are no longer known and the items should be read again, and a
+    `dropped` event ends the stream of a client which fell too far behind.
+    """
+    subscription = feed.subscribe(last_event_id or after)
+    return StreamingResponse(
+        sse_events(feed, subscription, settings.changefeed_keepalive),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get(
+    "/batch",
+    response_description="Get several items by id",
+    response_model=List[Item],
+)
+async def get_items_by_id(
+    ids: str = Query(..., description="Comma separated list of item ids"),
+    loader: BatchLoader = Depends(get_loader)
+) -> List[Item]:
+    """
+    Get several items in one request, in the order requested. Ids which do not exist are left out
+    of the response.
+    """
+    try:
+        object_ids = [PyObjectId.validate(id.strip(), None) for id in ids.split(",") if id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid item id")
+    if len(object_ids) > settings.page_size_max:
+        raise HTTPException(status_code=422, detail=f"At most {settings.page_size_max} ids can be requested")
+    result = [document for document in await loader.load_many("itemcollection", object_ids) if document is not None]
+    if settings.fast_serialization:
+        return Response(content=documents_to_json(result), media_type="application/json")
+    return [Item(**document) for document in result]
 
 
 @router.get(
     "/{id}",
     response_description="View single item",
     response_model=Item,
-    responses={404: {"description": "Item not found", "model": MessageResponse}}
+    responses={
+        304: {"description": "Item not modified"},
+        404: {"description": "Item not found", "model": MessageResponse},
+    }
 )
-async def get_item(id: PyObjectId, db: MongoDB = Depends(get_db)) -> Item:
-    logger.debug("Getting item...")
-    result = await db["itemcollection"].find_one({"_id": id})
-    if result is None:
-        raise HTTPException(status_code=404, detail=f"Item {id} not found")
-    return Item(**result)
+async def get_item(
+    id: PyObjectId,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    loader: BatchLoader = Depends(get_loader),
+    cache: ResponseCache = Depends(get_cache)
+) -> Item:
+    """
+    Get a single item. Serialised items are kept in the response cache, a cache hit is returned
+    without querying the database, and lookups of concurrent requests are combined into one query.
+    The `ETag` and `Last-Modified` headers can be sent back in `If-None-Match` and
+    `If-Modified-Since` to get a 304 response when the item has not changed.
+    """
+    logger.debug("Getting item %s", id)
+    # Taken before reading, so an item changed while it is read is not cached
+    generation = cache.generation(item_cache_key(id))
+    cached = await cache.get(item_cache_key(id))
+    if cached is None:
+        result = await loader.load("itemcollection", id)
+        if result is None:
+            raise HTTPException(status_code=404, detail=f"Item {id} not found")
+        if settings.fast_serialization:
+            body = document_to_json(result)
+        else:
+            body = Item(**result).model_dump_json().encode()
+        cached = CachedResponse(body=body, headers=item_headers(id, result["updated_time"]))
+        await cache.set(item_cache_key(id), cached, generation)
+    if not_modified(if_none_match, if_modified_since, cached.headers["ETag"], cached.headers["Last-Modified"]):
+        return not_modified_response(cached.headers["ETag"], cached.headers["Last-Modified"])
+    return Response(content=cached.body, media_type="application/json", headers=cached.headers)
+
+
+def prefers_minimal(prefer: Optional[str]) -> bool:
+    """
+    Check whether a `Prefer` request header (RFC 7240) asks for `return=minimal`.
+    """
+    if not prefer:
+        return False
+    return any(
+        preference.split(";")[0].strip().replace(" ", "") == "return=minimal"
+        for preference in prefer.split(",")
+    )
+
+
+def minimal_response(request: Request, id: ObjectId, updated_time: datetime) -> Response:
+    """
+    An empty response for a write made with `Prefer: return=minimal`, pointing at the item.
+    """
+    return Response(
+        status_code=204,
+        headers={
+            "Location": str(request.url_for("get_item", id=str(id))),
+            "Preference-Applied": "return=minimal",
+            **item_headers(id, updated_time),
+        },
+    )
 
 
 @router.post(
     "/",
     response_description="Create a new item and return it",
+    responses={
+        202: {"description": "Item accepted and queued to be inserted, when `INGEST_ASYNC` is enabled"},
+        204: {"description": "Item created, `Prefer: return=minimal` was requested"},
+        503: {"description": "The ingest buffer is full", "model": MessageResponse},
+    },
     response_model=Item
 )
-async def create_item(item: ItemNew = Body(...), db: MongoDB = Depends(get_db)) -> Item:
-    item_new = item.model_dump(by_alias=True)
-    item_new.update({
-        "created_time": datetime.utcnow(),
-        "updated_time": datetime.utcnow()
-    })
+async def create_item(
+    request: Request,
+    response: Response,
+    item: ItemNew = Body(...),
+    prefer: Optional[str] = Header(None),
+    db: MongoDB = Depends(get_db),
+    search: SearchIndex = Depends(get_search_index),
+    ingest: Optional[IngestBuffer] = Depends(get_ingest_buffer)
+) -> Item:
+    """
+    Create a new item. The response is built from the inserted document, it is not read back from
+    the database. Send `Prefer: return=minimal` to get an empty 204 response with a `Location`
+    header instead.
+
+    With `INGEST_ASYNC` enabled the item is queued and inserted in a batch with others shortly
+    after, and the response has status 202, or is empty with `Prefer: return=minimal`. The item may
+    not be readable straight away. A 503 response means the queue is full and the request can be
+    retried after the `Retry-After` seconds.
+    """
+    now = utcnow()
+    if ingest is not None:
+        item_new = {"_id": ObjectId(), **item.model_dump(by_alias=True), "created_time": now, "updated_time": now}
+        try:
+            await ingest.put(item_new, settings.ingest_wait_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Ingest buffer full", headers={"Retry-After": "1"})
+        headers = {"Location": str(request.url_for("get_item", id=str(item_new["_id"])))}
+        if prefers_minimal(prefer):
+            return Response(status_code=202, headers={**headers, "Preference-Applied": "return=minimal"})
+        response.status_code = 202
+        response.headers.update(headers)
+        return Item(**item_new)
+
+    item_new = {**item.model_dump(by_alias=True), "created_time": now, "updated_time": now}
     result = await db["itemcollection"].insert_one(item_new)
-    created_item = await db["itemcollection"].find_one({"_id": result.inserted_id})
-    return Item(**created_item)
+    await increment(db, "itemstats", {item_new["type"]: 1})
+    search.add(item_new)
+    if prefers_minimal(prefer):
+        return minimal_response(request, result.inserted_id, now)
+    response.headers.update(item_headers(result.inserted_id, now))
+    return Item(**item_new)
 
 
 @router.put(
     "/{id}",
     response_description="Update an existing item and return it",
-    responses={404: {"description": "Item not found", "model": MessageResponse}},
+    responses={
+        204: {"description": "Item updated, `Prefer: return=minimal` was requested"},
+        404: {"description": "Item not found", "model": MessageResponse},
+        412: {"description": "Item changed since it was read, `If-Match` failed", "model": MessageResponse},
+    },
     response_model=Item
 )
-async def update_item(id: PyObjectId, item: ItemUpdate = Body(...), db: MongoDB = Depends(get_db)) -> Item:
+async def update_item(
+    request: Request,
+    response: Response,
+    id: PyObjectId,
+    item: ItemUpdate = Body(...),
+    prefer: Optional[str] = Header(None),
+    if_match: Optional[str] = Header(None),
+    db: MongoDB = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+    search: SearchIndex = Depends(get_search_index)
+) -> Item:
     """
-    Update individual fields of an existing item record.
+    Update individual fields of an existing item record. The updated item is built from the
+    previous version returned by the same `find_one_and_update` call that applies the update. Send
+    `Prefer: return=minimal` to get an empty 204 response instead. Send the item's `ETag` in
+    `If-Match` to only update the item if it has not changed since it was read.
     """
     item_update = item.model_dump(exclude_none=True)
-    item_update.update({"updated_time": datetime.utcnow()})
+    now = utcnow()
+    item_update.update({"updated_time": now})
 
-    result = await db["itemcollection"].update_one(
-        {"_id": id},
-        {"$set": item_update}
+    minimal = prefers_minimal(prefer)
+    # The previous type is needed to move the item between the counts by type
+    previous_item = await db["itemcollection"].find_one_and_update(
+        {"_id": id, **if_match_filter(if_match, id)},
+        {"$set": item_update},
+        projection={"_id": 1, "type": 1} if minimal else None,
+        return_document=ReturnDocument.BEFORE
     )
 
-    if result.matched_count == 0:
+    if previous_item is None:
+        if if_match:
+            await check_precondition(db, id)
         raise HTTPException(status_code=404, detail=f"Item {id} not found")
+    await cache.delete(item_cache_key(id))
+    if "type" in item_update and item_update["type"] != previous_item.get("type"):
+        await increment(db, "itemstats", {previous_item.get("type"): -1, item_update["type"]: 1})
+    search.add({"_id": id, **item_update})
 
-    updated_item = await db["itemcollection"].find_one({"_id": id})
-    return Item(**updated_item)
+    if minimal:
+        return minimal_response(request, id, now)
+    response.headers.update(item_headers(id, now))
+    return Item(**{**previous_item, **item_update})
 
 
 @router.delete(
     "/{id}",
     response_description="Delete an existing item",
-    responses={404: {"description": "Item not found", "model": MessageResponse}},
+    responses={
+        404: {"description": "Item not found", "model": MessageResponse},
+        412: {"description": "Item changed since it was read, `If-Match` failed", "model": MessageResponse},
+    },
     response_model=MessageResponse
 )
-async def delete_item(id: PyObjectId, db: MongoDB = Depends(get_db)) -> MessageResponse:
-    result = await db["itemcollection"].delete_one({"_id": id})
-    if result.deleted_count != 1:
+async def delete_item(
+    id: PyObjectId,
+    if_match: Optional[str] = Header(None),
+    db: MongoDB = Depends(get_db),
+    cache: ResponseCache = Depends(get_cache),
+    search: SearchIndex = Depends(get_search_index)
+) -> MessageResponse:
+    """
+    Delete an item. Send the item's `ETag` in `If-Match` to only delete the item if it has not
+    changed since it was read.
+    """
+    deleted_item = await db["itemcollection"].find_one_and_delete(
+        {"_id": id, **if_match_filter(if_match, id)}, projection={"type": 1}
+    )
+    if deleted_item is None:
+        if if_match:
+            await check_precondition(db, id)
         raise HTTPException(status_code=404, detail=f"Item {id} not found")
+    await cache.delete(item_cache_key(id))
+    await increment(db, "itemstats", {deleted_item.get("type"): -1})
+    search.remove(id)
     return MessageResponse(detail=f"Item {id} deleted successfully")
@@ -0,0 +1,137 @@
+import logging
+import time
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+
+from src.utils.cache import ResponseCache, get_cache
+from src.utils.db_metrics import command_metrics, pool_metrics, update_pool_gauges
+from src.utils.metrics import REGISTRY
+from src.utils.settings import Mode, settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    tags=["System"],
+)
+
+
+def check_metrics_enabled() -> None:
+    """
+    Dependency hiding the statistics endpoints, which reveal internal details such as the database
+    hosts, unless METRICS_ENABLED is set.
+    """
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get(
+    "/cache/stats",
+    response_description="Hit, miss and eviction counters of the response cache",
+    dependencies=[Depends(check_metrics_enabled)],
+)
+async def get_cache_stats(cache: ResponseCache = Depends(get_cache)) -> Dict[str, Any]:
+    return cache.info()
+
+
+@router.get(
+    "/database/stats",
+    response_description="Connection pool and command statistics of this worker's database client",
+    dependencies=[Depends(check_metrics_enabled)],
+)
+async def get_database_stats() -> Dict[str, Any]:
+    return {"pools": pool_metrics.snapshot(), "commands": command_metrics.snapshot()}
+
+
+@router.get(
+    "/health/live",
+    response_description="Whether this worker is running",
+)
+async def get_liveness() -> Dict[str, str]:
+    """
+    Liveness probe. Answers as long as the worker is serving requests, whatever the state of the
+    database, so an unreachable database does not get the worker restarted.
+    """
+    return {"status": "ok"}
+
+
+@router.get(
+    "/health/ready",
+    response_description="Whether this worker can serve requests",
+    responses={503: {"description": "The database is not available"}},
+)
+async def get_readiness(request: Request) -> Dict[str, Any]:
+    """
+    Readiness probe. Reports the result of the connection manager's last ping, which runs in the
+    background, so probes never wait for or add load to the database. Answers 503 with a
+    `Retry-After` header while the database is not available.
+    """
+    connection = getattr(request.app.state, "connection", None)
+    if connection is None:
+        # No lifespan, as in the tests, the database is whatever was put in app.state.db
+        available = request.app.state.db is not None
+        database: Dict[str, Any] = {"available": available}
+        retry_after = 1
+    else:
+        # The database is only in app.state.db once the worker's setup has finished
+        available = connection.available and request.app.state.db is not None
+        checked_at = connection.checked_at
+        database = {
+            "available": available,
+            "failures": connection.failures,
+            "last_check_age": None if checked_at is None else round(time.monotonic() - checked_at, 3),
+            "error": connection.last_error,
+        }
+        retry_after = connection.retry_after()
+    body = {"status": "ready" if available else "unavailable", "database": database}
+    if not available:
+        return JSONResponse(body, status_code=503, headers={"Retry-After": str(retry_after)})
+    return body
+
+
+@router.get(
+    "/metrics",
+    response_description="Metrics of this worker in the Prometheus text format",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(check_metrics_enabled)],
+)
+async def get_metrics() -> PlainTextResponse:
+    """
+    Request counts, latency and response size histograms by route template and status, requests in
+    flight, and MongoDB command latency and pool sizes. Only available when METRICS_ENABLED is set.
+    """
+    update_pool_gauges()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def check_profiles_available() -> None:
+    """
+    Dependency hiding the profile endpoints unless profiling is enabled in DEV mode.
+    """
+    if settings.mode != Mode.DEV or not settings.profiling_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get(
+    "/profiles",
+    response_description="Names of the stored request profiles, newest first",
+    dependencies=[Depends(check_profiles_available)],
+)
+async def get_profiles() -> List[str]:
+    from src.utils.profiling import list_profiles
+    return list_profiles(settings.profiling_dir)
+
+
+@router.get(
+    "/profiles/{name}",
+    response_description="Download a request profile in the cProfile format",
+    response_class=FileResponse,
+    dependencies=[Depends(check_profiles_available)],
+)
+async def get_profile(name: str) -> FileResponse:
+    from src.utils.profiling import profile_path
+    path = profile_path(settings.profiling_dir, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {name} not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
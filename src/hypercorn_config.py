@@ -0,0 +1,52 @@
+"""
+Hypercorn configuration for production, built from the settings. Used by `scripts/run_live.sh` and
+the Docker image:
+
+    hypercorn --config python:src.hypercorn_config src.main:app
+
+Each worker is a separate process which imports the app and runs its `lifespan`, so every worker
+has its own Motor client, connection pool, response cache and metrics. `scripts/run_live.sh` and
+the Docker image turn the response cache off unless `CACHE_BACKEND` is set, as the memory caches of
+several workers would go stale.
+"""
+import importlib.util
+import math
+import os
+
+from src.utils.settings import settings
+
+
+def available_cpus() -> int:
+    """
+    The number of CPUs this process may use, taking into account the CPU affinity mask and a cgroup
+    v2 CPU quota, such as the one set by `docker run --cpus`.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
+
+
+bind = [settings.server_bind]
+workers = settings.server_workers or available_cpus()
+worker_class = "uvloop" if settings.server_uvloop and importlib.util.find_spec("uvloop") else "asyncio"
+keep_alive_timeout = settings.server_keep_alive_timeout
+backlog = settings.server_backlog
+graceful_timeout = settings.server_graceful_timeout
+
+# HTTP/2 is negotiated with ALPN over TLS, and accepted with prior knowledge over plain HTTP.
+# HTTP/3 needs TLS, and is advertised to clients with an Alt-Svc header.
+alpn_protocols = ["h2", "http/1.1"]
+if settings.server_certfile and settings.server_keyfile:  # pragma: no cover
+    certfile = settings.server_certfile
+    keyfile = settings.server_keyfile
+    if settings.server_quic_bind:
+        quic_bind = [settings.server_quic_bind]
@@ -5,12 +5,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from src.api import root
 from src.api.item import routes as item
 from src.api.product import routes as product
+from src.api.system import routes as system
+from src.utils.cache import create_cache
+from src.utils.compression import ENCODINGS, CompressionMiddleware
 from src.utils.database import lifespan
-from src.utils.log_config import LOGGING_CONFIG
+from src.utils.deadline import DeadlineMiddleware
+from src.utils.log_config import RequestContextMiddleware, configure_logging
+from src.utils.metrics import MetricsMiddleware
+from src.utils.openapi import use_openapi_file
+from src.utils.ratelimit import MemoryRateLimitStore, RateLimitMiddleware
 from src.utils.settings import settings, Mode
 
 # Configure logging
-logging.config.dictConfig(LOGGING_CONFIG)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Configure application mode
@@ -42,13 +49,76 @@ app = FastAPI(
 app.include_router(root.router)
 app.include_router(item.router)
 app.include_router(product.router)
+app.include_router(system.router)
+
+# Serve the OpenAPI schema generated at build time, if there is one, so it is not built by a worker
+# on the first request to the docs
+if settings.mode != Mode.TEST:  # pragma: no cover
+    use_openapi_file(app, settings.openapi_file)
+
+# Configure the response cache
+app.state.cache = create_cache()
+logger.info("Response cache backend set to: %s", settings.cache_backend.value)
+
+# Configure admission control, turning away requests beyond the limits before they do any work.
+# Added before CORS so rejected responses still have the CORS headers.
+if settings.rate_limit_enabled:
+    logger.info("Enabling rate limits, %s requests a second per client", settings.rate_limit_rate)
+    app.add_middleware(
+        RateLimitMiddleware,
+        store=MemoryRateLimitStore(),
+        rate=settings.rate_limit_rate,
+        burst=settings.rate_limit_burst,
+        max_in_flight={
+            "read": settings.rate_limit_max_reads,
+            "write": settings.rate_limit_max_writes,
+            "stream": settings.rate_limit_max_streams,
+        },
+        exempt=["/metrics", "/health"],
+        trusted_proxies=[proxy.strip() for proxy in settings.rate_limit_trusted_proxies.split(",") if proxy.strip()],
+    )
 
 # Configure CORS
-logger.info(f"Enabling CORS. Allowed origins set to: {settings.allow_origins}")
+logger.info("Enabling CORS. Allowed origins set to: %s", settings.allow_origins)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[settings.allow_origins],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor", "X-Total-Count", "Link", "ETag", "Last-Modified", "Location", "X-Request-ID", "Retry-After"
+    ],
 )
+
+# Configure response compression
+if settings.compression_enabled:
+    logger.info("Enabling response compression with: %s", ", ".join(ENCODINGS))
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        level=settings.compression_level,
+    )
+
+# Cancel requests past their deadline or whose client has gone. Added inside the request context so
+# the cancelled requests are logged with their id.
+app.add_middleware(DeadlineMiddleware, default=settings.request_timeout, budgets=settings.request_timeouts)
+
+# Give each request an id for the logs
+app.add_middleware(RequestContextMiddleware)
+
+# Configure profiling. The module is only imported when enabled, so there is no cost otherwise.
+if settings.profiling_enabled:  # pragma: no cover
+    from src.utils.profiling import ProfilingMiddleware
+    logger.info("Enabling request profiling, sample rate %s", settings.profiling_sample_rate)
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=settings.profiling_dir,
+        max_files=settings.profiling_max_files,
+        sample_rate=settings.profiling_sample_rate,
+    )
+
+# Configure metrics. Added last so it is the outermost middleware and times the whole request.
+if settings.metrics_enabled:
+    logger.info("Enabling request metrics at /metrics")
+    app.add_middleware(MetricsMiddleware)
@@ -0,0 +1,213 @@
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request
+
+from src.utils.settings import CacheBackend, settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResponse:
+    """
+    A response body that has already been serialised to JSON, along with any headers that should be
+    sent with it. Serving one skips both the database query and model validation.
+    """
+    body: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+
+class ResponseCache(ABC):
+    """
+    Interface for caches of serialised responses. Backends only have to implement the storage, the
+    hit/miss counters are kept here.
+
+    Each key has a generation, which `delete` moves on. A response read from the database is stored
+    with the generation taken before reading it, and is not stored if the key was invalidated
+    meanwhile, so a write landing during the read is not overwritten by the older response. The
+    generations of the last `max_generations` invalidated keys are kept, older keys share the
+    latest generation forgotten. Generations are kept by each worker.
+    """
+    def __init__(self, max_generations: int = 10000) -> None:
+        self.stats = CacheStats()
+        self.max_generations = max_generations
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+        self._generation = 0
+        self._forgotten = 0
+
+    def generation(self, key: str) -> int:
+        """
+        The generation of `key`, to pass to `set` when storing a response read after this call.
+        """
+        return self._generations.get(key, self._forgotten)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        value = await self._get(key)
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: CachedResponse, generation: Optional[int] = None) -> None:
+        """
+        Store a response, unless `generation` is given and the key has been invalidated since.
+        """
+        if generation is not None and generation != self.generation(key):
+            return
+        await self._set(key, value)
+
+    async def delete(self, *keys: str) -> None:
+        self.stats.invalidations += len(keys)
+        for key in keys:
+            self._generation += 1
+            self._generations.pop(key, None)
+            self._generations[key] = self._generation
+        while len(self._generations) > self.max_generations:
+            _, self._forgotten = self._generations.popitem(last=False)
+        await self._delete(*keys)
+
+    def info(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__, **asdict(self.stats)}
+
+    @abstractmethod
+    async def _get(self, key: str) -> Optional[CachedResponse]:
+        pass
+
+    @abstractmethod
+    async def _set(self, key: str, value: CachedResponse) -> None:
+        pass
+
+    @abstractmethod
+    async def _delete(self, *keys: str) -> None:
+        pass
+
+    @abstractmethod
+    async def clear(self) -> None:
+        pass
+
+
+class NullCache(ResponseCache):
+    """
+    A cache that stores nothing, used when caching is disabled.
+    """
+    async def _get(self, key: str) -> Optional[CachedResponse]:
+        return None
+
+    async def _set(self, key: str, value: CachedResponse) -> None:
+        pass
+
+    async def _delete(self, *keys: str) -> None:
+        pass
+
+    async def clear(self) -> None:
+        pass
+
+
+class MemoryCache(ResponseCache):
+    """
+    An in-process LRU cache holding at most `max_items` entries, each expiring `ttl` seconds after
+    it was stored. A `ttl` of 0 disables expiry. Every worker process has its own copy.
+    """
+    def __init__(self, max_items: int, ttl: float) -> None:
+        super().__init__()
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+
+    async def _get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if self.ttl and expires < time.monotonic():
+            del self._entries[key]
+            self.stats.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def _set(self, key: str, value: CachedResponse) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def _delete(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    def info(self) -> Dict[str, Any]:
+        return {**super().info(), "size": len(self._entries), "max_items": self.max_items}
+
+
+class SharedCache(ResponseCache):
+    """
+    A cache shared between workers, backed by a client with the redis asyncio `get`, `set` and
+    `delete` methods. Entries are stored as a JSON header line followed by the body, and eviction
+    is left to the server.
+    """
+    def __init__(self, client: Any, ttl: float, prefix: str = "cache:") -> None:
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def _get(self, key: str) -> Optional[CachedResponse]:
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        headers, _, body = raw.partition(b"\n")
+        return CachedResponse(body=body, headers=json.loads(headers))
+
+    async def _set(self, key: str, value: CachedResponse) -> None:
+        raw = json.dumps(value.headers).encode() + b"\n" + value.body
+        await self.client.set(self.prefix + key, raw, ex=int(self.ttl) or None)
+
+    async def _delete(self, *keys: str) -> None:
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def clear(self) -> None:
+        keys = [key async for key in self.client.scan_iter(match=self.prefix + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+def create_cache() -> ResponseCache:
+    """
+    Create the response cache selected by `settings.cache_backend`.
+    """
+    if settings.cache_backend == CacheBackend.MEMORY:
+        return MemoryCache(max_items=settings.cache_max_items, ttl=settings.cache_ttl)
+    if settings.cache_backend == CacheBackend.REDIS:  # pragma: no cover
+        # redis is an optional dependency, only needed when the shared backend is selected
+        from redis import asyncio as redis
+        return SharedCache(redis.from_url(settings.cache_url), ttl=settings.cache_ttl)
+    return NullCache()
+
+
+def get_cache(request: Request) -> ResponseCache:
+    """
+    Dependency returning the response cache from `app.state.cache`.
+    """
+    return request.app.state.cache
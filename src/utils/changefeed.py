@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+
+from fastapi import Depends, Request
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure, PyMongoError
+
+from src.utils.database import create_background_task, get_db
+from src.utils.serialization import document_to_json
+from src.utils.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# The change stream operations published to subscribers
+OPERATIONS = ("insert", "update", "replace", "delete")
+
+# Error codes of a server without change streams, such as a standalone server, and of a change
+# stream which cannot resume because the oplog no longer has the events after its resume token
+UNSUPPORTED_CODES = {40573}
+HISTORY_LOST_CODES = {280, 286}
+
+
+@dataclass
+class ChangeEvent:
+    """
+    A change to a document. `token` identifies the event so a client can resume after it, and
+    `document` is the document after the change, or None when it was deleted.
+    """
+    token: str
+    operation: str
+    id: Any
+    document: Optional[Dict[str, Any]]
+
+
+# Sent to a subscriber in place of an event when the events it missed are no longer known, so it
+# has to read the collection again, and when it is dropped for falling behind
+RESET = ChangeEvent(token="", operation="reset", id=None, document=None)
+DROPPED = ChangeEvent(token="", operation="dropped", id=None, document=None)
+
+
+class Subscription:
+    """
+    The events of a ChangeFeed for one client, held in a bounded queue. Iterating over a
+    subscription waits for events, and stops after a `dropped` event.
+    """
+    def __init__(self, queue_size: int) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.dropped = False
+
+    def __aiter__(self) -> AsyncIterator[ChangeEvent]:
+        return self
+
+    async def __anext__(self) -> ChangeEvent:
+        if self.dropped and self.queue.empty():
+            raise StopAsyncIteration
+        return await self.queue.get()
+
+
+class ChangeFeed:
+    """
+    Tails one MongoDB change stream on a collection and fans its events out to every subscriber, so
+    any number of clients watching for changes cost the database a single cursor. Each worker has
+    its own feed, started in `lifespan`.
+
+    Every subscriber has a queue of at most `queue_size` events. A subscriber which falls that far
+    behind is dropped rather than holding up the others, and can resubscribe from the last event it
+    received. The last `history_size` events are kept so subscribers can resume from a token.
+
+    If the change stream cannot resume because the oplog has moved past its resume token, it starts
+    again from the current changes and every subscriber is sent a `reset` event.
+
+    Change streams need a replica set. With a standalone server, or the mock database used by the
+    tests, the collection is polled every `poll_interval` seconds instead, comparing the
+    `updated_time` of each document. Polling reads every id in the collection, so it only runs while
+    there are subscribers and is only suited to development and tests.
+    """
+    def __init__(self, db: AsyncIOMotorDatabase, collection: str, queue_size: int = 100,
+                 history_size: int = 1000, poll_interval: float = 1.0) -> None:
+        self.db = db
+        self.collection = db[collection]
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.history: Deque[ChangeEvent] = deque(maxlen=history_size)
+        self.subscribers: Set[Subscription] = set()
+        self.polling = False
+        self.dropped = 0
+        self._task: Optional[asyncio.Task] = None
+        self._resume_after: Optional[Dict[str, Any]] = None
+        self._subscribed = asyncio.Event()
+        # Tokens of polled events are a sequence number prefixed by the start time of the feed, so
+        # tokens from another worker or an earlier run are not mistaken for this feed's
+        self._epoch = f"{time.time_ns():x}"
+        self._sequence = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = create_background_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for subscription in list(self.subscribers):
+            self._drop(subscription)
+
+    def subscribe(self, after: Optional[str] = None) -> Subscription:
+        """
+        Subscribe to the events after the event with token `after`, or to new events only. If the
+        token is not in the history, or more events followed it than the queue holds, the
+        subscription starts with a `reset` event.
+        """
+        subscription = Subscription(self.queue_size)
+        self.subscribers.add(subscription)
+        self._subscribed.set()
+        if after:
+            tokens = [event.token for event in self.history]
+            backlog = list(self.history)[tokens.index(after) + 1:] if after in tokens else None
+            if backlog is None or len(backlog) >= self.queue_size:
+                self._send(subscription, RESET)
+            else:
+                for event in backlog:
+                    self._send(subscription, event)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscribers.discard(subscription)
+        if not self.subscribers:
+            self._subscribed.clear()
+
+    def publish(self, event: ChangeEvent) -> None:
+        """
+        Add an event to the history and send it to every subscriber, without waiting.
+        """
+        self.history.append(event)
+        for subscription in list(self.subscribers):
+            self._send(subscription, event)
+
+    def _send(self, subscription: Subscription, event: ChangeEvent) -> None:
+        if subscription.dropped:
+            # Nothing may follow the dropped event, the subscriber resumes from its last event
+            return
+        try:
+            subscription.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._drop(subscription)
+
+    def _drop(self, subscription: Subscription) -> None:
+        # Make room to tell the subscriber it was dropped, it can resume from its last event
+        self.unsubscribe(subscription)
+        self.dropped += 1
+        subscription.dropped = True
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(DROPPED)
+
+    def _reset(self) -> None:
+        # The events since the last one published are not known, so nobody can resume from the
+        # history and every subscriber has to read the collection again
+        self.history.clear()
+        for subscription in list(self.subscribers):
+            self._send(subscription, RESET)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self.polling:
+                    await self._poll()
+                else:
+                    await self._watch()
+            except OperationFailure as e:
+                if e.code in UNSUPPORTED_CODES and not self.polling:
+                    logger.warning("Change streams not supported, polling for changes instead: %s", e)
+                    self.polling = True
+                elif e.code in HISTORY_LOST_CODES and not self.polling:
+                    logger.warning("Change stream history lost, watching from the current changes: %s", e)
+                    self._resume_after = None
+                    self._reset()
+                else:
+                    logger.error("Error reading changes, retrying: %s", e)
+                    await asyncio.sleep(self.poll_interval)
+            except PyMongoError as e:
+                logger.error("Error reading changes, retrying: %s", e)
+                await asyncio.sleep(self.poll_interval)
+
+    async def _watch(self) -> None:
+        pipeline = [{"$match": {"operationType": {"$in": list(OPERATIONS)}}}]
+        try:
+            stream = self.collection.watch(pipeline, full_document="updateLookup", resume_after=self._resume_after)
+        except (TypeError, NotImplementedError):
+            # The mock database used by the tests has no watch method
+            logger.warning("Change streams not supported, polling for changes instead")
+            self.polling = True
+            return
+        async with stream:
+            logger.info("Watching %s for changes", self.collection.name)
+            async for change in stream:
+                self._resume_after = change["_id"]
+                self.publish(ChangeEvent(
+                    token=change["_id"]["_data"],
+                    operation=change["operationType"],
+                    id=change["documentKey"]["_id"],
+                    document=change.get("fullDocument"),
+                ))
+
+    async def _snapshot(self) -> Dict[Any, Any]:
+        return {
+            document["_id"]: document.get("updated_time")
+            for document in await self.collection.find({}, {"updated_time": 1}).to_list(None)
+        }
+
+    def _token(self) -> str:
+        self._sequence += 1
+        return f"{self._epoch}-{self._sequence}"
+
+    async def _poll(self) -> None:
+        # Changes made while nobody was subscribed are not known, so the history is cleared and
+        # clients resuming from an earlier event are sent a reset
+        await self._subscribed.wait()
+        self.history.clear()
+        logger.info("Polling %s for changes every %ss", self.collection.name, self.poll_interval)
+        known = await self._snapshot()
+        while self.subscribers:
+            await asyncio.sleep(self.poll_interval)
+            current = await self._snapshot()
+            changed: List[Any] = [id for id, updated in current.items() if id not in known or known[id] != updated]
+            documents = {
+                document["_id"]: document
+                for document in await self.collection.find({"_id": {"$in": changed}}).to_list(None)
+            } if changed else {}
+            for id in changed:
+                operation = "insert" if id not in known else "update"
+                self.publish(ChangeEvent(self._token(), operation, id, documents.get(id)))
+            for id in known.keys() - current.keys():
+                self.publish(ChangeEvent(self._token(), "delete", id, None))
+            known = current
+
+
+def format_event(event: ChangeEvent) -> bytes:
+    """
+    Format an event as a Server-Sent Event, with the token as its id and the operation as its type.
+    The data is the document after the change, or only its id when it was deleted.
+    """
+    if event.document is not None:
+        data = document_to_json(event.document)
+    elif event.id is not None:
+        data = document_to_json({"_id": event.id})
+    else:
+        data = b"{}"
+    lines = [f"id: {event.token}".encode()] if event.token else []
+    lines += [f"event: {event.operation}".encode(), b"data: " + data]
+    return b"\n".join(lines) + b"\n\n"
+
+
+async def sse_events(feed: ChangeFeed, subscription: Subscription, keepalive: float) -> AsyncIterator[bytes]:
+    """
+    Stream the events of a subscription as Server-Sent Events, sending a comment when there have
+    been no events for `keepalive` seconds so idle connections are not closed by proxies. The
+    subscription is removed when the client disconnects.
+    """
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.__anext__(), keepalive)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            except StopAsyncIteration:
+                return
+            yield format_event(event)
+    finally:
+        feed.unsubscribe(subscription)
+
+
+async def get_changefeed(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)) -> ChangeFeed:
+    """
+    Dependency returning the item ChangeFeed of the current database, kept in `app.state.changefeed`.
+    The feed is started in `lifespan`, or here on first use when there is no lifespan.
+    """
+    feed = getattr(request.app.state, "changefeed", None)
+    if feed is None or feed.db is not db:
+        feed = request.app.state.changefeed = create_changefeed(db)
+        feed.start()
+    return feed
+
+
+def create_changefeed(db: AsyncIOMotorDatabase) -> ChangeFeed:
+    return ChangeFeed(
+        db,
+        "itemcollection",
+        queue_size=settings.changefeed_queue_size,
+        history_size=settings.changefeed_history_size,
+        poll_interval=settings.changefeed_poll_interval,
+    )
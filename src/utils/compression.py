@@ -0,0 +1,192 @@
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# brotli and zstandard are optional dependencies, each encoding is offered only when installed
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Content types worth compressing. Anything else, such as images, is sent as is.
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/xml", "application/javascript")
+
+
+class Compressor(ABC):
+    """
+    Incrementally compresses a response body. `compress` returns the compressed data for a chunk,
+    flushed so the client can decode everything sent so far, and `finish` ends the stream.
+    """
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def finish(self) -> bytes:
+        pass
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(min(max(level, 1), 9), zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor(Compressor):  # pragma: no cover
+    def __init__(self, level: int) -> None:
+        self._compressor = brotli.Compressor(quality=min(max(level, 0), 11))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor(Compressor):  # pragma: no cover
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=min(max(level, 1), 22)).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# The available encodings in order of preference, each with its compressor and default level. The
+# defaults favour speed, as the time to compress adds to the latency of every response.
+ENCODINGS: Dict[str, Tuple[Callable[[int], Compressor], int]] = {}
+if brotli is not None:  # pragma: no cover
+    ENCODINGS["br"] = (BrotliCompressor, 4)
+if zstandard is not None:  # pragma: no cover
+    ENCODINGS["zstd"] = (ZstdCompressor, 3)
+ENCODINGS["gzip"] = (GzipCompressor, 6)
+
+
+def select_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+    """
+    Pick the encoding to use from an `Accept-Encoding` header, such as `gzip, br;q=0.8`. The encoding
+    with the highest quality value wins, ties going to the first in `available`. Returns None if
+    no available encoding is acceptable.
+    """
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            qualities[name.strip()] = quality
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies with the best encoding the client accepts, of
+    brotli and zstd when installed, and gzip. Responses smaller than `minimum_size`, responses which
+    are already encoded, event streams and content types which do not compress well are sent as is.
+
+    Streaming responses are compressed chunk by chunk and each chunk is flushed, so the body is never
+    buffered and the client receives data as soon as the application sends it.
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000, level: Optional[int] = None) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""), list(ENCODINGS))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[Compressor] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                if not self._compressible_type(Headers(raw=message.get("headers", []))):
+                    # Sent straight away, an event stream must not wait for its first event
+                    await send(message)
+                    return
+                # Held back until the first body message shows whether the response is worth compressing
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            if start is not None:
+                response_start, start = start, None
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                headers = MutableHeaders(raw=response_start.setdefault("headers", []))
+                if not self._large_enough(headers, len(body), more_body):
+                    await send(response_start)
+                    await send(message)
+                    return
+
+                factory, default_level = ENCODINGS[encoding]
+                compressor = factory(self.level if self.level is not None else default_level)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                data = compressor.compress(body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    data += compressor.finish()
+                    headers["Content-Length"] = str(len(data))
+                await send(response_start)
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            if compressor is None:
+                await send(message)
+                return
+            data = compressor.compress(message.get("body", b""))
+            if not message.get("more_body", False):
+                data += compressor.finish()
+            await send({**message, "body": data})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _compressible_type(headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").lower()
+        return not content_type.startswith("text/event-stream") and content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _large_enough(self, headers: MutableHeaders, size: int, more_body: bool) -> bool:
+        if more_body:
+            # Streamed without a declared length, so the final size is not known in advance
+            length = headers.get("content-length")
+            return length is None or int(length) >= self.minimum_size
+        return size >= self.minimum_size
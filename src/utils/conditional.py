@@ -0,0 +1,103 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import Response
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _millis(time: datetime) -> int:
+    return (time - EPOCH) // timedelta(milliseconds=1)
+
+
+def document_etag(id: ObjectId, updated_time: datetime) -> str:
+    """
+    A strong ETag for a document, built from its id and the millisecond `updated_time`. It can be
+    parsed back with `parse_etag`, so an `If-Match` header can be turned into a query filter.
+    """
+    return f'"{id}-{_millis(updated_time):x}"'
+
+
+def parse_etag(etag: str) -> Optional[Tuple[ObjectId, datetime]]:
+    """
+    Return the id and `updated_time` encoded in an ETag made by `document_etag`, or None if the
+    ETag was not made by it.
+    """
+    id, _, millis = etag.strip().strip('"').partition("-")
+    try:
+        return ObjectId(id), EPOCH + timedelta(milliseconds=int(millis, 16))
+    except (InvalidId, TypeError, ValueError):
+        return None
+
+
+def listing_etag(documents: Iterable[dict], *parts: str) -> str:
+    """
+    A weak ETag for a page of a listing, built from the id and `updated_time` of every document on
+    the page along with anything else that changes the response body, such as the projection.
+    """
+    digest = hashlib.sha1("|".join(parts).encode())
+    for document in documents:
+        digest.update(f"{document['_id']}-{_millis(document['updated_time']):x};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def http_date(time: datetime) -> str:
+    return format_datetime(time.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def split_etags(header: str) -> List[str]:
+    return [etag.strip() for etag in header.split(",") if etag.strip()]
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of an ETag against an `If-None-Match` header, as RFC 9110 requires.
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in (candidate.removeprefix("W/") for candidate in split_etags(header))
+
+
+def not_modified(
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+    etag: str,
+    last_modified: Optional[str] = None
+) -> bool:
+    """
+    Evaluate the `If-None-Match` and `If-Modified-Since` request headers. `If-Modified-Since` is
+    ignored when `If-None-Match` is present.
+    """
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def not_modified_response(etag: str, last_modified: Optional[str] = None) -> Response:
+    headers = {"ETag": etag}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return Response(status_code=304, headers=headers)
+
+
+def if_match_filter(if_match: Optional[str], id: ObjectId) -> dict:
+    """
+    Translate an `If-Match` request header into an extra query filter on `updated_time`, so a
+    conditional write is applied atomically by the same query that makes it. A write with no
+    matching ETag gets a filter that matches nothing.
+    """
+    if not if_match or if_match.strip() == "*":
+        return {}
+    times = [parsed[1] for parsed in map(parse_etag, split_etags(if_match)) if parsed and parsed[0] == id]
+    return {"updated_time": {"$in": times}}
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import random
+from collections import Counter
+from typing import Any, Dict, Iterable
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+def count_values(documents: Iterable[Dict[str, Any]], field: str, sign: int = 1) -> Counter:
+    """
+    Count the values of `field` in `documents`, negated when `sign` is -1, as changes to pass to
+    `increment`.
+    """
+    changes: Counter = Counter()
+    for document in documents:
+        changes[document.get(field)] += sign
+    return changes
+
+
+async def increment(db: AsyncIOMotorDatabase, counters: str, changes: Dict[Any, int]) -> None:
+    """
+    Apply changes to the counters in the `counters` collection, one document per counter with the
+    counter name as its `_id`. Each change is an atomic `$inc`, so concurrent writers do not lose
+    updates. A write usually changes a single counter, the updates are sent concurrently otherwise.
+    """
+    await asyncio.gather(*(
+        db[counters].update_one({"_id": name}, {"$inc": {"count": change}}, upsert=True)
+        for name, change in changes.items() if change
+    ))
+
+
+async def read_counts(db: AsyncIOMotorDatabase, counters: str) -> Dict[Any, int]:
+    """
+    The counters in the `counters` collection, leaving out those which have dropped to 0. Reads one
+    document per counter.
+    """
+    return {
+        document["_id"]: document["count"]
+        async for document in db[counters].find({"count": {"$gt": 0}}).sort("_id")
+    }
+
+
+async def reconcile(db: AsyncIOMotorDatabase, source: str, counters: str, field: str) -> Dict[Any, int]:
+    """
+    Recount the documents in `source` by the value of `field` and overwrite the counters with the
+    result, correcting any drift, for example from writes which failed between updating the
+    collection and the counters. Counters incremented while the recount runs may be off until the
+    next reconciliation. This reads the whole collection, so it runs in the background.
+    """
+    counts = {
+        group["_id"]: group["count"]
+        async for group in db[source].aggregate([{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}])
+    }
+    await asyncio.gather(*(
+        db[counters].update_one({"_id": name}, {"$set": {"count": count}}, upsert=True)
+        for name, count in counts.items()
+    ))
+    await db[counters].delete_many({"_id": {"$nin": list(counts)}})
+    return counts
+
+
+async def reconcile_periodically(db: AsyncIOMotorDatabase, source: str, counters: str, field: str,
+                                 interval: float) -> None:
+    """
+    Reconcile the counters every `interval` seconds, the first time after a random part of the
+    interval. Every worker runs this, and the counters are kept up to date by the writes meanwhile,
+    so workers starting together spread their recounts over the interval rather than all reading the
+    whole collection at once. Errors are logged and the next reconciliation goes ahead as planned.
+    """
+    await asyncio.sleep(random.uniform(0, interval))
+    while True:
+        try:
+            counts = await reconcile(db, source, counters, field)
+            logger.info("Reconciled %s, %d counters", counters, len(counts))
+        except PyMongoError as e:
+            logger.error("Error reconciling %s: %s", counters, e)
+        await asyncio.sleep(interval)
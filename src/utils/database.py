@@ -1,34 +1,284 @@
+import asyncio
+import contextvars
 import logging
+import math
+import random
+import time
 from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
 
-from fastapi import FastAPI, HTTPException, Request
+import pymongo
+from fastapi import Depends, FastAPI, HTTPException, Request
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from pymongo.errors import ConnectionFailure, ConfigurationError, ServerSelectionTimeoutError, OperationFailure
+from pymongo import _csot
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError, ServerSelectionTimeoutError
 
+from src.utils.counters import reconcile_periodically
+from src.utils.db_metrics import command_metrics, pool_metrics
+from src.utils.indexes import ensure_indexes
 from src.utils.settings import settings
 
 logger = logging.getLogger(__name__)
 
 
+def create_background_task(coroutine: Any) -> asyncio.Task:
+    """
+    Start a task in an empty context rather than a copy of the current one, so a task outliving the
+    request which started it does not run under that request's `pymongo.timeout` deadline.
+    """
+    return contextvars.Context().run(asyncio.create_task, coroutine)
+
+
+def client_options() -> Dict[str, Any]:
+    """
+    Keyword arguments for `AsyncIOMotorClient` built from the settings, including the listeners
+    which collect connection pool and command metrics. Options left unset keep the driver defaults
+    or the values given in the connection string.
+    """
+    options = {
+        "maxPoolSize": settings.mongodb_max_pool_size,
+        "minPoolSize": settings.mongodb_min_pool_size,
+        "maxIdleTimeMS": settings.mongodb_max_idle_time_ms,
+        "waitQueueTimeoutMS": settings.mongodb_wait_queue_timeout_ms,
+        "serverSelectionTimeoutMS": settings.mongodb_server_selection_timeout_ms,
+        "connectTimeoutMS": settings.mongodb_connect_timeout_ms,
+        "socketTimeoutMS": settings.mongodb_socket_timeout_ms,
+        "compressors": settings.mongodb_compressors,
+        "readPreference": settings.mongodb_read_preference,
+    }
+    options = {key: value for key, value in options.items() if value is not None}
+    options["event_listeners"] = [pool_metrics, command_metrics]
+    return options
+
+
+async def ping(database: AsyncIOMotorDatabase, attempts: int, base_delay: float = 0.5, max_delay: float = 10.0,
+               timeout: Optional[float] = None) -> None:
+    """
+    Check the database is available, making up to `attempts` attempts which each give up after
+    `timeout` seconds. The delay between attempts doubles each time up to `max_delay` and is
+    randomised, so when every worker starts at once they spread their retries out instead of all
+    reconnecting together. The last error is re-raised.
+    """
+    for attempt in range(attempts):
+        try:
+            with pymongo.timeout(timeout):
+                await database.command("ping")
+            return
+        except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+            if attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning(
+                "Database ping failed, attempt %d of %d, retrying in %.2fs: %s", attempt + 1, attempts, delay, e
+            )
+            await asyncio.sleep(delay)
+
+
+class ConnectionManager:
+    """
+    Keeps track of whether the database is reachable and acts as a circuit breaker for requests.
+    A background task pings the database every `check_interval` seconds, giving up on each ping
+    after `check_timeout` seconds. After `failure_threshold` failed pings or requests in a row the
+    circuit opens: `available` is False, so requests fail straight away instead of each waiting for
+    the server selection timeout, and the database is pinged again after a jittered delay which
+    doubles up to `max_delay` seconds. The circuit closes on the first successful ping.
+
+    `on_connect` is awaited after the first successful ping, so a worker which started while the
+    database was down finishes its setup once it comes back. If it fails, it is tried again after
+    the next successful ping.
+    """
+    def __init__(self, db: AsyncIOMotorDatabase, on_connect: Optional[Callable[[], Awaitable[None]]] = None,
+                 check_interval: float = 5.0, check_timeout: float = 2.0, failure_threshold: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 30.0) -> None:
+        self.db = db
+        self.on_connect = on_connect
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.connected = False
+        self.available = False
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        # When the database was last pinged and when it will be pinged next, in monotonic time
+        self.checked_at: Optional[float] = None
+        self.next_check = time.monotonic()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self, attempts: int) -> bool:
+        """
+        Ping the database up to `attempts` times, as at startup, each ping giving up after
+        `check_timeout` seconds so startup is not held up for the server selection timeout. Returns
+        whether it answered.
+        """
+        self.checked_at = time.monotonic()
+        try:
+            await ping(self.db, attempts, timeout=self.check_timeout)
+        except PyMongoError as e:
+            self._failed(e)
+            return False
+        await self._succeeded()
+        return True
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def record_failure(self, error: Exception) -> None:
+        """
+        Count a request which failed to reach the database. Opening the circuit brings the next ping
+        forward.
+        """
+        if self._failed(error):
+            self._wake.set()
+
+    def record_success(self) -> None:
+        self.failures = 0
+
+    def retry_after(self) -> int:
+        """
+        Seconds until the database is pinged again, for the `Retry-After` header.
+        """
+        return max(1, math.ceil(self.next_check - time.monotonic()))
+
+    def _failed(self, error: Exception) -> bool:
+        # Returns whether this failure opened the circuit
+        self.failures += 1
+        self.last_error = str(error)
+        if self.available and self.failures >= self.failure_threshold:
+            self.available = False
+            logger.error("Database unavailable, failing requests until it answers: %s", error)
+            return True
+        return False
+
+    async def _succeeded(self) -> None:
+        if not self.available:
+            logger.info("Database available")
+        self.available = True
+        self.failures = 0
+        self.last_error = None
+        if not self.connected:
+            if self.on_connect is not None:
+                try:
+                    await self.on_connect()
+                except Exception as e:
+                    # Left unconnected, so the setup is tried again after the next ping
+                    logger.error("Error setting up the database connection, retrying: %s", e)
+                    self.last_error = str(e)
+                    return
+            self.connected = True
+
+    async def _run(self) -> None:
+        attempt = 0
+        while True:
+            if self.available:
+                attempt = 0
+                delay = self.check_interval
+            else:
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+            self.next_check = time.monotonic() + delay
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self.checked_at = time.monotonic()
+            try:
+                with pymongo.timeout(self.check_timeout):
+                    await self.db.command("ping")
+            except PyMongoError as e:
+                logger.warning("Database ping failed: %s", e)
+                self._failed(e)
+                continue
+            await self._succeeded()
+
+
+async def setup_database(app: FastAPI) -> None:
+    """
+    Prepare the app once the database is reachable: create the indexes, and start the change
+    feed, search index, ingest buffer and counter reconciliation. The database is only published in
+    `app.state.db` once this has finished, until then requests get a 503 response rather than
+    starting their own change feed and buffers.
+    """
+    db = app.state.connection.db
+    logger.info("Database connection successful")
+    if settings.create_indexes:
+        try:
+            await ensure_indexes(db)
+        except OperationFailure as e:
+            # Missing indexes make queries slower but do not stop the app from working
+            logger.error("Error creating indexes: %s", e)
+    # Imported here as the change feed, search and ingest modules depend on this one
+    from src.utils.changefeed import create_changefeed
+    from src.utils.ingest import create_ingest_buffer
+    from src.utils.search import create_search_index
+    app.state.changefeed = create_changefeed(db)
+    app.state.changefeed.start()
+    app.state.search_index = create_search_index(db, app.state.changefeed)
+    if app.state.search_index.use_memory:
+        # Build the index before serving requests, rather than in the first search
+        try:
+            await app.state.search_index.build()
+        except PyMongoError as e:
+            logger.error("Error building the search index, building it on first use: %s", e)
+    if settings.ingest_async:
+        app.state.ingest = create_ingest_buffer(db, app.state.search_index)
+        app.state.ingest.start()
+    app.state.reconciliation = asyncio.create_task(reconcile_periodically(
+        db, "itemcollection", "itemstats", "type", settings.stats_reconcile_interval
+    ))
+    app.state.db = db
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):  # pragma: no cover
     """
     Manages the lifecycle of the database connection stored in `app.state.db`. The connection is
-    established on app start and closed on app stop.
+    established on app start and closed on app stop. Each server worker process runs its own
+    lifespan, so each has its own client and connection pool. If the database cannot be reached at
+    startup the app starts anyway, answering 503 until the connection manager gets through.
     """
+    logger.info("Connecting to database...")
+    client = AsyncIOMotorClient(settings.mongodb_url, **client_options())
+    app.state.db = None
+    app.state.connection = ConnectionManager(
+        client.get_database(),
+        on_connect=lambda: setup_database(app),
+        check_interval=settings.mongodb_check_interval,
+        check_timeout=settings.mongodb_check_timeout,
+        failure_threshold=settings.mongodb_failure_threshold,
+        max_delay=settings.mongodb_max_retry_delay,
+    )
     try:
-        logger.info("Connecting to database...")
-        client = AsyncIOMotorClient(settings.mongodb_url)
-        # Check if the database is available
-        await client.get_database().command("ping")
-        app.state.db = client.get_database()
-        logger.info("Database connection successful")
-        yield
-    except (ConnectionFailure, ConfigurationError, ServerSelectionTimeoutError, OperationFailure) as e:
-        logger.error(f"Error connecting to database: {e}")
-        app.state.db = None
+        if not await app.state.connection.connect(settings.mongodb_connect_attempts):
+            logger.error("Error connecting to database, retrying in the background: %s",
+                         app.state.connection.last_error)
+        app.state.connection.start()
         yield
     finally:
+        await app.state.connection.stop()
+        if getattr(app.state, "reconciliation", None) is not None:
+            app.state.reconciliation.cancel()
+        if getattr(app.state, "ingest", None) is not None:
+            # Insert the queued items before the connection is closed
+            await app.state.ingest.stop(settings.server_graceful_timeout)
+        if getattr(app.state, "search_index", None) is not None:
+            await app.state.search_index.stop()
+        if getattr(app.state, "changefeed", None) is not None:
+            await app.state.changefeed.stop()
         client.close()
         logger.info("Database connection closed")
 
@@ -41,12 +291,152 @@ class MongoDB(AsyncIOMotorDatabase):
     pass
 
 
-def get_db(request: Request) -> MongoDB:
+async def get_db(request: Request) -> AsyncIterator[MongoDB]:
     """
-    Dependency returning the database connection from `app.state.db`. Raises a 500 error if the
-    connection is not established.
+    Dependency returning the database connection from `app.state.db`. Raises a 503 error with a
+    `Retry-After` header if the connection is not established or the circuit breaker is open.
+    Requests failing to reach the database are reported to the connection manager.
     """
-    if request.app.state.db is None:
+    connection: Optional[ConnectionManager] = getattr(request.app.state, "connection", None)
+    if request.app.state.db is None or (connection is not None and not connection.available):
         logging.error("Database Connection Error")
-        raise HTTPException(status_code=500, detail="Database Connection Error")
-    return request.app.state.db
+        retry_after = connection.retry_after() if connection is not None else 1
+        raise HTTPException(
+            status_code=503, detail="Database Connection Error", headers={"Retry-After": str(retry_after)}
+        )
+    try:
+        yield request.app.state.db
+    except ConnectionFailure as e:
+        # Timeouts from a request's own deadline say nothing about the database
+        if connection is not None and (isinstance(e, ServerSelectionTimeoutError) or not e.timeout):
+            connection.record_failure(e)
+        raise
+    if connection is not None:
+        connection.record_success()
+
+
+class BatchLoader:
+    """
+    Coalesces lookups of documents by `_id`. Lookups made within `window` seconds of each other, or
+    in the same event loop iteration when `window` is 0, are sent to MongoDB as a single `find` with
+    `$in`, and concurrent lookups of the same document share one result. The documents returned are
+    shared between callers and must not be modified.
+
+    The queries run outside the callers' contexts, under the latest `pymongo.timeout` deadline of
+    the callers in the batch, so a caller with a short deadline does not time the others out. A
+    lookup only joins a query already sent if that query's deadline is not earlier than its own.
+    """
+    def __init__(self, db: AsyncIOMotorDatabase, window: float = 0.0, max_batch_size: int = 1000) -> None:
+        self.db = db
+        self.window = window
+        self.max_batch_size = max_batch_size
+        # Lookups waiting to be sent, by collection and id
+        self._futures: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        # Lookups waiting for their batch to return, with the deadline of the batch
+        self._sent: Dict[Tuple[str, Hashable], Tuple[asyncio.Future, float]] = {}
+        # Ids waiting to be sent and the latest deadline of their callers, by collection
+        self._queued: Dict[str, List[Hashable]] = {}
+        self._deadlines: Dict[str, float] = {}
+        # The task which will send the queued ids of each collection once the window has passed
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.lookups = 0
+        self.batches = 0
+
+    async def load(self, collection: str, id: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        The document with `_id` equal to `id` in `collection`, or None if there is none.
+        """
+        return (await self.load_many(collection, [id]))[0]
+
+    async def load_many(self, collection: str, ids: List[Hashable]) -> List[Optional[Dict[str, Any]]]:
+        """
+        The documents with the given ids, in the same order, with None for those which do not exist.
+        """
+        futures = [self._future(collection, id) for id in ids]
+        # A caller which is cancelled must not cancel the lookups other callers are waiting for
+        return list(await asyncio.shield(asyncio.gather(*futures)))
+
+    def _future(self, collection: str, id: Hashable) -> asyncio.Future:
+        self.lookups += 1
+        # The caller's `pymongo.timeout` deadline, infinite when it has none
+        deadline = _csot.get_deadline()
+        future = self._futures.get((collection, id))
+        if future is not None:
+            self._deadlines[collection] = max(self._deadlines[collection], deadline)
+            return future
+        sent = self._sent.get((collection, id))
+        if sent is not None and sent[1] >= deadline:
+            return sent[0]
+        future = self._futures[(collection, id)] = asyncio.get_running_loop().create_future()
+        queued = self._queued.setdefault(collection, [])
+        queued.append(id)
+        self._deadlines[collection] = max(self._deadlines.get(collection, 0.0), deadline)
+        if len(queued) == 1:
+            self._timers[collection] = self._start(self._dispatch(collection))
+        if len(queued) >= self.max_batch_size:
+            # A full batch is sent straight away
+            self._timers.pop(collection).cancel()
+            self._start(self._fetch(collection, *self._take(collection)))
+        return future
+
+    def _start(self, coroutine: Any) -> asyncio.Task:
+        # Not in the caller's context, which holds its deadline
+        task = create_background_task(coroutine)
+        # Keep a reference to running tasks so they are not garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _take(self, collection: str) -> Tuple[Dict[Hashable, asyncio.Future], float]:
+        # Move the queued lookups of a collection to the sent lookups
+        deadline = self._deadlines.pop(collection)
+        futures = {id: self._futures.pop((collection, id)) for id in self._queued.pop(collection)}
+        for id, future in futures.items():
+            self._sent[(collection, id)] = (future, deadline)
+        return futures, deadline
+
+    async def _dispatch(self, collection: str) -> None:
+        await asyncio.sleep(self.window)
+        del self._timers[collection]
+        await self._fetch(collection, *self._take(collection))
+
+    async def _fetch(self, collection: str, futures: Dict[Hashable, asyncio.Future], deadline: float) -> None:
+        self.batches += 1
+        # A deadline which has passed still needs a positive timeout, 0 means no timeout
+        timeout = None if deadline == math.inf else max(deadline - time.monotonic(), 0.001)
+        try:
+            with pymongo.timeout(timeout):
+                documents = await self.db[collection].find({"_id": {"$in": list(futures)}}).to_list(None)
+        except Exception as e:
+            by_id, error = {}, e
+        else:
+            by_id, error = {document["_id"]: document for document in documents}, None
+        for id, future in futures.items():
+            # A later batch may have looked the same id up again
+            if self._sent.get((collection, id), (None,))[0] is future:
+                del self._sent[(collection, id)]
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(by_id.get(id))
+
+
+def get_loader(request: Request, db: MongoDB = Depends(get_db)) -> BatchLoader:
+    """
+    Dependency returning the BatchLoader of the current database, kept in `app.state.loader`.
+    """
+    loader = getattr(request.app.state, "loader", None)
+    if loader is None or loader.db is not db:
+        loader = request.app.state.loader = BatchLoader(db, window=settings.batch_window_ms / 1000)
+    return loader
+
+
+def utcnow() -> datetime:
+    """
+    The current UTC time truncated to millisecond precision, which is the precision MongoDB stores.
+    Documents built with it can be returned to the client without reading them back from the
+    database.
+    """
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
@@ -0,0 +1,136 @@
+import threading
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict
+
+from pymongo import monitoring
+
+from src.utils.metrics import MONGODB_COMMAND_DURATION, MONGODB_POOL_CHECKED_OUT, MONGODB_POOL_CONNECTIONS
+
+
+@dataclass
+class PoolStats:
+    connections: int = 0
+    checked_out: int = 0
+    checkouts: int = 0
+    checkout_failures: int = 0
+    checkout_wait_seconds_total: float = 0.0
+    checkout_wait_seconds_max: float = 0.0
+    pool_clears: int = 0
+
+
+@dataclass
+class CommandStats:
+    count: int = 0
+    failures: int = 0
+    duration_seconds_total: float = 0.0
+    duration_seconds_max: float = 0.0
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Tracks the size of each connection pool and how long operations wait to check a connection out.
+    pymongo calls listeners from its own threads, so updates are made under a lock.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.pools: Dict[str, PoolStats] = defaultdict(PoolStats)
+
+    def _pool(self, event: Any) -> PoolStats:
+        host, port = event.address
+        return self.pools[f"{host}:{port}"]
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        with self._lock:
+            self._pool(event).connections += 1
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        with self._lock:
+            self._pool(event).connections -= 1
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        wait = getattr(event, "duration", None) or 0.0
+        with self._lock:
+            pool = self._pool(event)
+            pool.checked_out += 1
+            pool.checkouts += 1
+            pool.checkout_wait_seconds_total += wait
+            pool.checkout_wait_seconds_max = max(pool.checkout_wait_seconds_max, wait)
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        with self._lock:
+            self._pool(event).checkout_failures += 1
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        with self._lock:
+            self._pool(event).checked_out -= 1
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        with self._lock:
+            self._pool(event).pool_clears += 1
+
+    # Events which are not tracked
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        pass
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {address: asdict(stats) for address, stats in self.pools.items()}
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Tracks the number, failures and latency of each database command, such as find or insert.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.commands: Dict[str, CommandStats] = defaultdict(CommandStats)
+
+    def _record(self, event: Any, failed: bool) -> None:
+        duration = event.duration_micros / 1e6
+        with self._lock:
+            stats = self.commands[event.command_name]
+            stats.count += 1
+            stats.failures += failed
+            stats.duration_seconds_total += duration
+            stats.duration_seconds_max = max(stats.duration_seconds_max, duration)
+        MONGODB_COMMAND_DURATION.observe(event.command_name, "failed" if failed else "succeeded", value=duration)
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._record(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._record(event, failed=True)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: asdict(stats) for name, stats in self.commands.items()}
+
+
+# The metrics of this worker process, registered with its Motor client in `lifespan`
+pool_metrics = PoolMetrics()
+command_metrics = CommandMetrics()
+
+
+def update_pool_gauges() -> None:
+    """
+    Copy the current connection pool sizes into the Prometheus gauges, called before each scrape.
+    """
+    for address, stats in pool_metrics.snapshot().items():
+        MONGODB_POOL_CONNECTIONS.set(address, value=stats["connections"])
+        MONGODB_POOL_CHECKED_OUT.set(address, value=stats["checked_out"])
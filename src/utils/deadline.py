@@ -0,0 +1,116 @@
+import asyncio
+import json
+from typing import Dict, Optional
+
+import pymongo
+from pymongo.errors import PyMongoError
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.utils.metrics import REQUESTS_ABORTED
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving each request a deadline and stopping work on requests nobody is waiting
+    for any more. A request which runs past its deadline is cancelled and gets a 504 response, and
+    every MongoDB operation it makes is run under `pymongo.timeout` so the server is sent the time
+    left as `maxTimeMS` and gives up at the same time. A request whose client disconnects is
+    cancelled straight away, returning its pooled connection.
+
+    The deadline is `default` seconds, or the value in `budgets` whose key is the longest prefix of
+    the request's method and path, such as `POST /item/bulk`. A budget of 0 means no deadline.
+    Clients can shorten the deadline, but not extend it, with `header`, in seconds.
+    """
+    def __init__(self, app: ASGIApp, default: float, budgets: Optional[Dict[str, float]] = None,
+                 header: str = "X-Request-Timeout") -> None:
+        self.app = app
+        self.default = default
+        # Longest prefixes first, so the first match is the most specific
+        self.budgets = sorted((budgets or {}).items(), key=lambda budget: len(budget[0]), reverse=True)
+        self.header = header.lower()
+
+    def budget(self, scope: Scope) -> Optional[float]:
+        """
+        The number of seconds a request may take, or None if it has no deadline.
+        """
+        route = f"{scope['method']} {scope['path']}"
+        budget = next((seconds for prefix, seconds in self.budgets if route.startswith(prefix)), self.default)
+        requested = Headers(scope=scope).get(self.header)
+        if requested is not None:
+            try:
+                seconds = float(requested)
+            except ValueError:
+                seconds = 0
+            if seconds > 0:
+                budget = min(budget, seconds) if budget > 0 else seconds
+        return budget if budget > 0 else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = self.budget(scope)
+        # Every message from the server is read here, so a disconnect is seen even while the app is
+        # not reading, and handed on to the app when it asks for the next message
+        messages: asyncio.Queue = asyncio.Queue()
+        disconnected = False
+        started = False
+
+        async def receive_wrapper() -> Message:
+            message = await messages.get()
+            if message["type"] == "http.disconnect":
+                # Every later call gets the disconnect too
+                messages.put_nowait(message)
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        async def watch() -> None:
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    disconnected = True
+                    handler.cancel()
+                    return
+
+        handler = asyncio.create_task(self._handle(scope, receive_wrapper, send_wrapper, budget))
+        watcher = asyncio.create_task(watch())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not disconnected or not handler.cancelled():
+                raise
+            REQUESTS_ABORTED.inc("disconnect")
+        except (asyncio.TimeoutError, PyMongoError) as e:
+            if isinstance(e, PyMongoError) and not e.timeout:
+                raise
+            REQUESTS_ABORTED.inc("deadline")
+            if not started:
+                await self._timed_out(send)
+        finally:
+            watcher.cancel()
+
+    async def _handle(self, scope: Scope, receive: Receive, send: Send, budget: Optional[float]) -> None:
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+        with pymongo.timeout(budget):
+            await asyncio.wait_for(self.app(scope, receive, send), budget)
+
+    @staticmethod
+    async def _timed_out(send: Send) -> None:
+        body = json.dumps({"detail": "Request Timed Out"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from typing import Any, Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Indexes declared by each model module, keyed by collection name
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = {}
+
+
+def register_indexes(collection: str, indexes: List[IndexModel]) -> List[IndexModel]:
+    """
+    Declare the indexes a collection needs. Model modules call this at import time and `lifespan`
+    creates any that are missing at startup. Declared and existing indexes are matched up by name.
+    Unique and TTL indexes are declared with the `unique` and `expireAfterSeconds` options of
+    `IndexModel`.
+    """
+    INDEX_REGISTRY.setdefault(collection, []).extend(indexes)
+    return indexes
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> List[str]:
+    """
+    Reconcile the indexes in the database with the registry. Missing indexes are created, and a TTL
+    index whose expiry has changed is updated in place with `collMod`. Indexes in the database that
+    are not declared are left alone, they are reported by the CLI instead. Returns the names of the
+    indexes created or modified.
+    """
+    changed = []
+    for collection, indexes in INDEX_REGISTRY.items():
+        existing = await db[collection].index_information()
+        missing = [index for index in indexes if index.document["name"] not in existing]
+        if missing:
+            changed.extend(await db[collection].create_indexes(missing))
+
+        for index in indexes:
+            name = index.document["name"]
+            current = existing.get(name)
+            if current is None:
+                continue
+            if current.get("expireAfterSeconds") != index.document.get("expireAfterSeconds"):
+                await db.command("collMod", collection, index={
+                    "name": name, "expireAfterSeconds": index.document.get("expireAfterSeconds")
+                })
+                changed.append(name)
+            elif bool(current.get("unique")) != bool(index.document.get("unique")):
+                logger.warning("Index %s.%s differs from its declaration, drop it to recreate it", collection, name)
+    if changed:
+        logger.info("Created or updated indexes: %s", ", ".join(changed))
+    return changed
+
+
+async def index_report(db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+    """
+    Describe every declared or existing index: whether it is declared, whether it exists, and how
+    often it has been used since the server started according to `$indexStats`. Usage is None when
+    the server does not provide `$indexStats`.
+    """
+    report = []
+    collections = set(INDEX_REGISTRY) | set(await db.list_collection_names())
+    for collection in sorted(collections):
+        declared = {index.document["name"] for index in INDEX_REGISTRY.get(collection, [])}
+        existing = set(await db[collection].index_information())
+        try:
+            stats = {
+                stat["name"]: stat["accesses"]["ops"]
+                async for stat in db[collection].aggregate([{"$indexStats": {}}])
+            }
+        except (OperationFailure, NotImplementedError):
+            stats = {}
+        for name in sorted(declared | existing):
+            report.append({
+                "collection": collection,
+                "name": name,
+                "declared": name in declared or name == "_id_",
+                "exists": name in existing,
+                "ops": stats.get(name),
+            })
+    return report
+
+
+async def check_indexes(url: str, create: bool) -> int:  # pragma: no cover
+    db = AsyncIOMotorClient(url).get_database()
+    if create:
+        await ensure_indexes(db)
+    problems = 0
+    for entry in await index_report(db):
+        if not entry["exists"]:
+            status = "MISSING"
+        elif not entry["declared"]:
+            status = "UNDECLARED"
+        elif entry["ops"] == 0:
+            status = "UNUSED"
+        else:
+            status = "OK"
+        problems += status != "OK"
+        ops = "-" if entry["ops"] is None else entry["ops"]
+        print(f"{status:<11} {entry['collection']}.{entry['name']} ops={ops}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    # Importing the application registers the indexes declared by every model module. The registry
+    # lives in the imported src.utils.indexes module rather than in __main__.
+    import argparse
+    import src.main  # noqa: F401
+    from src.utils import indexes
+    from src.utils.settings import settings
+
+    parser = argparse.ArgumentParser(description="Report missing, undeclared and unused MongoDB indexes.")
+    parser.add_argument("--url", default=settings.mongodb_url, help="MongoDB connection string")
+    parser.add_argument("--create", action="store_true", help="Create missing indexes before reporting")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(indexes.check_indexes(args.url, args.create)))
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import Depends, Request
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+
+from src.utils.counters import count_values, increment
+from src.utils.database import create_background_task, get_db
+from src.utils.metrics import INGEST_BUFFERED, INGEST_DROPPED
+from src.utils.search import SearchIndex, get_search_index
+from src.utils.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Queued by `stop` to wake the background task, so the last batch is inserted without waiting for
+# the flush interval
+STOP = object()
+
+
+class IngestBuffer:
+    """
+    A write-behind buffer of documents to insert into a collection. Documents are queued by `put`
+    and inserted by a background task with unordered `insert_many` calls of up to `batch_size`
+    documents, sent when a batch is full or `flush_interval` seconds after its first document, so
+    many single inserts cost the database a few bulk writes. Each worker has its own buffer, started
+    in `lifespan`.
+
+    The buffer holds at most `max_size` documents. When it is full `put` waits for room, which holds
+    back the clients until the database catches up. Inserts failing because the database is not
+    reachable are retried until they succeed, documents rejected by the database are logged and
+    dropped. `stop` inserts everything still buffered before returning. `after_insert` is called
+    with each batch of inserted documents.
+    """
+    def __init__(self, db: AsyncIOMotorDatabase, collection: str, max_size: int = 10000, batch_size: int = 1000,
+                 flush_interval: float = 0.05,
+                 after_insert: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None) -> None:
+        self.db = db
+        self.collection = db[collection]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.after_insert = after_insert
+        self.queue: asyncio.Queue = asyncio.Queue(max_size)
+        self.inserted = 0
+        self.dropped = 0
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = create_background_task(self._run())
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Insert the buffered documents, waiting at most `timeout` seconds, and stop the background
+        task. Documents still buffered after the timeout are logged as lost.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Timed out inserting buffered documents, %d not inserted", self.queue.qsize())
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _drain(self) -> None:
+        await self.queue.put(STOP)
+        await self.queue.join()
+
+    async def put(self, document: Dict[str, Any], timeout: Optional[float] = None) -> None:
+        """
+        Queue a document to be inserted, waiting at most `timeout` seconds for room in the buffer.
+        Raises `asyncio.TimeoutError` if the buffer stays full.
+        """
+        await asyncio.wait_for(self.queue.put(document), timeout)
+        INGEST_BUFFERED.set(value=self.queue.qsize())
+
+    async def _run(self) -> None:
+        while True:
+            document = await self.queue.get()
+            if document is STOP:
+                self.queue.task_done()
+                continue
+            batch = [document]
+            deadline = time.monotonic() + (0 if self._stopping else self.flush_interval)
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # The batch is due, only take what is already queued
+                    if self.queue.empty():
+                        break
+                    document = self.queue.get_nowait()
+                else:
+                    try:
+                        document = await asyncio.wait_for(self.queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if document is STOP:
+                    self.queue.task_done()
+                    deadline = time.monotonic()
+                    continue
+                batch.append(document)
+            try:
+                await self._insert(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+                INGEST_BUFFERED.set(value=self.queue.qsize())
+
+    async def _insert(self, batch: List[Dict[str, Any]], max_delay: float = 10.0) -> None:
+        delay = self.flush_interval or 0.1
+        while True:
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+                inserted = batch
+            except BulkWriteError as e:
+                # A duplicate key means a retried insert had already succeeded
+                failed = {
+                    error["index"]: error.get("errmsg") for error in e.details.get("writeErrors", [])
+                    if error.get("code") != 11000
+                }
+                if failed:
+                    logger.error("Dropped %d of %d buffered documents: %s", len(failed), len(batch),
+                                 next(iter(failed.values())))
+                    self.dropped += len(failed)
+                    INGEST_DROPPED.inc(amount=len(failed))
+                inserted = [document for index, document in enumerate(batch) if index not in failed]
+            except ConnectionFailure as e:
+                logger.warning("Error inserting %d buffered documents, retrying in %.2fs: %s", len(batch), delay, e)
+                await asyncio.sleep(delay)
+                delay = min(max_delay, delay * 2)
+                continue
+            except PyMongoError as e:
+                logger.error("Dropped %d buffered documents: %s", len(batch), e)
+                self.dropped += len(batch)
+                INGEST_DROPPED.inc(amount=len(batch))
+                inserted = []
+            break
+        self.inserted += len(inserted)
+        if self.after_insert is not None and inserted:
+            try:
+                await self.after_insert(inserted)
+            except PyMongoError as e:
+                logger.error("Error after inserting buffered documents: %s", e)
+
+
+async def get_ingest_buffer(
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    search: SearchIndex = Depends(get_search_index)
+) -> Optional[IngestBuffer]:
+    """
+    Dependency returning the item IngestBuffer of the current database, kept in `app.state.ingest`,
+    or None when buffered ingestion is turned off. The buffer is started in `lifespan`, or here on
+    first use when there is no lifespan.
+    """
+    if not settings.ingest_async:
+        return None
+    buffer = getattr(request.app.state, "ingest", None)
+    if buffer is None or buffer.db is not db:
+        buffer = request.app.state.ingest = create_ingest_buffer(db, search)
+        buffer.start()
+    return buffer
+
+
+def create_ingest_buffer(db: AsyncIOMotorDatabase, search: SearchIndex) -> IngestBuffer:
+    async def after_insert(documents: List[Dict[str, Any]]) -> None:
+        # The same bookkeeping as the synchronous create routes
+        await increment(db, "itemstats", count_values(documents, "type"))
+        search.add(*documents)
+
+    return IngestBuffer(
+        db,
+        "itemcollection",
+        max_size=settings.ingest_buffer_size,
+        batch_size=settings.ingest_batch_size,
+        flush_interval=settings.ingest_flush_interval,
+        after_insert=after_insert,
+    )
@@ -1,6 +1,65 @@
+import atexit
+import json
 import logging.config
+import logging.handlers
+import queue
+import random
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.utils.metrics import route_template
+from src.utils.settings import LogFormat, settings
+
+# The id and ASGI scope of the request being handled, added to log records by RequestContextFilter
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+request_scope_var: ContextVar[Optional[Scope]] = ContextVar("request_scope", default=None)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Adds `request_id` and `route` attributes to every record. It must run in the thread that logs the
+    record, as the listener thread can not see the request's context.
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        scope = request_scope_var.get()
+        record.request_id = request_id_var.get() or "-"
+        record.route = route_template(scope) if scope is not None else "-"
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction `rate` of DEBUG records, so high volume debug logging can stay on under
+    load. Records of other levels always pass.
+    """
+    def __init__(self, rate: float = 1.0) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno != logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, including the request id and route.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "route": getattr(record, "route", "-"),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
 
-from src.utils.settings import settings
 
 LOGGING_CONFIG = {
     'version': 1,
@@ -9,11 +68,14 @@ LOGGING_CONFIG = {
         'standard': {
             'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         },
+        'json': {
+            '()': JsonFormatter,
+        },
     },
     'handlers': {
         'default': {
             'level': settings.log_level.name,
-            'formatter': 'standard',
+            'formatter': 'json' if settings.log_format == LogFormat.JSON else 'standard',
             'class': 'logging.StreamHandler',
         },
     },
@@ -34,4 +96,59 @@ LOGGING_CONFIG = {
     },
 }
 
-logging.config.dictConfig(LOGGING_CONFIG)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging() -> None:
+    """
+    Apply LOGGING_CONFIG, then move the root handlers behind a QueueHandler. Records are put on a
+    queue by the thread that logs them and written by a QueueListener on a background thread, so
+    the event loop never blocks on stderr. Calling this again has no effect.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    logging.config.dictConfig(LOGGING_CONFIG)
+
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(DebugSamplingFilter(settings.log_debug_sample_rate))
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Write out anything still queued when the process exits
+    atexit.register(_listener.stop)
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware giving each request an id, taken from the `X-Request-ID` header or generated,
+    which is added to log records and returned in the `X-Request-ID` response header.
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        id_token = request_id_var.set(request_id)
+        scope_token = request_scope_var.set(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(id_token)
+            request_scope_var.reset(scope_token)
@@ -0,0 +1,50 @@
+import json
+import logging
+import os
+from typing import Any, Dict
+
+from fastapi import FastAPI
+
+logger = logging.getLogger(__name__)
+
+
+def write_openapi(app: FastAPI, path: str) -> None:
+    """
+    Generate the OpenAPI schema of `app` and write it to `path`.
+    """
+    with open(path, "w") as f:
+        json.dump(app.openapi(), f)
+
+
+def use_openapi_file(app: FastAPI, path: str) -> bool:
+    """
+    Serve the OpenAPI schema from a file written by `write_openapi`, usually when the Docker image is
+    built, instead of generating it from the routes and models on the first request to
+    `/openapi.json` or `/docs`. The file is read on first use. Returns False, leaving the schema to
+    be generated, if there is no file.
+    """
+    if not os.path.exists(path):
+        logger.info("No OpenAPI schema file at %s, the schema will be generated on first use", path)
+        return False
+
+    def openapi() -> Dict[str, Any]:
+        if app.openapi_schema is None:
+            with open(path) as f:
+                app.openapi_schema = json.load(f)
+        return app.openapi_schema
+
+    app.openapi = openapi
+    logger.info("Serving the OpenAPI schema from %s", path)
+    return True
+
+
+if __name__ == "__main__":  # pragma: no cover
+    import argparse
+    from src.main import app
+    from src.utils.settings import settings
+
+    parser = argparse.ArgumentParser(description="Write the OpenAPI schema of the application to a file.")
+    parser.add_argument("path", nargs="?", default=settings.openapi_file, help="Where to write the schema")
+    args = parser.parse_args()
+    write_openapi(app, args.path)
+    print(f"Wrote the OpenAPI schema to {args.path}")
@@ -0,0 +1,87 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Tuple
+
+from bson import Code, ObjectId, Regex, json_util
+from bson.errors import InvalidId
+
+# A sort specification as accepted by Motor, eg. [("updated_time", 1), ("_id", 1)]
+SortSpec = List[Tuple[str, int]]
+
+
+def _sort_key(sort: SortSpec) -> str:
+    return ",".join(f"{'-' if direction < 0 else ''}{field}" for field, direction in sort)
+
+
+def parse_sort(sort: str, allowed: Iterable[str]) -> SortSpec:
+    """
+    Parse a sort query parameter such as `-updated_time` into a sort specification, adding `_id`
+    as a tie breaker in the same direction so every document has a unique position. Raises a
+    ValueError if the field is not in `allowed`.
+    """
+    direction = -1 if sort.startswith("-") else 1
+    field = sort.lstrip("-+")
+    if field not in allowed:
+        raise ValueError(f"Can not sort on {field}")
+    return [("_id", direction)] if field == "_id" else [(field, direction), ("_id", direction)]
+
+
+def encode_cursor(values: List[Any], sort: SortSpec) -> str:
+    """
+    Encode the sort key values of the last document on a page into an opaque, URL safe cursor. BSON
+    extended JSON is used so ObjectIds and datetimes survive the round trip with their types. The
+    sort specification is included so the cursor can not be used with a different sort order.
+    """
+    raw = json_util.dumps({"s": _sort_key(sort), "v": values}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: SortSpec, types: Optional[Dict[str, type]] = None) -> List[Any]:
+    """
+    Decode a cursor produced by `encode_cursor`. Raises a ValueError if the cursor is malformed or
+    does not match the sort specification it is being used with, or if a value is not None or of
+    the type `types` gives its field. The values go into the query, so a forged cursor must not be
+    able to pass operators such as `{"$ne": ...}` or regular expressions.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        decoded = json_util.loads(raw)
+    except (binascii.Error, ValueError, TypeError, InvalidId):
+        raise ValueError("Invalid cursor")
+    if not isinstance(decoded, dict) or decoded.get("s") != _sort_key(sort):
+        raise ValueError("Invalid cursor")
+    values = decoded.get("v")
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise ValueError("Invalid cursor")
+    types = types or {}
+    for (field, _), value in zip(sort, values):
+        if value is None:
+            continue
+        # Code is a str subclass, so it is ruled out along with documents, arrays and patterns
+        if isinstance(value, (dict, list, Code, Regex, Pattern)):
+            raise ValueError("Invalid cursor")
+        if not isinstance(value, types.get(field, (str, int, float, ObjectId, datetime))):
+            raise ValueError("Invalid cursor")
+    return values
+
+
+def cursor_values(document: Dict[str, Any], sort: SortSpec) -> List[Any]:
+    """
+    Extract the values of the sort keys from a document, in sort order.
+    """
+    return [document.get(field) for field, _ in sort]
+
+
+def keyset_filter(sort: SortSpec, values: List[Any]) -> Dict[str, Any]:
+    """
+    Build a filter matching every document that sorts strictly after `values`. For a compound sort
+    on (a, b) this is `a > va OR (a == va AND b > vb)`, which MongoDB answers as an index range scan
+    when an index on the sort keys exists.
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        clause[field] = {"$gt" if direction > 0 else "$lt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
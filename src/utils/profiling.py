@@ -0,0 +1,105 @@
+import asyncio
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+from typing import List, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.utils.metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+# Names of the profile files written by the middleware, used to validate download requests
+PROFILE_NAME = re.compile(r"^[\w.-]+\.prof$")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware running cProfile around a sample of requests and writing the results to a ring of
+    at most `max_files` `.prof` files in `directory`, which can be opened with snakeviz, or converted
+    for speedscope or flamegraphs. A request is profiled when the `X-Profile` header is set or with
+    probability `sample_rate`, and the file name is returned in the `X-Profile-Id` response header.
+
+    cProfile profiles the whole thread, so other requests running on the event loop at the same time
+    also show up, and only one request is profiled at a time. This middleware is only added when
+    profiling is enabled, there is no cost otherwise.
+    """
+    def __init__(self, app: ASGIApp, directory: str, max_files: int, sample_rate: float) -> None:
+        self.app = app
+        self.directory = directory
+        self.max_files = max_files
+        self.sample_rate = sample_rate
+        self._active = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _sampled(self, scope: Scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return value.lower() not in (b"0", b"false")
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self._active or not self._sampled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        name = None
+
+        def profile_name() -> str:
+            # Called once routing has happened, so the route template can be part of the name
+            route = re.sub(r"\W+", "_", route_template(scope)).strip("_") or "root"
+            return f"{time.strftime('%Y%m%dT%H%M%S')}-{time.time_ns() % 10**9:09d}-{scope['method']}-{route}.prof"
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal name
+            if message["type"] == "http.response.start":
+                name = profile_name()
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", name.encode())]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler, such as a debugger, is already running in this thread
+            await self.app(scope, receive, send)
+            return
+        self._active = True
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            self._active = False
+            await asyncio.to_thread(self._save, profiler, name or profile_name())
+
+    def _save(self, profiler: cProfile.Profile, name: str) -> None:
+        try:
+            profiler.dump_stats(os.path.join(self.directory, name))
+            for old in list_profiles(self.directory)[self.max_files:]:
+                os.remove(os.path.join(self.directory, old))
+        except OSError as e:
+            logger.error("Error writing profile %s: %s", name, e)
+
+
+def list_profiles(directory: str) -> List[str]:
+    """
+    The names of the profile files in `directory`, newest first.
+    """
+    try:
+        names = [name for name in os.listdir(directory) if PROFILE_NAME.match(name)]
+    except FileNotFoundError:
+        return []
+    return sorted(names, key=lambda name: os.path.getmtime(os.path.join(directory, name)), reverse=True)
+
+
+def profile_path(directory: str, name: str) -> Optional[str]:
+    """
+    The path of a profile file, or None if there is no profile with that name.
+    """
+    if not PROFILE_NAME.match(name) or name not in list_profiles(directory):
+        return None
+    return os.path.join(directory, name)
@@ -0,0 +1,142 @@
+import json
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Sequence, Tuple
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.utils.metrics import REQUESTS_REJECTED
+
+# The paths of the Server-Sent Event streams, which stay open
+STREAM_PATHS = ("/item/stream",)
+
+
+class RateLimitStore(ABC):
+    """
+    Interface for the storage of the token buckets. The memory store limits each worker separately,
+    a store shared between workers, for example in redis, limits each client across all of them.
+    """
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take a token from the bucket `key`, which holds at most `burst` tokens and refills at `rate`
+        tokens per second. Returns 0 if a token was taken, otherwise the number of seconds until
+        one will be available.
+        """
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """
+    Token buckets held in memory by this worker. Only the `max_keys` most recently used buckets are
+    kept, a bucket which is dropped has usually refilled already.
+    """
+    def __init__(self, max_keys: int = 10000) -> None:
+        self.max_keys = max_keys
+        # The tokens left in each bucket and when they were counted
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+def route_class(scope: Scope) -> str:
+    """
+    The class of a request for the in-flight limits: `stream` for the Server-Sent Event streams in
+    `STREAM_PATHS`, `read` for other GET and HEAD requests and `write` for everything else. Requests
+    are classified by path rather than by headers, which clients choose.
+    """
+    if scope["method"] in ("GET", "HEAD"):
+        return "stream" if scope["path"].rstrip("/") in STREAM_PATHS else "read"
+    return "write"
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware admitting requests before they reach the event loop's queue of work or the
+    database connection pool. Each client, identified by its address, has a token bucket of `burst` requests refilled at `rate` per second, and requests beyond it get
+    a 429 response. The requests being handled by this worker are limited per route class by
+    `max_in_flight`, and requests beyond the limit get a 503 response straight away rather than
+    waiting behind the others. Both responses have a `Retry-After` header. A rate or limit of 0 turns
+    that check off, and paths starting with one of `exempt` are not limited.
+
+    Requests from the addresses in `trusted_proxies` are counted against the client address in
+    their `X-Forwarded-For` header: the last address in it which is not a trusted proxy, as earlier
+    ones are set by the client. Without them, every client behind a proxy shares its bucket.
+    """
+    def __init__(self, app: ASGIApp, store: RateLimitStore, rate: float, burst: int,
+                 max_in_flight: Dict[str, int], exempt: Sequence[str] = (),
+                 trusted_proxies: Sequence[str] = ()) -> None:
+        self.app = app
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.exempt = tuple(exempt)
+        self.trusted_proxies = set(trusted_proxies)
+        self.in_flight: Dict[str, int] = {name: 0 for name in max_in_flight}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        if self.rate > 0:
+            wait = await self.store.take(self._client(scope), self.rate, self.burst)
+            if wait > 0:
+                REQUESTS_REJECTED.inc("rate_limit")
+                await self._reject(send, 429, "Too Many Requests", wait)
+                return
+
+        name = route_class(scope)
+        limit = self.max_in_flight.get(name, 0)
+        if limit > 0 and self.in_flight[name] >= limit:
+            REQUESTS_REJECTED.inc("overloaded")
+            await self._reject(send, 503, "Service Overloaded", 1)
+            return
+
+        self.in_flight[name] = self.in_flight.get(name, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight[name] -= 1
+
+    def _client(self, scope: Scope) -> str:
+        # Not a header such as an API key, which is not authenticated, so a client could send a new
+        # one with every request to get a fresh bucket and push the other clients' buckets out
+        client = scope.get("client")
+        address = client[0] if client else "unknown"
+        if address in self.trusted_proxies:
+            forwarded = ",".join(Headers(scope=scope).getlist("x-forwarded-for"))
+            for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+                address = hop
+                if hop not in self.trusted_proxies:
+                    break
+        return f"address:{address}"
+
+    @staticmethod
+    async def _reject(send: Send, status: int, detail: str, retry_after: float) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
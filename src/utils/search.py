@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import re
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi import Depends, Request
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo.errors import PyMongoError
+
+from src.api.item.models import ITEM_SEARCH_WEIGHTS
+from src.utils.changefeed import ChangeFeed, Subscription, get_changefeed
+from src.utils.database import create_background_task, get_db
+from src.utils.settings import SearchBackend, settings
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD.findall(text.lower())
+
+
+def word_grams(word: str) -> Set[str]:
+    """
+    The n-grams a word is indexed under: its trigrams, and the start of the word marked with `^` so
+    one and two letter prefixes can be looked up too.
+    """
+    marked = "^" + word
+    return {marked[:2], *(marked[i:i + 3] for i in range(len(marked) - 2))}
+
+
+def term_grams(term: str) -> Set[str]:
+    """
+    The n-grams to look up for a search term. Terms of three or more letters match anywhere in a
+    word, shorter terms match the start of a word.
+    """
+    if len(term) >= 3:
+        return {term[i:i + 3] for i in range(len(term) - 2)}
+    return {"^" + term}
+
+
+class SearchIndex:
+    """
+    An in-memory n-gram index over the text fields of a collection, used for search when MongoDB's
+    text index is not available, as with the mock database used by the tests. Each field has a
+    weight in the ranking.
+
+    Looking a query up intersects the posting lists of its n-grams, starting with the shortest, so
+    the time taken depends on the number of matches rather than the size of the collection. The
+    index is built from the collection on first use and kept current by the write routes of this
+    worker and, when given one, by the events of `feed`, which include the writes made through other
+    workers. When the feed loses track of the changes the index is read from the collection again.
+    When the feed has no change streams and polls the collection instead, the index does not keep it
+    polling: it reads the documents updated since its last read every `poll_interval` of the feed,
+    and documents deleted through other workers stay in the index, and out of the results, until
+    the feed resets or the worker restarts.
+    """
+    def __init__(self, db: AsyncIOMotorDatabase, collection: str, weights: Dict[str, float],
+                 feed: Optional[ChangeFeed] = None) -> None:
+        self.db = db
+        self.collection: AsyncIOMotorCollection = db[collection]
+        self.weights = weights
+        self.feed = feed
+        # Search with this index rather than the database's text index, set when the search backend
+        # is MEMORY or the database has no text search
+        self.use_memory = False
+        self.ready = False
+        # The lower case field values of each document, and the documents with each n-gram
+        self.documents: Dict[Any, Dict[str, str]] = {}
+        self.postings: Dict[str, Set[Any]] = defaultdict(set)
+        self._building = False
+        self._touched: Set[Any] = set()
+        self._lock = asyncio.Lock()
+        self._follower: Optional[asyncio.Task] = None
+        # The latest `updated_time` read from the collection
+        self._updated: Optional[Any] = None
+
+    def _grams(self, values: Dict[str, str]) -> Set[str]:
+        return {gram for value in values.values() for word in tokenize(value) for gram in word_grams(word)}
+
+    def _add(self, document: Dict[str, Any]) -> None:
+        # Fields missing from the document, as after a partial update, keep their indexed values
+        previous = self.documents.get(document["_id"], {})
+        self._remove(document["_id"])
+        values = {
+            field: str(document[field] or "").lower() if field in document else previous.get(field, "")
+            for field in self.weights
+        }
+        self.documents[document["_id"]] = values
+        for gram in self._grams(values):
+            self.postings[gram].add(document["_id"])
+
+    def _remove(self, id: Any) -> None:
+        values = self.documents.pop(id, None)
+        if values is None:
+            return
+        for gram in self._grams(values):
+            posting = self.postings[gram]
+            posting.discard(id)
+            if not posting:
+                del self.postings[gram]
+
+    def add(self, *documents: Dict[str, Any]) -> None:
+        """
+        Add documents to the index, or update the given fields of documents already in it. Does
+        nothing until the index is in use.
+        """
+        if not (self.ready or self._building):
+            return
+        for document in documents:
+            self._touched.add(document["_id"])
+            self._add(document)
+
+    def remove(self, *ids: Any) -> None:
+        """
+        Remove documents from the index. Does nothing until the index is in use.
+        """
+        if not (self.ready or self._building):
+            return
+        for id in ids:
+            self._touched.add(id)
+            self._remove(id)
+
+    async def build(self) -> None:
+        """
+        Read the indexed fields of every document into the index, once, and start following the
+        feed. Documents written while the index is being built are added by the write routes or the
+        feed and not overwritten with older versions.
+        """
+        async with self._lock:
+            if self.ready:
+                return
+            # Subscribed first, so the changes made while the collection is read are not missed
+            subscription = self.feed.subscribe() if self.feed is not None else None
+            try:
+                await self._load()
+            except BaseException:
+                if subscription is not None:
+                    self.feed.unsubscribe(subscription)
+                raise
+            self.ready = True
+            if subscription is not None:
+                self._follower = create_background_task(self._follow(subscription))
+            logger.info("Built search index of %s, %d documents", self.collection.name, len(self.documents))
+
+    async def stop(self) -> None:
+        if self._follower is not None:
+            self._follower.cancel()
+            try:
+                await self._follower
+            except asyncio.CancelledError:
+                pass
+            self._follower = None
+
+    async def _load(self) -> None:
+        # Documents no longer in the collection are removed, as when the index is read again
+        self._building = True
+        self._touched.clear()
+        try:
+            found = set()
+            async for document in self.collection.find({}, self._projection()):
+                found.add(document["_id"])
+                self._seen(document)
+                if document["_id"] not in self._touched:
+                    self._add(document)
+            for id in self.documents.keys() - found - self._touched:
+                self._remove(id)
+        finally:
+            self._building = False
+
+    def _projection(self) -> Dict[str, int]:
+        return {"updated_time": 1, **{field: 1 for field in self.weights}}
+
+    def _seen(self, document: Dict[str, Any]) -> None:
+        updated = document.get("updated_time")
+        if updated is not None and (self._updated is None or updated > self._updated):
+            self._updated = updated
+
+    async def _follow(self, subscription: Subscription) -> None:
+        token = None
+        next_event: Optional[asyncio.Future] = None
+        try:
+            while not self.feed.polling:
+                # Waits for at most the poll interval, so a feed falling back to polling is noticed
+                if next_event is None:
+                    next_event = asyncio.ensure_future(subscription.__anext__())
+                await asyncio.wait({next_event}, timeout=self.feed.poll_interval)
+                if not next_event.done():
+                    continue
+                done, next_event = next_event, None
+                try:
+                    event = done.result()
+                except StopAsyncIteration:
+                    # Dropped for falling behind, resume after the last event or read the index again
+                    subscription = self.feed.subscribe(after=token)
+                    if token is None:
+                        await self._reload()
+                    continue
+                token = event.token or token
+                if event.operation == "delete":
+                    self.remove(event.id)
+                elif event.operation == "reset":
+                    logger.warning("Changes to %s missed, reading the search index again", self.collection.name)
+                    await self._reload()
+                elif event.document is not None:
+                    self.add(event.document)
+        finally:
+            if next_event is not None:
+                next_event.cancel()
+            self.feed.unsubscribe(subscription)
+        await self._refresh()
+
+    async def _refresh(self) -> None:
+        # A polling feed reads every id in the collection, so rather than keeping it polling for the
+        # life of the worker only the documents updated since the last read are read, using the
+        # updated_time index. Equal times are read again, as several writes can share a time.
+        logger.info("Change streams not available, reading updates to the search index every %ss",
+                    self.feed.poll_interval)
+        while True:
+            await asyncio.sleep(self.feed.poll_interval)
+            query = {} if self._updated is None else {"updated_time": {"$gte": self._updated}}
+            try:
+                async for document in self.collection.find(query, self._projection()):
+                    self._seen(document)
+                    self.add(document)
+            except PyMongoError as e:
+                logger.error("Error reading updates to the search index: %s", e)
+
+    async def _reload(self) -> None:
+        while True:
+            try:
+                async with self._lock:
+                    await self._load()
+                return
+            except PyMongoError as e:
+                logger.error("Error reading the search index again, retrying: %s", e)
+                await asyncio.sleep(self.feed.poll_interval)
+
+    def _score(self, id: Any, terms: List[str]) -> float:
+        score = 0.0
+        for term in terms:
+            term_score = 0.0
+            for field, value in self.documents[id].items():
+                words = tokenize(value)
+                if term in words:
+                    quality = 3
+                elif any(word.startswith(term) for word in words):
+                    quality = 2
+                elif len(term) >= 3 and term in value:
+                    quality = 1
+                else:
+                    continue
+                term_score = max(term_score, quality * self.weights[field])
+            if term_score == 0:
+                return 0.0
+            score += term_score
+        return score
+
+    def search(self, query: str, limit: int, offset: int = 0) -> List[Tuple[Any, float]]:
+        """
+        The ids and scores of the documents matching every word of `query`, best first. Whole words
+        rank above word prefixes, which rank above matches inside a word.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        candidates: Optional[Set[Any]] = None
+        # Start with the rarest n-gram so the candidates are narrowed down quickly
+        grams = {gram for term in terms for gram in term_grams(term)}
+        for gram in sorted(grams, key=lambda gram: len(self.postings.get(gram, ()))):
+            posting = self.postings.get(gram, set())
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return []
+        scored = [(id, score) for id in candidates if (score := self._score(id, terms)) > 0]
+        scored.sort(key=lambda result: (-result[1], self.documents[result[0]].get("name", ""), str(result[0])))
+        return scored[offset:offset + limit]
+
+
+async def get_search_index(
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    feed: ChangeFeed = Depends(get_changefeed)
+) -> SearchIndex:
+    """
+    Dependency returning the item SearchIndex of the current database, kept in
+    `app.state.search_index` and following the item ChangeFeed once built.
+    """
+    index = getattr(request.app.state, "search_index", None)
+    if index is None or index.db is not db:
+        index = request.app.state.search_index = create_search_index(db, feed)
+    return index
+
+
+def create_search_index(db: AsyncIOMotorDatabase, feed: Optional[ChangeFeed] = None) -> SearchIndex:
+    index = SearchIndex(db, "itemcollection", ITEM_SEARCH_WEIGHTS, feed)
+    index.use_memory = settings.search_backend == SearchBackend.MEMORY
+    return index
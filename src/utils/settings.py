@@ -1,5 +1,6 @@
 import sys
 from enum import Enum
+from typing import Dict, Optional
 
 from pydantic import ValidationError
 from pydantic_settings import BaseSettings
@@ -13,19 +14,88 @@ class LogLevel(str, Enum):
     CRITICAL = "CRITICAL"
 
 
+class LogFormat(str, Enum):
+    STANDARD = "STANDARD"
+    JSON = "JSON"
+
+
 class Mode(str, Enum):
     TEST = "TEST"
     DEV = "DEV"
     LIVE = "LIVE"
 
 
+class CacheBackend(str, Enum):
+    NONE = "NONE"
+    MEMORY = "MEMORY"
+    REDIS = "REDIS"
+
+
+class SearchBackend(str, Enum):
+    TEXT = "TEXT"
+    MEMORY = "MEMORY"
+
+
 class Settings(BaseSettings):
     # The connection string for the MongoDB database
     mongodb_url: str = "mongodb://localhost:27017/mydatabase"
 
+    # Connection pool and timeout options for the MongoDB driver. Options left as None keep the
+    # driver default or the value given in `mongodb_url`. The zstd and snappy compressors need the
+    # zstandard and python-snappy packages.
+    mongodb_max_pool_size: Optional[int] = None
+    mongodb_min_pool_size: Optional[int] = None
+    mongodb_max_idle_time_ms: Optional[int] = None
+    mongodb_wait_queue_timeout_ms: Optional[int] = None
+    mongodb_server_selection_timeout_ms: Optional[int] = None
+    mongodb_connect_timeout_ms: Optional[int] = None
+    mongodb_socket_timeout_ms: Optional[int] = None
+    mongodb_compressors: Optional[str] = None
+    mongodb_read_preference: Optional[str] = None
+
+    # Attempts made to reach the database at startup, each giving up after `mongodb_check_timeout`
+    # seconds. Attempts are spaced by a jittered, exponentially growing delay, so workers starting
+    # together do not retry in lockstep.
+    mongodb_connect_attempts: int = 5
+
+    # Once running, the database is pinged every `mongodb_check_interval` seconds, each ping giving up
+    # after `mongodb_check_timeout` seconds. After `mongodb_failure_threshold` failed pings or
+    # requests in a row, requests get a 503 response straight away and the database is pinged again
+    # with a jittered, exponentially growing delay of up to `mongodb_max_retry_delay` seconds until
+    # it answers. The health endpoints report the result of the last ping.
+    mongodb_check_interval: float = 5.0
+    mongodb_check_timeout: float = 2.0
+    mongodb_failure_threshold: int = 3
+    mongodb_max_retry_delay: float = 30.0
+
+    # Create the indexes declared by the models at startup
+    create_indexes: bool = True
+
     # The level of logging.
     log_level: LogLevel = LogLevel.DEBUG
 
+    # The format of log lines, STANDARD text or one JSON object per line with the request id and
+    # route, and the fraction of DEBUG records which are kept.
+    log_format: LogFormat = LogFormat.STANDARD
+    log_debug_sample_rate: float = 1.0
+
+    # Options for the production server, read by `src/hypercorn_config.py`. `server_workers`
+    # defaults to the number of CPUs available to the container, and uvloop is used when installed.
+    # HTTP/2 is always served, and HTTP/3 is served on `server_quic_bind` when a certificate is given.
+    server_bind: str = "0.0.0.0:80"
+    server_workers: Optional[int] = None
+    server_uvloop: bool = True
+    server_keep_alive_timeout: float = 5.0
+    server_backlog: int = 2048
+    server_graceful_timeout: float = 30.0
+    server_certfile: Optional[str] = None
+    server_keyfile: Optional[str] = None
+    server_quic_bind: Optional[str] = None
+
+    # An OpenAPI schema generated at build time with `python -m src.utils.openapi`, served instead of
+    # generating the schema on first use. Ignored in TEST mode or if the file does not exist.
+    openapi_file: str = "openapi.json"
+
     # The mode (TEST, DEV, LIVE) the application is running in
     mode: Mode = Mode.DEV
 
@@ -33,6 +103,115 @@ class Settings(BaseSettings):
     # with a web app.
     allow_origins: str = "http://localhost"
 
+    # The number of documents returned by listing endpoints when no limit is given, and the largest
+    # limit a client may request.
+    page_size_default: int = 100
+    page_size_max: int = 1000
+
+    # The number of documents fetched from MongoDB and written to the client at a time when
+    # streaming an export.
+    export_batch_size: int = 1000
+
+    # The number of documents sent to MongoDB in each insert_many/bulk_write call by the bulk
+    # endpoints.
+    bulk_chunk_size: int = 1000
+
+    # How /item/search finds items: TEXT uses MongoDB's text index, which matches whole words, and
+    # MEMORY an n-gram index held by each worker, which also matches parts of words. TEXT falls back
+    # to MEMORY when the database has no text search.
+    search_backend: SearchBackend = SearchBackend.TEXT
+
+    # Seconds between recounts of the item counts served by /item/stats, which correct any drift in
+    # the counts kept up to date by writes. Each worker recounts at this interval, starting after a
+    # random part of it so workers started together do not all recount at once.
+    stats_reconcile_interval: float = 3600.0
+
+    # Lookups of single items by id made within this many milliseconds of each other are sent to
+    # MongoDB as one query. With 0, lookups made in the same event loop iteration are combined.
+    batch_window_ms: float = 0.0
+
+    # The live item feed at /item/stream. Each client has a queue of at most `changefeed_queue_size`
+    # events and is dropped if it falls further behind. The last `changefeed_history_size` events are
+    # kept for clients resuming with a token. Without change streams the collection is polled every
+    # `changefeed_poll_interval` seconds, and idle clients are sent a comment every
+    # `changefeed_keepalive` seconds.
+    changefeed_queue_size: int = 100
+    changefeed_history_size: int = 1000
+    changefeed_poll_interval: float = 1.0
+    changefeed_keepalive: float = 15.0
+
+    # Write-behind ingestion for POST /item/. When enabled, new items are queued in a buffer of at
+    # most `ingest_buffer_size` documents per worker and the request gets a 202 response straight
+    # away. The buffer is inserted with `insert_many` every `ingest_batch_size` documents or
+    # `ingest_flush_interval` seconds. Requests wait up to `ingest_wait_timeout` seconds for room
+    # in a full buffer before getting a 503 response.
+    ingest_async: bool = False
+    ingest_buffer_size: int = 10000
+    ingest_batch_size: int = 1000
+    ingest_flush_interval: float = 0.05
+    ingest_wait_timeout: float = 5.0
+
+    # Where serialised item responses are cached: NONE, MEMORY (per worker LRU) or REDIS (shared,
+    # needs the redis package). The memory cache holds at most `cache_max_items` entries and all
+    # entries expire after `cache_ttl` seconds. A write only clears the memory cache of the worker
+    # which handled it, so `scripts/run_live.sh` and the Docker image, which start several workers,
+    # select NONE unless a backend is set.
+    cache_backend: CacheBackend = CacheBackend.MEMORY
+    cache_max_items: int = 10000
+    cache_ttl: float = 60
+    cache_url: str = "redis://localhost:6379/0"
+
+    # Record request metrics and serve them in the Prometheus text format at /metrics
+    metrics_enabled: bool = False
+
+    # Profile a sample of requests with cProfile. Requests are profiled with probability
+    # `profiling_sample_rate` or when sent with an `X-Profile: 1` header. The newest
+    # `profiling_max_files` profiles are kept in `profiling_dir` and can be downloaded from /profiles
+    # in DEV mode.
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.0
+    profiling_dir: str = "profiles"
+    profiling_max_files: int = 50
+
+    # Trust documents read from the database and encode them straight to JSON with orjson, skipping
+    # Pydantic validation of the response models on the item read endpoints.
+    fast_serialization: bool = False
+
+    # Admission control. Each client, identified by its address, may make `rate_limit_rate` requests
+    # a second with bursts of up to `rate_limit_burst`. Behind a reverse proxy every request comes
+    # from the proxy, so the comma separated addresses in `rate_limit_trusted_proxies` are replaced
+    # by the client address they send in X-Forwarded-For. Each worker handles at most
+    # `rate_limit_max_reads`, `rate_limit_max_writes` and `rate_limit_max_streams` requests of each
+    # class at once and turns away the rest. 0 turns a limit off.
+    rate_limit_enabled: bool = False
+    rate_limit_rate: float = 50.0
+    rate_limit_burst: int = 100
+    rate_limit_trusted_proxies: str = ""
+    rate_limit_max_reads: int = 200
+    rate_limit_max_writes: int = 50
+    rate_limit_max_streams: int = 1000
+
+    # Requests taking longer than `request_timeout` seconds are cancelled with a 504 response, and
+    # MongoDB is sent the time left as maxTimeMS. `request_timeouts` sets the deadline of requests
+    # whose method and path start with a key instead, 0 meaning no deadline. Clients can shorten
+    # their deadline with the X-Request-Timeout header, in seconds. Requests are also cancelled when
+    # the client disconnects.
+    request_timeout: float = 10.0
+    request_timeouts: Dict[str, float] = {
+        "GET /item/export": 0,
+        "GET /item/stream": 0,
+        "POST /item/bulk": 60,
+        "PATCH /item/bulk": 60,
+        "DELETE /item/bulk": 60,
+    }
+
+    # Compress responses with the best encoding the client accepts, of brotli and zstd when installed,
+    # and gzip. Responses smaller than `compression_minimum_size` bytes are sent as is.
+    # `compression_level` applies to every encoding, unset uses a fast default for each.
+    compression_enabled: bool = True
+    compression_minimum_size: int = 1000
+    compression_level: Optional[int] = None
+
     class Config:
         env_file = ".env"
 
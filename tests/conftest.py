@@ -2,10 +2,16 @@ from collections.abc import AsyncGenerator
 
 import pytest_asyncio
 from fastapi.testclient import TestClient
+from mongomock.collection import BulkOperationBuilder
 from mongomock_motor import AsyncMongoMockClient
 
 from src.main import app
 
+# Newer pymongo releases pass a `sort` argument when adding UpdateOne operations to a bulk write,
+# which mongomock does not accept yet. Drop it so bulk_write can be used with the mock database.
+_add_update = BulkOperationBuilder.add_update
+BulkOperationBuilder.add_update = lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+
 
 @pytest_asyncio.fixture(scope="function")
 async def client() -> AsyncGenerator:
@@ -19,3 +25,4 @@ async def client() -> AsyncGenerator:
         yield client
     database_connection.close()
     app.state.db = None
+    await app.state.cache.clear()
@@ -1,9 +1,16 @@
+import asyncio
+import base64
 from datetime import datetime
+import json
 import time
+from typing import Any, Dict, List
+from unittest.mock import patch
 
 from fastapi.testclient import TestClient
 
 from src.utils.common_models import PyObjectId
+from src.utils.counters import reconcile
+from src.utils.settings import settings
 from src.api.item.models import Item, ItemNew, ItemUpdate
 
 
@@ -184,3 +191,513 @@ async def test_update_item_not_found(client: TestClient) -> None:
 
     assert response.status_code == 404
     assert response.json() == {"detail": f"Item {item_id} not found"}
+
+
+async def test_get_items_pagination(client: TestClient) -> None:
+    """
+    Insert more items than fit on a page and check that following `X-Next-Cursor` walks through
+    every item exactly once, in id order.
+    """
+    items = [
+        Item(
+            _id=PyObjectId(),
+            name=f"Test Item {i}",
+            type="Test Type",
+            created_time=datetime.utcnow(),
+            updated_time=datetime.utcnow()
+        ) for i in range(5)
+    ]
+    await client.app.state.db["itemcollection"].insert_many([
+        {"_id": PyObjectId(item.id), **item.model_dump(exclude={"id"})} for item in items
+    ])
+
+    response = client.get("/item/", params={"limit": 2})
+    pages = [response.json()]
+    while "X-Next-Cursor" in response.headers:
+        assert 'rel="next"' in response.headers["Link"]
+        response = client.get("/item/", params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]})
+        assert response.status_code == 200
+        pages.append(response.json())
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [item["id"] for page in pages for item in page] == [item.id for item in items]
+
+
+async def test_get_items_projection(client: TestClient) -> None:
+    """
+    Test the `fields` query parameter only returns the id and the requested fields.
+    """
+    await client.app.state.db["itemcollection"].insert_one({
+        "name": "Test Item",
+        "type": "Test Type",
+        "created_time": datetime.utcnow(),
+        "updated_time": datetime.utcnow()
+    })
+    response = client.get("/item/", params={"fields": "name"})
+
+    assert response.status_code == 200
+    assert list(response.json()[0].keys()) == ["id", "name"]
+
+
+async def test_get_items_invalid_parameters(client: TestClient) -> None:
+    """
+    Test the item listing rejects unknown fields, and malformed or forged cursors.
+    """
+    response = client.get("/item/", params={"fields": "name,password"})
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Unknown fields: password"}
+
+    response = client.get("/item/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+    # A cursor carrying an operator instead of a value would change what the query matches
+    forged = base64.urlsafe_b64encode(json.dumps({"s": "name,_id", "v": [{"$ne": None}, None]}).encode()).decode()
+    response = client.get("/item/", params={"sort": "name", "cursor": forged})
+    assert response.status_code == 400
+
+
+async def test_export_items(client: TestClient) -> None:
+    """
+    Test the export endpoint streams every item, as NDJSON and as a JSON array, across several
+    batches.
+    """
+    items = [
+        Item(
+            _id=PyObjectId(),
+            name=f"Test Item {i}",
+            type="Test Type",
+            created_time=datetime.utcnow(),
+            updated_time=datetime.utcnow()
+        ) for i in range(3)
+    ]
+    await client.app.state.db["itemcollection"].insert_many([
+        {"_id": PyObjectId(item.id), **item.model_dump(exclude={"id"})} for item in items
+    ])
+    expected = [
+        Item(**document).model_dump(mode="json")
+        for document in await client.app.state.db["itemcollection"].find().to_list(None)
+    ]
+
+    with patch.object(settings, "export_batch_size", 2):
+        response = client.get("/item/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in response.text.splitlines()] == expected
+
+        response = client.get("/item/export", params={"format": "json"})
+        assert response.status_code == 200
+        assert response.json() == expected
+
+
+async def test_export_items_empty(client: TestClient) -> None:
+    """
+    Test exporting an empty collection produces valid output.
+    """
+    assert client.get("/item/export").text == ""
+    assert client.get("/item/export", params={"format": "json"}).json() == []
+
+
+async def test_create_items_bulk(client: TestClient) -> None:
+    """
+    Test the bulk create endpoint creates every valid entry and reports invalid entries without
+    failing the whole request.
+    """
+    entries = [
+        {"name": "Test Item 1", "type": "Test Type"},
+        {"name": "Test Item 2"},
+        {"name": "Test Item 3", "type": "Test Type"},
+    ]
+    with patch.object(settings, "bulk_chunk_size", 1):
+        response = client.post("/item/bulk", json=entries)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == [201, 422, 201]
+    assert results[1]["detail"] == "type: Field required"
+
+    created = await client.app.state.db["itemcollection"].find().to_list(None)
+    assert [str(item["_id"]) for item in created] == [results[0]["id"], results[2]["id"]]
+    assert [item["name"] for item in created] == ["Test Item 1", "Test Item 3"]
+
+
+async def test_create_items_bulk_ndjson(client: TestClient) -> None:
+    """
+    Test the bulk create endpoint accepts NDJSON, where a malformed line only fails that entry.
+    """
+    body = '{"name": "Test Item 1", "type": "Test Type"}\n{"name": \n\n{"name": "Test Item 2", "type": "Test Type"}\n'
+    response = client.post("/item/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == [201, 422, 201]
+    assert await client.app.state.db["itemcollection"].count_documents({}) == 2
+
+    response = client.post("/item/bulk", json={"name": "Test Item", "type": "Test Type"})
+    assert response.status_code == 422
+
+
+async def test_update_items_bulk(client: TestClient) -> None:
+    """
+    Test the bulk update endpoint updates existing items and reports missing and invalid ids.
+    """
+    result = await client.app.state.db["itemcollection"].insert_one({
+        "name": "Test Item",
+        "type": "Test Type",
+        "created_time": datetime.utcnow(),
+        "updated_time": datetime.utcnow()
+    })
+    missing_id = str(PyObjectId())
+    entries = [
+        {"id": str(result.inserted_id), "name": "Updated Item Name"},
+        {"id": missing_id, "name": "Updated Item Name"},
+        {"id": "invalid", "name": "Updated Item Name"},
+    ]
+    response = client.patch("/item/bulk", json=entries)
+
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"index": 0, "status": 200, "id": str(result.inserted_id), "detail": None},
+        {"index": 1, "status": 404, "id": missing_id, "detail": f"Item {missing_id} not found"},
+        {"index": 2, "status": 422, "id": None, "detail": "Invalid id invalid"},
+    ]
+    updated_item = await client.app.state.db["itemcollection"].find_one({"_id": result.inserted_id})
+    assert updated_item["name"] == "Updated Item Name"
+    assert updated_item["type"] == "Test Type"
+
+
+async def test_delete_items_bulk(client: TestClient) -> None:
+    """
+    Test the bulk delete endpoint deletes existing items and reports missing and invalid ids.
+    """
+    result = await client.app.state.db["itemcollection"].insert_many([
+        {"name": f"Test Item {i}", "type": "Test Type", "created_time": datetime.utcnow(), "updated_time": datetime.utcnow()}
+        for i in range(2)
+    ])
+    ids = [str(_id) for _id in result.inserted_ids]
+    missing_id = str(PyObjectId())
+    response = client.request("DELETE", "/item/bulk", json=[*ids, missing_id, "invalid"])
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == [200, 200, 404, 422]
+    assert await client.app.state.db["itemcollection"].count_documents({}) == 0
+
+
+async def test_create_item_return_minimal(client: TestClient) -> None:
+    """
+    Test the create item endpoint returns an empty response pointing at the new item when
+    `Prefer: return=minimal` is sent.
+    """
+    test_item = ItemNew(name="Test Item", type="Test Type")
+    response = client.post("/item", json=test_item.model_dump(mode='json'), headers={"Prefer": "return=minimal"})
+
+    assert response.status_code == 204
+    assert response.content == b""
+    assert response.headers["Preference-Applied"] == "return=minimal"
+
+    # The Location header points at the item we just created
+    response = client.get(response.headers["Location"])
+    assert response.status_code == 200
+    assert response.json()["name"] == test_item.name
+
+
+async def test_update_item_return_minimal(client: TestClient) -> None:
+    """
+    Test the update item endpoint returns an empty response when `Prefer: return=minimal` is sent.
+    """
+    result = await client.app.state.db["itemcollection"].insert_one({
+        "name": "Test Item",
+        "type": "Test Type",
+        "created_time": datetime.utcnow(),
+        "updated_time": datetime.utcnow()
+    })
+    update = ItemUpdate(type="Updated Item Type")
+    response = client.put(
+        f"/item/{result.inserted_id}",
+        json=update.model_dump(mode='json'),
+        headers={"Prefer": "handling=lenient, return=minimal"}
+    )
+
+    assert response.status_code == 204
+    assert response.headers["Location"].endswith(f"/item/{result.inserted_id}")
+    updated_item = await client.app.state.db["itemcollection"].find_one({"_id": result.inserted_id})
+    assert updated_item["type"] == "Updated Item Type"
+
+
+async def test_get_item_conditional(client: TestClient) -> None:
+    """
+    Test the get item endpoint returns 304 when the ETag or Last-Modified date sent back by the
+    client still match the item, and the full item once it has changed.
+    """
+    response = client.post("/item", json={"name": "Test Item", "type": "Test Type"})
+    item_id = response.json()["id"]
+    etag = response.headers["ETag"]
+
+    response = client.get(f"/item/{item_id}")
+    assert response.headers["ETag"] == etag
+    last_modified = response.headers["Last-Modified"]
+
+    response = client.get(f"/item/{item_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get(f"/item/{item_id}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    time.sleep(0.01)
+    client.put(f"/item/{item_id}", json={"name": "Updated Item Name"})
+    response = client.get(f"/item/{item_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+async def test_get_items_conditional(client: TestClient) -> None:
+    """
+    Test a page of the item listing returns 304 while none of its items change.
+    """
+    client.post("/item", json={"name": "Test Item", "type": "Test Type"})
+    etag = client.get("/item/").headers["ETag"]
+
+    assert client.get("/item/", headers={"If-None-Match": etag}).status_code == 304
+    # A different projection is a different representation
+    assert client.get("/item/", params={"fields": "name"}, headers={"If-None-Match": etag}).status_code == 200
+
+    client.post("/item", json={"name": "Test Item 2", "type": "Test Type"})
+    assert client.get("/item/", headers={"If-None-Match": etag}).status_code == 200
+
+
+async def test_update_item_if_match(client: TestClient) -> None:
+    """
+    Test updates and deletes sent with If-Match are only applied while the ETag is current.
+    """
+    response = client.post("/item", json={"name": "Test Item", "type": "Test Type"})
+    item_id = response.json()["id"]
+    etag = response.headers["ETag"]
+
+    time.sleep(0.01)
+    response = client.put(f"/item/{item_id}", json={"name": "Updated Item Name"}, headers={"If-Match": etag})
+    assert response.status_code == 200
+
+    # The old ETag no longer matches
+    response = client.put(f"/item/{item_id}", json={"name": "Stale Item Name"}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    response = client.delete(f"/item/{item_id}", headers={"If-Match": etag})
+    assert response.status_code == 412
+
+    response = client.delete(f"/item/{PyObjectId()}", headers={"If-Match": etag})
+    assert response.status_code == 404
+
+    current = client.get(f"/item/{item_id}").headers["ETag"]
+    response = client.delete(f"/item/{item_id}", headers={"If-Match": current})
+    assert response.status_code == 200
+
+
+async def test_get_items_fast_serialization(client: TestClient) -> None:
+    """
+    Test the item read endpoints return the same responses with fast serialisation enabled.
+    """
+    client.post("/item", json={"name": "Test Item 1", "type": "Test Type"})
+    client.post("/item", json={"name": "Test Item 2", "type": "Test Type"})
+    expected = client.get("/item/", params={"limit": 1})
+    expected_item = client.get(f"/item/{expected.json()[0]['id']}").json()
+    await client.app.state.cache.clear()
+
+    with patch.object(settings, "fast_serialization", True):
+        response = client.get("/item/", params={"limit": 1})
+        assert response.json() == expected.json()
+        assert response.headers["X-Next-Cursor"] == expected.headers["X-Next-Cursor"]
+        assert response.headers["ETag"] == expected.headers["ETag"]
+        assert client.get(f"/item/{expected_item['id']}").json() == expected_item
+        assert list(client.get("/item/", params={"fields": "type"}).json()[0]) == ["id", "type"]
+
+
+async def test_get_items_filter_and_sort(client: TestClient) -> None:
+    """
+    Test the item listing filters on name, type and time ranges, and pages through items sorted on
+    a field other than the id.
+    """
+    base = datetime(2024, 1, 1)
+    await client.app.state.db["itemcollection"].insert_many([
+        {
+            "name": name,
+            "type": type,
+            "created_time": base.replace(day=day),
+            "updated_time": base.replace(day=day)
+        } for name, type, day in [
+            ("apple", "fruit", 1), ("apricot", "fruit", 2), ("banana", "fruit", 3),
+            ("carrot", "vegetable", 4), ("avocado", "fruit", 5),
+        ]
+    ])
+
+    def names(params):
+        return [item["name"] for item in client.get("/item/", params=params).json()]
+
+    assert names({"type": "fruit", "sort": "name"}) == ["apple", "apricot", "avocado", "banana"]
+    assert names({"name": "banana"}) == ["banana"]
+    assert names({"name_prefix": "ap", "sort": "-name"}) == ["apricot", "apple"]
+    assert names({"name_prefix": "a.", "sort": "name"}) == []
+    assert names({"created_after": "2024-01-02T00:00:00", "created_before": "2024-01-05T00:00:00"}) == [
+        "apricot", "banana", "carrot"
+    ]
+
+    # Page through the fruit newest first, the sort key is read for the cursor but not returned
+    params = {"type": "fruit", "sort": "-updated_time", "limit": 3, "fields": "name"}
+    response = client.get("/item/", params=params)
+    assert [item["name"] for item in response.json()] == ["avocado", "banana", "apricot"]
+    assert list(response.json()[0]) == ["id", "name"]
+    assert "sort=-updated_time" in response.headers["Link"]
+    response = client.get("/item/", params={**params, "cursor": response.headers["X-Next-Cursor"]})
+    assert [item["name"] for item in response.json()] == ["apple"]
+    assert "X-Next-Cursor" not in response.headers
+
+    # A cursor can not be reused with another sort order
+    response = client.get("/item/", params={"sort": "name", "limit": 1})
+    response = client.get("/item/", params={"sort": "type", "cursor": response.headers["X-Next-Cursor"]})
+    assert response.status_code == 400
+
+    response = client.get("/item/", params={"sort": "password"})
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Can not sort on password"}
+
+
+async def test_get_items_by_id(client: TestClient) -> None:
+    """
+    Test several items can be fetched by id in one request, in the order requested.
+    """
+    ids = [client.post("/item", json={"name": f"Test Item {i}", "type": "Test Type"}).json()["id"] for i in range(3)]
+    missing = str(PyObjectId())
+
+    response = client.get("/item/batch", params={"ids": f"{ids[2]},{missing},{ids[0]},{ids[2]}"})
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()] == [ids[2], ids[0], ids[2]]
+    assert response.json()[1] == client.get(f"/item/{ids[0]}").json()
+
+    assert client.get("/item/batch", params={"ids": "not-an-id"}).status_code == 422
+    assert client.get("/item/batch").status_code == 422
+
+
+async def test_item_stats(client: TestClient) -> None:
+    """
+    Test the item counts are kept up to date by single and bulk writes, and match a recount.
+    """
+    ids = [client.post("/item", json={"name": f"Test Item {i}", "type": "A"}).json()["id"] for i in range(3)]
+    bulk = client.post("/item/bulk", json=[{"name": "Bulk Item", "type": "B"}] * 3).json()["results"]
+    assert client.get("/item/stats").json() == {"total": 6, "types": {"A": 3, "B": 3}}
+
+    client.put(f"/item/{ids[0]}", json={"type": "B"})
+    client.put(f"/item/{ids[1]}", json={"name": "Renamed"}, headers={"Prefer": "return=minimal"})
+    client.delete(f"/item/{ids[2]}")
+    assert client.get("/item/stats").json() == {"total": 5, "types": {"A": 1, "B": 4}}
+
+    client.patch("/item/bulk", json=[{"id": bulk[0]["id"], "type": "C"}, {"id": ids[1], "type": "C"}])
+    client.request("DELETE", "/item/bulk", json=[bulk[1]["id"], str(PyObjectId())])
+    expected = {"total": 4, "types": {"B": 2, "C": 2}}
+    assert client.get("/item/stats").json() == expected
+
+    # The incremental counts agree with a recount of the collection
+    await reconcile(client.app.state.db, "itemcollection", "itemstats", "type")
+    assert client.get("/item/stats").json() == expected
+
+
+async def test_get_items_total_count(client: TestClient) -> None:
+    """
+    Test unfiltered listings have the estimated number of items in the X-Total-Count header.
+    """
+    for i in range(3):
+        client.post("/item", json={"name": f"Test Item {i}", "type": "Test Type"})
+    assert client.get("/item/", params={"limit": 1}).headers["X-Total-Count"] == "3"
+    assert "X-Total-Count" not in client.get("/item/", params={"type": "Test Type"}).headers
+
+
+async def test_search_items(client: TestClient) -> None:
+    """
+    Test items are searched by name and type, best matches first and one page at a time, and writes
+    are reflected in the results. The mock database has no text search so the in-memory index is
+    used.
+    """
+    ids = {
+        name: client.post("/item", json={"name": name, "type": type}).json()["id"]
+        for name, type in [("Red Apple", "fruit"), ("Green Apple", "fruit"), ("Apple Pie", "dessert"), ("Banana", "fruit")]
+    }
+
+    def search(**params: Any) -> List[str]:
+        response = client.get("/item/search", params=params)
+        assert response.status_code == 200
+        return [item["name"] for item in response.json()]
+
+    assert search(q="apple") == ["Apple Pie", "Green Apple", "Red Apple"]
+    assert search(q="fruit apple") == ["Green Apple", "Red Apple"]
+    assert search(q="ban") == ["Banana"]
+    assert search(q="nana") == ["Banana"]
+    assert search(q="kiwi") == []
+
+    response = client.get("/item/search", params={"q": "fruit", "limit": 2})
+    assert len(response.json()) == 2
+    assert 'offset=2' in response.headers["Link"]
+    response = client.get("/item/search", params={"q": "fruit", "limit": 2, "offset": 2})
+    assert len(response.json()) == 1
+    assert "Link" not in response.headers
+
+    client.put(f"/item/{ids['Banana']}", json={"name": "Apple Banana"})
+    client.delete(f"/item/{ids['Red Apple']}")
+    client.patch("/item/bulk", json=[{"id": ids["Apple Pie"], "type": "fruit"}])
+    client.post("/item/bulk", json=[{"name": "Crab Apple", "type": "tree"}])
+    assert search(q="apple") == ["Apple Banana", "Apple Pie", "Crab Apple", "Green Apple"]
+    assert search(q="fruit") == ["Apple Banana", "Apple Pie", "Green Apple"]
+    client.request("DELETE", "/item/bulk", json=[ids["Apple Pie"]])
+    assert search(q="pie") == []
+
+    assert client.get("/item/search").status_code == 422
+
+
+async def test_create_item_ingest_async(client: TestClient) -> None:
+    """
+    Test items created with write-behind ingestion get a 202 response with the id and are inserted
+    shortly after, updating the counts.
+    """
+    with patch.object(settings, "ingest_async", True):
+        response = client.post("/item", json={"name": "Queued Item", "type": "Test Type"})
+        assert response.status_code == 202
+        id = response.json()["id"]
+        assert response.headers["Location"].endswith(f"/item/{id}")
+
+        response = client.post("/item", json={"name": "Minimal Item", "type": "Test Type"},
+                               headers={"Prefer": "return=minimal"})
+        assert response.status_code == 202
+        assert response.content == b""
+
+    for _ in range(100):
+        if client.get("/item/stats").json()["total"] == 2:
+            break
+        time.sleep(0.01)
+    assert client.get("/item/stats").json() == {"total": 2, "types": {"Test Type": 2}}
+    assert client.get(f"/item/{id}").json()["name"] == "Queued Item"
+
+
+async def test_stream_items(client: TestClient) -> None:
+    """
+    Test the live item feed starts with a reset event for an unknown token. The stream never ends,
+    so the app is called directly rather than through the TestClient, which reads whole responses.
+    """
+    messages = []
+    received = asyncio.Event()
+
+    async def receive() -> Dict[str, Any]:
+        await asyncio.Future()
+
+    async def send(message: Dict[str, Any]) -> None:
+        messages.append(message)
+        if message.get("body"):
+            received.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/item/stream", "raw_path": b"/item/stream", "query_string": b"after=unknown",
+        "headers": [(b"host", b"testserver")], "client": ("127.0.0.1", 1), "server": ("testserver", 80),
+        "root_path": "", "state": {},
+    }
+    task = asyncio.create_task(client.app(scope, receive, send))
+    await asyncio.wait_for(received.wait(), 5)
+    task.cancel()
+    await client.app.state.changefeed.stop()
+    assert messages[0]["status"] == 200
+    assert messages[-1]["body"] == b"event: reset\ndata: {}\n\n"
@@ -0,0 +1,23 @@
+from benchmarks.run import compare
+
+
+def test_compare():
+    baseline = {
+        "api": {"GET /item/{id}": {"throughput": 1000.0, "p50_ms": 5.0, "p99_ms": 10.0}},
+        "models": {"PyObjectId.validate": {"ns_per_op": 1000.0, "ops_per_second": 1e6}},
+    }
+    faster = {
+        "api": {"GET /item/{id}": {"throughput": 1100.0, "p50_ms": 4.0, "p99_ms": 11.0}},
+        "models": {"PyObjectId.validate": {"ns_per_op": 900.0, "ops_per_second": 1.1e6}, "New": {"ns_per_op": 1.0}},
+    }
+    assert compare(faster, baseline, 0.2) == []
+
+    slower = {
+        "api": {"GET /item/{id}": {"throughput": 700.0, "p50_ms": 5.5, "p99_ms": 20.0}},
+        "models": {"PyObjectId.validate": {"ns_per_op": 1500.0, "ops_per_second": 6.6e5}},
+    }
+    regressions = compare(slower, baseline, 0.2)
+    assert [r.split(":")[0] for r in regressions] == [
+        "GET /item/{id} throughput", "GET /item/{id} p99_ms",
+        "PyObjectId.validate ops_per_second", "PyObjectId.validate ns_per_op",
+    ]
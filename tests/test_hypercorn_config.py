@@ -0,0 +1,37 @@
+import importlib
+import os
+
+import pytest
+from hypercorn.config import Config
+
+import src.hypercorn_config
+from src.hypercorn_config import available_cpus
+from src.utils.settings import settings
+
+
+def test_hypercorn_config() -> None:
+    """
+    Test the Hypercorn configuration is built from the settings.
+    """
+    config = Config.from_object("src.hypercorn_config")
+    assert config.bind == [settings.server_bind]
+    assert config.workers == (settings.server_workers or available_cpus())
+    assert config.worker_class in ("asyncio", "uvloop")
+    assert config.backlog == settings.server_backlog
+    assert config.graceful_timeout == settings.server_graceful_timeout
+    assert 1 <= available_cpus()
+
+
+def test_hypercorn_config_import(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test importing the configuration with several CPUs starts a worker per CPU and leaves the
+    environment alone.
+    """
+    environment = dict(os.environ)
+    with monkeypatch.context() as m:
+        m.setattr(os, "sched_getaffinity", lambda pid: set(range(4)), raising=False)
+        m.setattr(settings, "server_workers", None)
+        importlib.reload(src.hypercorn_config)
+        assert src.hypercorn_config.workers == available_cpus() <= 4
+        assert dict(os.environ) == environment
+    importlib.reload(src.hypercorn_config)
@@ -0,0 +1,146 @@
+import fnmatch
+from datetime import datetime
+import json
+import time
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src.api.item.routes import get_item, item_cache_key
+from src.utils.cache import CachedResponse, MemoryCache, SharedCache
+from src.utils.common_models import PyObjectId
+from src.utils.settings import settings
+
+
+class FakeRedis:
+    """
+    A minimal in-memory stand-in for the redis asyncio client, covering the calls SharedCache makes.
+    """
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def scan_iter(self, match):
+        for key in list(self.data):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+
+async def test_memory_cache_lru() -> None:
+    # The least recently used entry is evicted once the cache is full
+    cache = MemoryCache(max_items=2, ttl=0)
+    await cache.set("a", CachedResponse(body=b"a"))
+    await cache.set("b", CachedResponse(body=b"b"))
+    assert (await cache.get("a")).body == b"a"
+    await cache.set("c", CachedResponse(body=b"c"))
+
+    assert await cache.get("b") is None
+    assert (await cache.get("a")).body == b"a"
+    assert (await cache.get("c")).body == b"c"
+    assert cache.info() == {
+        "backend": "MemoryCache", "hits": 3, "misses": 1, "evictions": 1, "expirations": 0,
+        "invalidations": 0, "size": 2, "max_items": 2
+    }
+
+
+async def test_memory_cache_ttl() -> None:
+    cache = MemoryCache(max_items=10, ttl=5)
+    await cache.set("a", CachedResponse(body=b"a"))
+    assert await cache.get("a") is not None
+
+    with patch.object(time, "monotonic", return_value=time.monotonic() + 10):
+        assert await cache.get("a") is None
+    assert cache.stats.expirations == 1
+
+
+async def test_cache_generations() -> None:
+    """
+    Test a response read before its key was invalidated is not stored, and forgotten generations
+    only ever prevent storing.
+    """
+    cache = MemoryCache(max_items=10, ttl=0)
+    cache.max_generations = 1
+    generation = cache.generation("a")
+    await cache.delete("a")
+    await cache.set("a", CachedResponse(body=b"old"), generation)
+    assert await cache.get("a") is None
+    await cache.set("a", CachedResponse(body=b"new"), cache.generation("a"))
+    assert (await cache.get("a")).body == b"new"
+
+    generation = cache.generation("b")
+    await cache.delete("a", "c")
+    await cache.set("b", CachedResponse(body=b"b"), generation)
+    assert await cache.get("b") is None
+
+
+async def test_shared_cache() -> None:
+    cache = SharedCache(FakeRedis(), ttl=60)
+    await cache.set("a", CachedResponse(body=b'{"a": 1}', headers={"ETag": '"x"'}))
+    assert await cache.get("a") == CachedResponse(body=b'{"a": 1}', headers={"ETag": '"x"'})
+
+    await cache.delete("a")
+    assert await cache.get("a") is None
+
+    await cache.set("b", CachedResponse(body=b"b"))
+    await cache.clear()
+    assert cache.client.data == {}
+
+
+async def test_item_cache_invalidation(client: TestClient) -> None:
+    """
+    Test repeated reads of an item are served from the cache and writes through the API invalidate
+    the cached entry.
+    """
+    result = await client.app.state.db["itemcollection"].insert_one({
+        "name": "Test Item",
+        "type": "Test Type",
+        "created_time": datetime.utcnow(),
+        "updated_time": datetime.utcnow()
+    })
+    cache = client.app.state.cache
+    assert client.get(f"/item/{result.inserted_id}").json()["name"] == "Test Item"
+
+    # A change made directly in the database is not seen until the entry is invalidated
+    await client.app.state.db["itemcollection"].update_one({"_id": result.inserted_id}, {"$set": {"name": "Changed"}})
+    assert client.get(f"/item/{result.inserted_id}").json()["name"] == "Test Item"
+    assert cache.stats.hits >= 1
+
+    client.put(f"/item/{result.inserted_id}", json={"type": "Updated Type"})
+    response = client.get(f"/item/{result.inserted_id}").json()
+    assert (response["name"], response["type"]) == ("Changed", "Updated Type")
+
+    client.delete(f"/item/{result.inserted_id}")
+    assert client.get(f"/item/{result.inserted_id}").status_code == 404
+
+    assert client.get("/cache/stats").status_code == 404
+    with patch.object(settings, "metrics_enabled", True):
+        assert client.get("/cache/stats").json()["invalidations"] >= 2
+
+
+async def test_item_cache_write_during_read() -> None:
+    """
+    Test an item updated while it is being read for the cache is not cached with the old version.
+    """
+    id = PyObjectId()
+    old = {"_id": id, "name": "Old Name", "type": "Test Type", "created_time": datetime(2024, 1, 1),
+           "updated_time": datetime(2024, 1, 1)}
+    cache = MemoryCache(max_items=10, ttl=0)
+
+    class Loader:
+        async def load(self, collection, id):
+            # The update lands after the read, and invalidates the cache before the read returns
+            await cache.delete(item_cache_key(id))
+            return old
+
+    response = await get_item(id, None, None, Loader(), cache)
+    assert json.loads(response.body)["name"] == "Old Name"
+    assert await cache.get(item_cache_key(id)) is None
@@ -0,0 +1,190 @@
+import asyncio
+from datetime import datetime
+
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import OperationFailure
+
+from src.utils.changefeed import DROPPED, RESET, ChangeEvent, ChangeFeed, format_event, sse_events
+
+
+async def next_events(subscription, count: int) -> list:
+    return [await asyncio.wait_for(subscription.__anext__(), 1) for _ in range(count)]
+
+
+async def test_changefeed_polling() -> None:
+    """
+    Test inserts, updates and deletes are published by the polling fallback used with the mock
+    database.
+    """
+    collection = AsyncMongoMockClient()["testdatabase"]["itemcollection"]
+    feed = ChangeFeed(collection.database, "itemcollection", poll_interval=0.01)
+    feed.start()
+    subscription = feed.subscribe()
+    await asyncio.sleep(0.02)
+    assert feed.polling
+
+    result = await collection.insert_one({"name": "Test Item", "updated_time": datetime(2024, 1, 1)})
+    [event] = await next_events(subscription, 1)
+    assert (event.operation, event.id, event.document["name"]) == ("insert", result.inserted_id, "Test Item")
+
+    await collection.update_one({"_id": result.inserted_id}, {"$set": {"updated_time": datetime(2024, 1, 2)}})
+    [event] = await next_events(subscription, 1)
+    assert (event.operation, event.document["updated_time"]) == ("update", datetime(2024, 1, 2))
+
+    await collection.delete_one({"_id": result.inserted_id})
+    [event] = await next_events(subscription, 1)
+    assert (event.operation, event.id, event.document) == ("delete", result.inserted_id, None)
+
+    await feed.stop()
+    assert await next_events(subscription, 1) == [DROPPED]
+
+
+async def test_changefeed_polls_only_with_subscribers() -> None:
+    """
+    Test the polling fallback only reads the collection while there are subscribers.
+    """
+    feed = ChangeFeed(AsyncMongoMockClient()["testdatabase"], "itemcollection", poll_interval=0.01)
+    snapshots = 0
+    snapshot = feed._snapshot
+
+    async def counted():
+        nonlocal snapshots
+        snapshots += 1
+        return await snapshot()
+
+    feed._snapshot = counted
+    feed.start()
+    await asyncio.sleep(0.05)
+    assert feed.polling and snapshots == 0
+
+    subscription = feed.subscribe()
+    await asyncio.sleep(0.05)
+    assert snapshots > 1
+
+    feed.unsubscribe(subscription)
+    await asyncio.sleep(0.02)
+    idle = snapshots
+    await asyncio.sleep(0.05)
+    assert snapshots == idle
+    await feed.stop()
+
+
+class FailingStream:
+    """
+    A change stream failing with an error, after which it waits forever.
+    """
+    def __init__(self, error) -> None:
+        self.error = error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.error is not None:
+            raise self.error
+        await asyncio.Future()
+
+
+async def test_changefeed_errors() -> None:
+    """
+    Test the feed only falls back to polling when change streams are not supported, and starts
+    again from the current changes, resetting the subscribers, when its history is lost.
+    """
+    feed = ChangeFeed(AsyncMongoMockClient()["testdatabase"], "itemcollection", poll_interval=0.01)
+    errors = [OperationFailure("lost", 286), OperationFailure("not authorized", 13), None]
+    resumed = []
+
+    def watch(pipeline, full_document, resume_after):
+        resumed.append(resume_after)
+        return FailingStream(errors.pop(0))
+
+    feed.collection.watch = watch
+    feed._resume_after = {"_data": "old"}
+    feed.publish(ChangeEvent("old", "insert", 1, {"_id": 1}))
+    subscription = feed.subscribe()
+    feed.start()
+    assert await next_events(subscription, 1) == [RESET]
+    await asyncio.sleep(0.05)
+    assert resumed == [{"_data": "old"}, None, None]
+    assert not feed.polling and not feed.history
+    await feed.stop()
+
+    feed = ChangeFeed(AsyncMongoMockClient()["testdatabase"], "itemcollection", poll_interval=0.01)
+    feed.collection.watch = lambda *args, **kwargs: FailingStream(
+        OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+    )
+    feed.start()
+    await asyncio.sleep(0.02)
+    assert feed.polling
+    await feed.stop()
+
+
+async def test_changefeed_slow_subscriber() -> None:
+    """
+    Test a subscriber whose queue is full is dropped without affecting the others.
+    """
+    feed = ChangeFeed(AsyncMongoMockClient()["testdatabase"], "itemcollection", queue_size=2)
+    slow, fast = feed.subscribe(), feed.subscribe()
+    events = [ChangeEvent(str(i), "insert", i, {"_id": i}) for i in range(3)]
+    for event in events[:2]:
+        feed.publish(event)
+        await next_events(fast, 1)
+    feed.publish(events[2])
+
+    assert [event async for event in slow] == [DROPPED]
+    assert feed.subscribers == {fast} and feed.dropped == 1
+    assert await next_events(fast, 1) == [events[2]]
+
+
+async def test_changefeed_resume() -> None:
+    """
+    Test a subscriber can resume after a token in the history, and gets a reset event otherwise.
+    """
+    feed = ChangeFeed(AsyncMongoMockClient()["testdatabase"], "itemcollection", history_size=3)
+    events = [ChangeEvent(str(i), "insert", i, {"_id": i}) for i in range(4)]
+    for event in events:
+        feed.publish(event)
+
+    assert await next_events(feed.subscribe(after="1"), 2) == events[2:]
+    assert await next_events(feed.subscribe(after="0"), 1) == [RESET]
+    assert feed.subscribe(after="3").queue.empty()
+
+
+async def test_changefeed_resume_long_backlog() -> None:
+    """
+    Test a subscriber resuming with more events to catch up on than its queue holds gets a reset
+    event rather than part of them.
+    """
+    feed = ChangeFeed(AsyncMongoMockClient()["testdatabase"], "itemcollection", queue_size=3, history_size=10)
+    for i in range(10):
+        feed.publish(ChangeEvent(str(i), "insert", i, {"_id": i}))
+
+    subscription = feed.subscribe(after="2")
+    assert await next_events(subscription, 1) == [RESET]
+    assert subscription.queue.empty() and not subscription.dropped
+    assert [event.token for event in await next_events(feed.subscribe(after="7"), 2)] == ["8", "9"]
+
+
+async def test_sse_events() -> None:
+    """
+    Test events are formatted as Server-Sent Events, with keep-alive comments while idle.
+    """
+    event = ChangeEvent("token", "update", 1, {"_id": 1, "name": "Test Item"})
+    assert format_event(event) == b'id: token\nevent: update\ndata: {"id":1,"name":"Test Item"}\n\n'
+    assert format_event(ChangeEvent("token", "delete", 1, None)) == b'id: token\nevent: delete\ndata: {"id":1}\n\n'
+    assert format_event(RESET) == b"event: reset\ndata: {}\n\n"
+
+    feed = ChangeFeed(AsyncMongoMockClient()["testdatabase"], "itemcollection")
+    subscription = feed.subscribe()
+    stream = sse_events(feed, subscription, keepalive=0.01)
+    assert await stream.__anext__() == b": keep-alive\n\n"
+    feed.publish(event)
+    assert await stream.__anext__() == format_event(event)
+    await stream.aclose()
+    assert feed.subscribers == set()
@@ -0,0 +1,139 @@
+import asyncio
+import zlib
+
+from fastapi.testclient import TestClient
+from starlette.responses import Response, StreamingResponse
+
+from src.utils.compression import CompressionMiddleware, select_encoding
+
+
+def test_select_encoding() -> None:
+    """
+    Test the encoding is chosen by quality value, then by server preference.
+    """
+    assert select_encoding("gzip, deflate", ["br", "gzip"]) == "gzip"
+    assert select_encoding("gzip, br", ["br", "gzip"]) == "br"
+    assert select_encoding("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert select_encoding("*", ["br", "gzip"]) == "br"
+    assert select_encoding("*, br;q=0", ["br", "gzip"]) == "gzip"
+    assert select_encoding("gzip;q=0", ["gzip"]) is None
+    assert select_encoding("", ["gzip"]) is None
+    assert select_encoding("identity", ["gzip"]) is None
+
+
+async def call(app, headers, messages: list = None) -> list:
+    """
+    Call an ASGI app with a GET request, returning the messages it sends. The messages are also
+    added to `messages` as they are sent.
+    """
+    messages = [] if messages is None else messages
+    received = asyncio.Event()
+
+    async def receive():
+        # The request has no body, after which the client never disconnects
+        if received.is_set():
+            await asyncio.Future()
+        received.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""}
+    await app(scope, receive, send)
+    return messages
+
+
+async def test_compression_middleware() -> None:
+    """
+    Test large responses are compressed, and small, already encoded and uncompressible responses
+    are not.
+    """
+    body = b'{"name": "Test Item", "type": "Test Type"}' * 100
+    gzip = [(b"accept-encoding", b"gzip")]
+
+    def app(content: bytes, media_type: str = "application/json", headers: dict = None):
+        return CompressionMiddleware(Response(content, media_type=media_type, headers=headers), minimum_size=100)
+
+    start, message = await call(app(body), gzip)
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(message["body"]) < len(body)
+    assert zlib.decompress(message["body"], zlib.MAX_WBITS | 16) == body
+
+    # Not accepted by the client
+    start, message = await call(app(body), [])
+    assert b"content-encoding" not in dict(start["headers"]) and message["body"] == body
+
+    # Below the minimum size, already encoded, or not a compressible content type
+    for content, response in (
+        (body[:50], app(body[:50])), (body, app(body, headers={"Content-Encoding": "br"})), (body, app(body, "image/png"))
+    ):
+        start, message = await call(response, gzip)
+        assert dict(start["headers"]).get(b"content-encoding") != b"gzip" and message["body"] == content
+
+
+async def test_compression_middleware_streaming() -> None:
+    """
+    Test streamed responses are compressed chunk by chunk, with each chunk decodable as soon as it
+    arrives, and event streams are left alone.
+    """
+    chunks = [b'{"name": "Test Item %d"}\n' % i * 10 for i in range(5)]
+
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    app = CompressionMiddleware(StreamingResponse(stream(), media_type="application/x-ndjson"), minimum_size=100)
+    start, *messages = await call(app, [(b"accept-encoding", b"gzip")])
+    assert dict(start["headers"])[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in dict(start["headers"])
+
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    received = [decompressor.decompress(message["body"]) for message in messages]
+    assert received[:len(chunks)] == chunks
+    assert b"".join(received) == b"".join(chunks)
+    assert decompressor.eof
+
+    app = CompressionMiddleware(StreamingResponse(stream(), media_type="text/event-stream"), minimum_size=100)
+    start, *messages = await call(app, [(b"accept-encoding", b"gzip")])
+    assert b"content-encoding" not in dict(start["headers"])
+    assert b"".join(message["body"] for message in messages) == b"".join(chunks)
+
+
+async def test_compression_middleware_event_stream_headers() -> None:
+    """
+    Test the headers of an event stream are sent before its first event, even when the client
+    accepts gzip, as browsers always do.
+    """
+    first_event = asyncio.Event()
+
+    async def events():
+        await first_event.wait()
+        yield b"event: insert\ndata: {}\n\n"
+
+    app = CompressionMiddleware(StreamingResponse(events(), media_type="text/event-stream"), minimum_size=0)
+    messages = []
+    request = asyncio.create_task(call(app, [(b"accept-encoding", b"gzip")], messages))
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert [message["type"] for message in messages] == ["http.response.start"]
+    assert b"content-encoding" not in dict(messages[0]["headers"])
+
+    first_event.set()
+    await request
+    assert messages[1]["body"] == b"event: insert\ndata: {}\n\n"
+
+
+async def test_compressed_listing(client: TestClient) -> None:
+    """
+    Test item listings are compressed when the client accepts gzip.
+    """
+    for i in range(20):
+        client.post("/item/", json={"name": f"Test Item {i}", "type": "Test Type"})
+    response = client.get("/item/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(response.json()) == 20
+    assert client.get("/item/", headers={"Accept-Encoding": "identity"}).headers.get("Content-Encoding") is None
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from src.utils.common_models import PyObjectId
+from src.utils.conditional import (
+    document_etag, etag_matches, http_date, if_match_filter, not_modified, parse_etag
+)
+
+
+def test_document_etag() -> None:
+    # The ETag can be parsed back into the id and millisecond updated_time it was made from
+    _id = PyObjectId()
+    updated_time = datetime(2024, 5, 6, 7, 8, 9, 123000)
+    etag = document_etag(_id, updated_time)
+    assert parse_etag(etag) == (_id, updated_time)
+    assert parse_etag('"not-an-etag"') is None
+
+    assert if_match_filter(None, _id) == {}
+    assert if_match_filter("*", _id) == {}
+    assert if_match_filter(f'"other", {etag}', _id) == {"updated_time": {"$in": [updated_time]}}
+    assert if_match_filter(document_etag(PyObjectId(), updated_time), _id) == {"updated_time": {"$in": []}}
+
+
+def test_not_modified() -> None:
+    assert etag_matches('W/"a", "b"', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches('"b"', '"a"')
+
+    last_modified = http_date(datetime(2024, 5, 6, 7, 8, 9))
+    assert last_modified == "Mon, 06 May 2024 07:08:09 GMT"
+    assert not_modified(None, last_modified, '"a"', last_modified)
+    assert not not_modified(None, "Mon, 06 May 2024 07:08:08 GMT", '"a"', last_modified)
+    assert not not_modified(None, "garbage", '"a"', last_modified)
+    # If-None-Match takes precedence over If-Modified-Since
+    assert not not_modified('"b"', last_modified, '"a"', last_modified)
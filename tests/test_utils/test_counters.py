@@ -0,0 +1,40 @@
+import asyncio
+from unittest.mock import patch
+
+from mongomock_motor import AsyncMongoMockClient
+
+from src.utils.counters import count_values, increment, read_counts, reconcile, reconcile_periodically
+
+
+async def test_counters() -> None:
+    """
+    Test counters are incremented, counters at 0 are left out, and reconciling recounts the source
+    collection.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    await increment(db, "counters", {"a": 2, "b": 1})
+    await increment(db, "counters", {"b": -1, "c": 0})
+    assert await read_counts(db, "counters") == {"a": 2}
+
+    await db["items"].insert_many([{"type": "a"}, {"type": "c"}, {"type": "c"}])
+    assert count_values([{"type": "a"}, {"type": "c"}, {"type": "c"}], "type", -1) == {"a": -1, "c": -2}
+    assert await reconcile(db, "items", "counters", "type") == {"a": 1, "c": 2}
+    assert await read_counts(db, "counters") == {"a": 1, "c": 2}
+    assert await db["counters"].count_documents({}) == 2
+
+
+async def test_reconcile_periodically() -> None:
+    """
+    Test the first reconciliation waits a random part of the interval, so workers started together
+    do not all recount at once.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    await db["items"].insert_one({"type": "a"})
+    with patch("src.utils.counters.random.uniform", return_value=0.05) as uniform:
+        task = asyncio.create_task(reconcile_periodically(db, "items", "counters", "type", interval=10))
+        await asyncio.sleep(0.01)
+        assert await read_counts(db, "counters") == {}
+        await asyncio.sleep(0.1)
+        assert await read_counts(db, "counters") == {"a": 1}
+        task.cancel()
+    uniform.assert_called_once_with(0, 10)
@@ -1,4 +1,22 @@
+import asyncio
+from unittest.mock import patch
+
+import pymongo
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI, Request
 from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import _csot
+from pymongo.errors import AutoReconnect, NetworkTimeout, ServerSelectionTimeoutError
+
+from src.utils.changefeed import ChangeFeed
+from src.utils.database import (
+    BatchLoader, ConnectionManager, create_background_task, get_db, ping, setup_database, utcnow
+)
+from src.utils.ingest import IngestBuffer
+from src.utils.search import SearchIndex
+from src.utils.settings import settings
 
 
 async def test_database_connection_issue(client: TestClient) -> None:
@@ -8,5 +26,287 @@ async def test_database_connection_issue(client: TestClient) -> None:
     client.app.state.db = None
     response = client.get("/item")
 
-    assert response.status_code == 500
+    assert response.status_code == 503
     assert response.json() == {'detail': 'Database Connection Error'}
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_utcnow() -> None:
+    # Timestamps are truncated to the millisecond precision stored by MongoDB
+    assert utcnow().microsecond % 1000 == 0
+
+
+class FlakyDatabase:
+    """
+    A database which fails the first `failures` commands.
+    """
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.calls = 0
+
+    async def command(self, name: str) -> dict:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ServerSelectionTimeoutError("No servers")
+        return {"ok": 1}
+
+
+async def test_ping() -> None:
+    """
+    Test the startup ping retries until the database answers, and gives up after the last attempt.
+    """
+    database = FlakyDatabase(failures=2)
+    await ping(database, attempts=3, base_delay=0.001)
+    assert database.calls == 3
+
+    database = FlakyDatabase(failures=3)
+    with pytest.raises(ServerSelectionTimeoutError):
+        await ping(database, attempts=3, base_delay=0.001)
+    assert database.calls == 3
+
+
+async def test_connection_manager() -> None:
+    """
+    Test the connection manager reconnects in the background after a failed startup, opens the
+    circuit after enough failures in a row and closes it when a ping succeeds.
+    """
+    database = FlakyDatabase(failures=2)
+    connected = []
+
+    async def on_connect() -> None:
+        connected.append(True)
+
+    connection = ConnectionManager(database, on_connect=on_connect, check_interval=0.01, failure_threshold=2,
+                                   base_delay=0.001)
+    assert not await connection.connect(attempts=1)
+    assert not connection.available
+    assert connection.last_error == "No servers"
+    assert connection.retry_after() >= 1
+
+    connection.start()
+    for _ in range(100):
+        if connection.available:
+            break
+        await asyncio.sleep(0.01)
+    assert connection.available
+    assert connected == [True]
+
+    # One failure is tolerated, a second in a row opens the circuit until the next ping
+    connection.record_failure(ServerSelectionTimeoutError("No servers"))
+    connection.record_success()
+    connection.record_failure(ServerSelectionTimeoutError("No servers"))
+    assert connection.available
+    connection.record_failure(ServerSelectionTimeoutError("No servers"))
+    assert not connection.available
+    await asyncio.sleep(0.05)
+    assert connection.available
+    assert connected == [True]
+    await connection.stop()
+
+
+async def test_connection_manager_setup_error() -> None:
+    """
+    Test the setup after connecting is tried again after the next ping when it fails, and startup
+    pings give up after the check timeout.
+    """
+    calls = []
+
+    async def on_connect() -> None:
+        calls.append(True)
+        if len(calls) == 1:
+            raise AutoReconnect("Connection reset")
+
+    connection = ConnectionManager(FlakyDatabase(failures=0), on_connect=on_connect, check_interval=0.01)
+    assert await connection.connect(attempts=1)
+    assert not connection.connected and connection.available
+    assert connection.last_error == "Connection reset"
+
+    connection.start()
+    for _ in range(100):
+        if connection.connected:
+            break
+        await asyncio.sleep(0.01)
+    assert connection.connected and calls == [True, True]
+    await connection.stop()
+
+    class SlowDatabase:
+        async def command(self, name):
+            # Only a ping with a timeout gives up
+            if _csot.get_timeout() is None:
+                await asyncio.Future()
+            raise ServerSelectionTimeoutError("No servers")
+
+    connection = ConnectionManager(SlowDatabase(), check_timeout=0.01, base_delay=0.001)
+    assert not await asyncio.wait_for(connection.connect(attempts=2), 2)
+
+
+async def test_setup_database() -> None:
+    """
+    Test the database is only published to requests once the setup has finished.
+    """
+    app = FastAPI()
+    app.state.db = None
+    app.state.connection = ConnectionManager(AsyncMongoMockClient()["testdatabase"])
+    published = []
+
+    async def ensure_indexes(db) -> None:
+        published.append(app.state.db)
+
+    with patch("src.utils.database.ensure_indexes", ensure_indexes), patch.object(settings, "create_indexes", True):
+        await setup_database(app)
+    try:
+        assert published == [None]
+        assert app.state.db is app.state.connection.db
+        assert app.state.changefeed.db is app.state.db
+    finally:
+        app.state.reconciliation.cancel()
+        await app.state.changefeed.stop()
+
+
+async def test_get_db_circuit_breaker(client: TestClient) -> None:
+    """
+    Test requests get a 503 response while the circuit is open, the health endpoints report it,
+    and requests failing to reach the database are counted.
+    """
+    connection = ConnectionManager(FlakyDatabase(failures=0), failure_threshold=1)
+    client.app.state.connection = connection
+    try:
+        response = client.get("/item")
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+        assert client.get("/health/live").json() == {"status": "ok"}
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "unavailable"
+
+        await connection.connect(attempts=1)
+        assert client.get("/item").status_code == 200
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        assert response.json()["database"]["available"]
+
+        # A timeout from the request's own deadline does not count against the database
+        dependency = get_db(Request({"type": "http", "app": client.app}))
+        await dependency.__anext__()
+        with pytest.raises(NetworkTimeout):
+            await dependency.athrow(NetworkTimeout("timed out"))
+        assert connection.available
+        dependency = get_db(Request({"type": "http", "app": client.app}))
+        await dependency.__anext__()
+        with pytest.raises(ServerSelectionTimeoutError):
+            await dependency.athrow(ServerSelectionTimeoutError("No servers"))
+        assert not connection.available
+    finally:
+        del client.app.state.connection
+
+
+async def test_batch_loader() -> None:
+    """
+    Test concurrent lookups are combined into one query, duplicates share a result and missing
+    documents are returned as None.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    ids = (await db["itemcollection"].insert_many([{"name": f"Item {i}"} for i in range(3)])).inserted_ids
+    missing = ObjectId()
+    loader = BatchLoader(db)
+
+    results = await asyncio.gather(
+        *(loader.load("itemcollection", id) for id in [*ids, ids[0], missing]),
+        loader.load_many("itemcollection", [ids[1], missing]),
+    )
+    assert [result and result["name"] for result in results[:5]] == ["Item 0", "Item 1", "Item 2", "Item 0", None]
+    assert [result and result["name"] for result in results[5]] == ["Item 1", None]
+    assert loader.batches == 1
+    assert loader.lookups == 7
+
+    # Lookups made later go in a new batch, and a full batch is sent without waiting
+    loader = BatchLoader(db, window=10, max_batch_size=2)
+    assert [result["name"] for result in await loader.load_many("itemcollection", ids[:2])] == ["Item 0", "Item 1"]
+    assert loader.batches == 1
+
+
+async def test_batch_loader_error() -> None:
+    """
+    Test an error from the database is raised in every lookup of the batch.
+    """
+    class FailingDatabase:
+        def __getitem__(self, name):
+            raise ServerSelectionTimeoutError("No servers")
+
+    loader = BatchLoader(FailingDatabase())
+    results = await asyncio.gather(loader.load("itemcollection", 1), loader.load("itemcollection", 2),
+                                   return_exceptions=True)
+    assert all(isinstance(result, ServerSelectionTimeoutError) for result in results)
+    assert loader._futures == {} and loader._sent == {}
+
+
+async def test_batch_loader_deadlines() -> None:
+    """
+    Test a batch runs under the latest deadline of its callers rather than the first caller's, and
+    a lookup only joins a query already sent when that query's deadline is not earlier.
+    """
+    class RecordingDatabase:
+        def __init__(self) -> None:
+            self.timeouts = []
+            self.release = asyncio.Event()
+
+        def __getitem__(self, name):
+            return self
+
+        def find(self, query):
+            self.timeouts.append(_csot.get_timeout())
+            self.ids = query["_id"]["$in"]
+            return self
+
+        async def to_list(self, length):
+            await self.release.wait()
+            return [{"_id": id} for id in self.ids]
+
+    async def load(loader: BatchLoader, id: int, timeout=None):
+        with pymongo.timeout(timeout):
+            return await loader.load("itemcollection", id)
+
+    db = RecordingDatabase()
+    db.release.set()
+    loader = BatchLoader(db)
+    await asyncio.gather(load(loader, 1, 1), load(loader, 2, 5))
+    await asyncio.gather(load(loader, 1, 1), load(loader, 2))
+    assert 4.9 < db.timeouts[0] <= 5 and db.timeouts[1] is None
+    assert loader.batches == 2
+
+    db = RecordingDatabase()
+    loader = BatchLoader(db)
+    first = asyncio.create_task(load(loader, 1, 1))
+    await asyncio.sleep(0.01)
+    later = asyncio.gather(load(loader, 1, 0.5), load(loader, 1, 5))
+    await asyncio.sleep(0.01)
+    assert loader.batches == 2
+    db.release.set()
+    assert await asyncio.gather(first, later) == [{"_id": 1}, [{"_id": 1}, {"_id": 1}]]
+    assert 0.9 < db.timeouts[0] <= 1 and 4.9 < db.timeouts[1] <= 5
+    assert loader._sent == {}
+
+
+async def test_background_tasks_outlive_deadline() -> None:
+    """
+    Test the long running tasks which can be started during a request do not run under its
+    `pymongo.timeout` deadline.
+    """
+    timeouts = []
+
+    async def record(*args) -> None:
+        timeouts.append(_csot.get_timeout())
+
+    db = AsyncMongoMockClient()["testdatabase"]
+    feed = ChangeFeed(db, "itemcollection")
+    index = SearchIndex(db, "itemcollection", {"name": 1}, feed)
+    with patch.object(ChangeFeed, "_run", record), patch.object(IngestBuffer, "_run", record), \
+            patch.object(SearchIndex, "_follow", record):
+        with pymongo.timeout(0.01):
+            assert _csot.get_timeout() == 0.01
+            await create_background_task(record())
+            feed.start()
+            IngestBuffer(db, "itemcollection").start()
+            await index.build()
+        await asyncio.sleep(0.01)
+    assert timeouts == [None, None, None, None]
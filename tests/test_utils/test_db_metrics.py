@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src.utils.database import client_options
+from src.utils.db_metrics import CommandMetrics, PoolMetrics, command_metrics, pool_metrics
+from src.utils.settings import settings
+
+
+def test_client_options() -> None:
+    # Unset options are left to the driver and the metrics listeners are always registered
+    options = client_options()
+    assert "maxPoolSize" not in options
+    assert "waitQueueTimeoutMS" not in options
+    assert options["event_listeners"] == [pool_metrics, command_metrics]
+
+    with patch.object(settings, "mongodb_max_pool_size", 20), patch.object(settings, "mongodb_min_pool_size", 0):
+        options = client_options()
+    assert (options["maxPoolSize"], options["minPoolSize"]) == (20, 0)
+
+
+def test_pool_metrics() -> None:
+    metrics = PoolMetrics()
+    address = ("localhost", 27017)
+    metrics.connection_created(SimpleNamespace(address=address))
+    metrics.connection_created(SimpleNamespace(address=address))
+    metrics.connection_checked_out(SimpleNamespace(address=address, duration=0.5))
+    metrics.connection_checked_out(SimpleNamespace(address=address, duration=0.25))
+    metrics.connection_checked_in(SimpleNamespace(address=address))
+    metrics.connection_check_out_failed(SimpleNamespace(address=address))
+    metrics.connection_closed(SimpleNamespace(address=address))
+
+    assert metrics.snapshot() == {
+        "localhost:27017": {
+            "connections": 1,
+            "checked_out": 1,
+            "checkouts": 2,
+            "checkout_failures": 1,
+            "checkout_wait_seconds_total": 0.75,
+            "checkout_wait_seconds_max": 0.5,
+            "pool_clears": 0,
+        }
+    }
+
+
+def test_command_metrics() -> None:
+    metrics = CommandMetrics()
+    metrics.succeeded(SimpleNamespace(command_name="find", duration_micros=2000))
+    metrics.failed(SimpleNamespace(command_name="find", duration_micros=4000))
+
+    assert metrics.snapshot() == {
+        "find": {"count": 2, "failures": 1, "duration_seconds_total": 0.006, "duration_seconds_max": 0.004}
+    }
+
+
+async def test_get_database_stats(client: TestClient) -> None:
+    # The statistics show the database hosts, so they are only served with metrics enabled
+    assert client.get("/database/stats").status_code == 404
+    with patch.object(settings, "metrics_enabled", True):
+        response = client.get("/database/stats")
+    assert response.status_code == 200
+    assert set(response.json()) == {"pools", "commands"}
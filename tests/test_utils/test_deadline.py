@@ -0,0 +1,105 @@
+import asyncio
+
+from pymongo import _csot
+from pymongo.errors import ExecutionTimeout
+from starlette.responses import PlainTextResponse
+
+from src.utils.deadline import DeadlineMiddleware
+from src.utils.metrics import REQUESTS_ABORTED
+
+
+async def call(middleware: DeadlineMiddleware, path: str = "/item/", headers=(), disconnect: asyncio.Event = None):
+    """
+    Send a GET request to the middleware and return the messages it sends. The client disconnects
+    when `disconnect` is set.
+    """
+    messages = []
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b""}
+        await (disconnect.wait() if disconnect is not None else asyncio.Future())
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": list(headers), "query_string": b""}
+    await middleware(scope, receive, send)
+    return messages
+
+
+def test_deadline_budget() -> None:
+    """
+    Test the deadline of a request comes from the longest matching route budget, and the request
+    header can only shorten it.
+    """
+    middleware = DeadlineMiddleware(None, default=10, budgets={"GET /item/export": 0, "GET /item/e": 5})
+
+    def budget(path, timeout=None):
+        headers = [(b"x-request-timeout", timeout.encode())] if timeout else []
+        return middleware.budget({"method": "GET", "path": path, "headers": headers})
+
+    assert budget("/item/") == 10
+    assert budget("/item/export") is None
+    assert budget("/item/else") == 5
+    assert budget("/item/", "2.5") == 2.5
+    assert budget("/item/", "60") == 10
+    assert budget("/item/export", "60") == 60
+    assert budget("/item/", "nonsense") == 10
+
+
+async def test_deadline_middleware() -> None:
+    """
+    Test requests get the time left as their MongoDB timeout, and get a 504 response when they run
+    out of time or MongoDB gives up.
+    """
+    timeouts = []
+
+    async def app(scope, receive, send):
+        timeouts.append(_csot.get_timeout())
+        if scope["path"] == "/slow":
+            await asyncio.sleep(1)
+        if scope["path"] == "/mongodb":
+            raise ExecutionTimeout("operation exceeded time limit", 50)
+        await PlainTextResponse("OK")(scope, receive, send)
+
+    middleware = DeadlineMiddleware(app, default=0.05)
+    aborted = REQUESTS_ABORTED.values.get(("deadline",), 0)
+
+    assert (await call(middleware))[0]["status"] == 200
+    assert timeouts == [0.05]
+    # The timeout only applies within the request
+    assert _csot.get_timeout() is None
+    assert (await call(middleware, "/slow"))[0]["status"] == 504
+    messages = await call(middleware, "/mongodb")
+    assert messages[0]["status"] == 504
+    assert messages[1]["body"] == b'{"detail": "Request Timed Out"}'
+    assert REQUESTS_ABORTED.values[("deadline",)] == aborted + 2
+
+
+async def test_deadline_middleware_disconnect() -> None:
+    """
+    Test a request is cancelled as soon as its client disconnects.
+    """
+    started = asyncio.Event()
+    cancelled = False
+
+    async def app(scope, receive, send):
+        nonlocal cancelled
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    disconnect = asyncio.Event()
+    request = asyncio.create_task(call(DeadlineMiddleware(app, default=0), disconnect=disconnect))
+    await started.wait()
+    disconnect.set()
+    assert await asyncio.wait_for(request, 1) == []
+    assert cancelled
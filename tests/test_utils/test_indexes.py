@@ -0,0 +1,31 @@
+from mongomock_motor import AsyncMongoMockClient
+
+from src.api.item.models import ITEM_INDEXES
+from src.utils.indexes import INDEX_REGISTRY, ensure_indexes, index_report
+
+
+def test_register_indexes() -> None:
+    # Importing the item models registers their indexes
+    assert INDEX_REGISTRY["itemcollection"] == ITEM_INDEXES
+
+
+async def test_ensure_indexes() -> None:
+    db = AsyncMongoMockClient()["testdatabase"]
+
+    # Every declared index is missing from a new database
+    report = await index_report(db)
+    assert {entry["name"] for entry in report if not entry["exists"]} == {
+        index.document["name"] for index in ITEM_INDEXES
+    }
+
+    created = await ensure_indexes(db)
+    assert set(created) == {index.document["name"] for index in ITEM_INDEXES}
+    assert await ensure_indexes(db) == []
+
+    report = await index_report(db)
+    assert all(entry["exists"] and entry["declared"] for entry in report)
+
+    # Indexes created outside the registry are reported as undeclared
+    await db["itemcollection"].create_index("type", name="type_only")
+    report = await index_report(db)
+    assert [entry["name"] for entry in report if not entry["declared"]] == ["type_only"]
@@ -0,0 +1,79 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from src.utils.ingest import IngestBuffer
+
+
+async def test_ingest_buffer_batches() -> None:
+    """
+    Test documents are inserted in batches when a batch is full or its flush interval has passed,
+    and the inserted documents are passed to `after_insert`.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    batches = []
+
+    async def after_insert(documents):
+        batches.append(len(documents))
+
+    buffer = IngestBuffer(db, "items", batch_size=3, flush_interval=0.05, after_insert=after_insert)
+    buffer.start()
+    for i in range(4):
+        await buffer.put({"_id": i})
+    await asyncio.sleep(0.01)
+    # The full batch is inserted straight away, the remaining document waits for the interval
+    assert batches == [3]
+    await asyncio.sleep(0.1)
+    assert batches == [3, 1]
+    assert await db["items"].count_documents({}) == 4
+    await buffer.stop()
+
+
+async def test_ingest_buffer_backpressure_and_drain() -> None:
+    """
+    Test a full buffer makes `put` wait, and stopping the buffer inserts everything queued.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    buffer = IngestBuffer(db, "items", max_size=2, batch_size=10, flush_interval=10)
+    await buffer.put({"_id": 1})
+    await buffer.put({"_id": 2})
+    with pytest.raises(asyncio.TimeoutError):
+        await buffer.put({"_id": 3}, timeout=0.01)
+
+    buffer.start()
+    await buffer.put({"_id": 3}, timeout=1)
+    await buffer.stop()
+    assert await db["items"].count_documents({}) == 3
+    assert buffer.inserted == 3
+
+
+async def test_ingest_buffer_errors() -> None:
+    """
+    Test inserts are retried when the database is not reachable and documents it rejects are
+    dropped.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    buffer = IngestBuffer(db, "items", flush_interval=0.01)
+    insert_many = buffer.collection.insert_many
+    calls = []
+
+    async def flaky_insert_many(documents, **kwargs):
+        calls.append(len(documents))
+        if len(calls) == 1:
+            raise AutoReconnect("connection reset")
+        return await insert_many(documents, **kwargs)
+
+    with patch.object(buffer.collection, "insert_many", flaky_insert_many):
+        await buffer._insert([{"_id": 1}, {"_id": 2}])
+    assert calls == [2, 2]
+    assert buffer.inserted == 2
+
+    error = BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}, {"index": 1, "code": 121, "errmsg": "bad"}]})
+    with patch.object(buffer.collection, "insert_many", side_effect=error):
+        await buffer._insert([{"_id": 3}, {"_id": 4}])
+    # The duplicate was inserted by an earlier attempt, the other document is dropped
+    assert buffer.inserted == 3
+    assert buffer.dropped == 1
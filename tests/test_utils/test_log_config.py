@@ -0,0 +1,49 @@
+import json
+import logging
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src.utils.log_config import (
+    DebugSamplingFilter, JsonFormatter, RequestContextFilter, configure_logging, request_id_var
+)
+
+
+def make_record(level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord("test", level, __file__, 1, "Getting item %s", ("abc",), None)
+
+
+def test_configure_logging() -> None:
+    # Logging is configured once, records go through a single QueueHandler on the root logger
+    configure_logging()
+    configure_logging()
+    handlers = logging.getLogger().handlers
+    assert sum(isinstance(handler, logging.handlers.QueueHandler) for handler in handlers) == 1
+    assert not any(type(handler) is logging.StreamHandler for handler in handlers)
+
+
+def test_json_formatter() -> None:
+    record = make_record()
+    token = request_id_var.set("1234")
+    try:
+        RequestContextFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Getting item abc"
+    assert (entry["level"], entry["request_id"], entry["route"]) == ("INFO", "1234", "-")
+
+
+def test_debug_sampling_filter() -> None:
+    sampling = DebugSamplingFilter(rate=0.25)
+    with patch("random.random", return_value=0.5):
+        assert not sampling.filter(make_record(logging.DEBUG))
+        assert sampling.filter(make_record(logging.WARNING))
+    with patch("random.random", return_value=0.1):
+        assert sampling.filter(make_record(logging.DEBUG))
+
+
+async def test_request_id(client: TestClient) -> None:
+    # A request id is generated for each request unless the client sends one
+    assert len(client.get("/").headers["X-Request-ID"]) == 32
+    assert client.get("/", headers={"X-Request-ID": "abc"}).headers["X-Request-ID"] == "abc"
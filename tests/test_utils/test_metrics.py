@@ -0,0 +1,55 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.utils.metrics import Counter, Histogram, MetricsMiddleware
+from src.utils.settings import settings
+
+
+def test_counter() -> None:
+    counter = Counter("test_total", "A test counter.", ("route",))
+    counter.inc("/item/{id}")
+    counter.inc("/item/{id}", amount=2)
+    assert counter.render() == [
+        "# HELP test_total A test counter.",
+        "# TYPE test_total counter",
+        'test_total{route="/item/{id}"} 3',
+    ]
+    with pytest.raises(ValueError):
+        counter.inc()
+
+
+def test_histogram() -> None:
+    histogram = Histogram("test_seconds", "A test histogram.", buckets=(0.1, 1))
+    histogram.observe(value=0.05)
+    histogram.observe(value=0.5)
+    histogram.observe(value=5)
+    assert histogram.samples() == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1"} 2',
+        'test_seconds_bucket{le="+Inf"} 3',
+        "test_seconds_sum 5.55",
+        "test_seconds_count 3",
+    ]
+
+
+async def test_metrics_endpoint(client: TestClient) -> None:
+    """
+    Test requests are recorded against their route template and served at /metrics.
+    """
+    # The endpoint is hidden unless metrics are enabled
+    assert client.get("/metrics").status_code == 404
+
+    with patch.object(settings, "metrics_enabled", True), TestClient(MetricsMiddleware(client.app)) as metrics_client:
+        item_id = metrics_client.post("/item", json={"name": "Test Item", "type": "Test Type"}).json()["id"]
+        metrics_client.get(f"/item/{item_id}")
+        metrics_client.get("/no/such/route")
+
+        response = metrics_client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'http_requests_total{method="GET",route="/item/{id}",status="200"}' in response.text
+        assert 'http_requests_total{method="GET",route="<unmatched>",status="404"}' in response.text
+        assert 'http_request_duration_seconds_bucket{method="POST",route="/item/",status="200",le="+Inf"}' in response.text
+        assert 'http_requests_in_flight{method="GET"} 1' in response.text
@@ -0,0 +1,21 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.utils.openapi import use_openapi_file, write_openapi
+
+
+def test_use_openapi_file(client: TestClient, tmp_path) -> None:
+    """
+    Test a schema written by write_openapi is served from the file rather than being generated.
+    """
+    path = str(tmp_path / "openapi.json")
+    write_openapi(client.app, path)
+
+    app = FastAPI()
+    assert not use_openapi_file(app, str(tmp_path / "missing.json"))
+    assert use_openapi_file(app, path)
+    # The app has no routes of its own, so the schema must come from the file
+    with TestClient(app) as file_client:
+        schema = file_client.get("/openapi.json").json()
+    assert "/item/{id}" in schema["paths"]
+    assert schema == client.get("/openapi.json").json()
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+from bson import Code, ObjectId, Regex
+
+from src.utils.common_models import PyObjectId
+from src.utils.pagination import cursor_values, decode_cursor, encode_cursor, keyset_filter, parse_sort
+
+
+def test_cursor_round_trip() -> None:
+    # ObjectIds and datetimes must keep their types so they can be compared in MongoDB
+    sort = [("updated_time", 1), ("_id", 1)]
+    document = {"_id": PyObjectId(), "updated_time": datetime(2024, 1, 2, 3, 4, 5, 6000), "name": "x"}
+    cursor = encode_cursor(cursor_values(document, sort), sort)
+    assert decode_cursor(cursor, sort) == [document["updated_time"], document["_id"]]
+
+    # A cursor produced for one sort order can not be used with another
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor, [("_id", 1)])
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor, [("updated_time", -1), ("_id", -1)])
+
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor("!!!", sort)
+
+
+def test_forged_cursor() -> None:
+    """
+    Test cursors carrying operators, patterns or values of the wrong type are rejected.
+    """
+    sort = [("name", 1), ("_id", 1)]
+    types = {"name": str, "_id": ObjectId}
+    _id = PyObjectId()
+    assert decode_cursor(encode_cursor(["a", _id], sort), sort, types) == ["a", _id]
+    assert decode_cursor(encode_cursor([None, _id], sort), sort, types) == [None, _id]
+    for value in ({"$ne": None}, ["a"], Regex(".*"), Code("1"), 1):
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            decode_cursor(encode_cursor([value, _id], sort), sort, types)
+    # Without types only plain values are accepted
+    assert decode_cursor(encode_cursor([1, _id], sort), sort) == [1, _id]
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(encode_cursor([Regex(".*"), _id], sort), sort)
+
+
+def test_keyset_filter() -> None:
+    _id = PyObjectId()
+    assert keyset_filter([("_id", 1)], [_id]) == {"_id": {"$gt": _id}}
+    assert keyset_filter([("name", -1), ("_id", 1)], ["b", _id]) == {
+        "$or": [
+            {"name": {"$lt": "b"}},
+            {"name": "b", "_id": {"$gt": _id}},
+        ]
+    }
+
+
+def test_parse_sort() -> None:
+    allowed = {"_id", "name"}
+    assert parse_sort("_id", allowed) == [("_id", 1)]
+    assert parse_sort("-_id", allowed) == [("_id", -1)]
+    assert parse_sort("-name", allowed) == [("name", -1), ("_id", -1)]
+    with pytest.raises(ValueError, match="Can not sort on type"):
+        parse_sort("type", allowed)
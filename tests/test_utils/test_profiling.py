@@ -0,0 +1,37 @@
+import pstats
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src.utils.profiling import ProfilingMiddleware, list_profiles
+from src.utils.settings import Mode, settings
+
+
+async def test_profiling_middleware(client: TestClient, tmp_path) -> None:
+    """
+    Test requests sent with X-Profile are profiled, only the newest profiles are kept, and the
+    profiles can be downloaded in DEV mode.
+    """
+    middleware = ProfilingMiddleware(client.app, directory=str(tmp_path), max_files=2, sample_rate=0.0)
+    with TestClient(middleware) as profiling_client:
+        # Requests without the header are not sampled
+        assert "X-Profile-Id" not in profiling_client.get("/item/").headers
+        assert list_profiles(str(tmp_path)) == []
+
+        names = [profiling_client.get("/item/", headers={"X-Profile": "1"}).headers["X-Profile-Id"] for _ in range(3)]
+        assert all("-GET-item" in name for name in names)
+        assert list_profiles(str(tmp_path)) == names[:0:-1]
+
+        # The stored files are valid cProfile output
+        assert pstats.Stats(str(tmp_path / names[-1])).total_calls > 0
+
+        with patch.multiple(settings, profiling_enabled=True, profiling_dir=str(tmp_path), mode=Mode.DEV):
+            assert profiling_client.get("/profiles").json() == names[:0:-1]
+            response = profiling_client.get(f"/profiles/{names[-1]}")
+            assert response.status_code == 200
+            assert response.content == (tmp_path / names[-1]).read_bytes()
+            assert profiling_client.get(f"/profiles/{names[0]}").status_code == 404
+            assert profiling_client.get("/profiles/..%2Fsettings.py").status_code == 404
+
+    # The endpoints are hidden outside DEV mode
+    assert client.get("/profiles").status_code == 404
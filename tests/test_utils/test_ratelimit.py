@@ -0,0 +1,112 @@
+import asyncio
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+from src.utils.ratelimit import MemoryRateLimitStore, RateLimitMiddleware, route_class
+from src.utils.settings import settings
+
+
+async def test_memory_rate_limit_store() -> None:
+    """
+    Test buckets allow a burst, then refill at the rate, and clients have separate buckets.
+    """
+    store = MemoryRateLimitStore(max_keys=2)
+    assert [await store.take("a", rate=1000, burst=2) for _ in range(2)] == [0, 0]
+    wait = await store.take("a", rate=1000, burst=2)
+    assert 0 < wait <= 0.001
+    assert await store.take("b", rate=1000, burst=2) == 0
+    await asyncio.sleep(0.002)
+    assert await store.take("a", rate=1000, burst=2) == 0
+
+    # Only the most recently used buckets are kept
+    await store.take("c", rate=1000, burst=2)
+    assert list(store._buckets) == ["a", "c"]
+
+
+async def test_rate_limit_middleware(client: TestClient) -> None:
+    """
+    Test clients beyond their rate get a 429 response with Retry-After, per address, and exempt
+    paths are not limited.
+    """
+    middleware = RateLimitMiddleware(
+        client.app, MemoryRateLimitStore(), rate=0.1, burst=2, max_in_flight={}, exempt=["/cache"]
+    )
+    with TestClient(middleware) as limited_client:
+        assert [limited_client.get("/item/").status_code for _ in range(3)] == [200, 200, 429]
+        response = limited_client.get("/item/")
+        assert response.json() == {"detail": "Too Many Requests"}
+        assert int(response.headers["Retry-After"]) >= 1
+
+        # Headers chosen by the client do not give it another bucket
+        assert limited_client.get("/item/", headers={"X-API-Key": "other"}).status_code == 429
+        with patch.object(settings, "metrics_enabled", True):
+            assert limited_client.get("/cache/stats").status_code == 200
+
+
+async def test_rate_limit_trusted_proxies(client: TestClient) -> None:
+    """
+    Test requests from a trusted proxy are limited per forwarded client address, and addresses the
+    client put in front of the proxy's own do not give it another bucket.
+    """
+    middleware = RateLimitMiddleware(
+        client.app, MemoryRateLimitStore(), rate=0.1, burst=1, max_in_flight={},
+        trusted_proxies=["testclient", "10.0.0.2"]
+    )
+    with TestClient(middleware) as limited_client:
+        assert limited_client.get("/item/", headers={"X-Forwarded-For": "1.1.1.1"}).status_code == 200
+        assert limited_client.get("/item/", headers={"X-Forwarded-For": "1.1.1.1"}).status_code == 429
+        assert limited_client.get("/item/", headers={"X-Forwarded-For": "2.2.2.2, 10.0.0.2"}).status_code == 200
+        assert limited_client.get("/item/", headers={"X-Forwarded-For": "3.3.3.3, 1.1.1.1"}).status_code == 429
+
+
+async def test_in_flight_limit() -> None:
+    """
+    Test requests beyond the in-flight limit of their route class get a 503 response straight away.
+    """
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await PlainTextResponse("OK")(scope, receive, send)
+
+    middleware = RateLimitMiddleware(
+        app, MemoryRateLimitStore(), rate=0, burst=0, max_in_flight={"read": 1, "write": 1, "stream": 0}
+    )
+
+    async def request(method: str, path: str = "/item/") -> int:
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": method, "path": path, "headers": [], "query_string": b""}
+        await middleware(scope, receive, send)
+        return messages[0]["status"]
+
+    first = asyncio.create_task(request("GET"))
+    await asyncio.sleep(0)
+    assert await request("GET") == 503
+    write = asyncio.create_task(request("POST"))
+    stream = asyncio.create_task(request("GET", "/item/stream"))
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(first, write, stream) == [200, 200, 200]
+    assert middleware.in_flight == {"read": 0, "write": 0, "stream": 0}
+
+
+def test_route_class() -> None:
+    """
+    Test requests are classified by method and path, whatever they accept.
+    """
+    def scope(method: str, path: str, accept: bytes = b"*/*") -> dict:
+        return {"method": method, "path": path, "headers": [(b"accept", accept)]}
+
+    assert route_class(scope("GET", "/item/stream")) == "stream"
+    assert route_class(scope("GET", "/item/", b"text/event-stream")) == "read"
+    assert route_class(scope("HEAD", "/item/1")) == "read"
+    assert route_class(scope("POST", "/item/stream")) == "write"
@@ -0,0 +1,133 @@
+import asyncio
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict
+from unittest.mock import patch
+
+from mongomock_motor import AsyncMongoMockClient
+
+from src.utils.changefeed import ChangeEvent, ChangeFeed
+from src.utils.search import SearchIndex, term_grams, word_grams
+
+
+def test_grams() -> None:
+    """
+    Test words are indexed under their trigrams and prefix, and short terms only match prefixes.
+    """
+    assert word_grams("apple") == {"^a", "^ap", "app", "ppl", "ple"}
+    assert word_grams("a") == {"^a"}
+    assert term_grams("appl") == {"app", "ppl"}
+    assert term_grams("ap") == {"^ap"}
+
+
+async def test_search_index() -> None:
+    """
+    Test the index is built from the collection, ranks whole words above prefixes above parts of
+    words and names above types, and is kept current by add and remove.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    await db["items"].insert_many([
+        {"_id": 1, "name": "Apple", "type": "fruit"},
+        {"_id": 2, "name": "Pineapple", "type": "fruit"},
+        {"_id": 3, "name": "Applesauce", "type": "condiment"},
+        {"_id": 4, "name": "Crumble", "type": "apple dessert"},
+    ])
+    index = SearchIndex(db, "items", {"name": 10, "type": 2})
+    # Changes are ignored until the index is built
+    index.add({"_id": 5, "name": "Apple Pie", "type": "dessert"})
+    await index.build()
+    assert len(index.documents) == 4
+
+    assert [id for id, _ in index.search("apple", 10)] == [1, 3, 2, 4]
+    assert [id for id, _ in index.search("ap", 10)] == [1, 3, 4]
+    assert [id for id, _ in index.search("apple fruit", 10)] == [1, 2]
+    assert index.search("apple", 2, offset=1) == index.search("apple", 10)[1:3]
+    assert index.search("kiwi", 10) == []
+    assert index.search("!", 10) == []
+
+    index.add({"_id": 2, "name": "Pear"})
+    index.remove(1)
+    assert [id for id, _ in index.search("fruit", 10)] == [2]
+    assert [id for id, _ in index.search("apple", 10)] == [3, 4]
+    assert "pin" not in index.postings
+
+
+async def test_search_index_build_keeps_newer_writes() -> None:
+    """
+    Test documents written while the index is built are not overwritten by what the build read.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    await db["items"].insert_many([{"_id": 1, "name": "Old Name", "type": "a"}, {"_id": 2, "name": "Gone", "type": "a"}])
+    index = SearchIndex(db, "items", {"name": 10, "type": 2})
+    find = index.collection.find
+
+    async def find_with_writes(*args: Any, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+        # The documents are read before the writes arrive
+        documents = await find(*args, **kwargs).to_list(None)
+        index.add({"_id": 1, "name": "New Name", "type": "a"})
+        index.remove(2)
+        for document in documents:
+            yield document
+
+    with patch.object(index.collection, "find", find_with_writes):
+        await index.build()
+    assert index.documents == {1: {"name": "new name", "type": "a"}}
+
+
+async def test_search_index_follows_changefeed() -> None:
+    """
+    Test the index applies the changes published by the feed, as made through other workers, and
+    is read again when the feed resets.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    await db["items"].insert_one({"_id": 1, "name": "Apple", "type": "fruit"})
+    feed = ChangeFeed(db, "items")
+    index = SearchIndex(db, "items", {"name": 10, "type": 2}, feed)
+    await index.build()
+    assert len(feed.subscribers) == 1
+
+    feed.publish(ChangeEvent("1", "insert", 2, {"_id": 2, "name": "Pear", "type": "fruit"}))
+    feed.publish(ChangeEvent("2", "delete", 1, None))
+    await asyncio.sleep(0.01)
+    assert [id for id, _ in index.search("fruit", 10)] == [2]
+
+    # Only what is in the collection is kept
+    await db["items"].replace_one({"_id": 1}, {"name": "Plum", "type": "fruit"})
+    feed._reset()
+    await asyncio.sleep(0.01)
+    assert [id for id, _ in index.search("fruit", 10)] == [1]
+    assert index.search("apple", 10) == []
+
+    await index.stop()
+    assert feed.subscribers == set()
+
+
+async def test_search_index_without_change_streams() -> None:
+    """
+    Test the index does not keep a polling feed subscribed, and reads the documents updated since
+    its last read instead.
+    """
+    db = AsyncMongoMockClient()["testdatabase"]
+    await db["items"].insert_one({"_id": 1, "name": "Apple", "type": "fruit", "updated_time": datetime(2024, 1, 1)})
+    feed = ChangeFeed(db, "items", poll_interval=0.01)
+    feed.polling = True
+    index = SearchIndex(db, "items", {"name": 10, "type": 2}, feed)
+    await index.build()
+    await asyncio.sleep(0.02)
+    assert feed.subscribers == set()
+
+    find = index.collection.find
+    queries = []
+
+    def recording_find(query, *args, **kwargs):
+        queries.append(query)
+        return find(query, *args, **kwargs)
+
+    with patch.object(index.collection, "find", recording_find):
+        await db["items"].insert_one({"_id": 2, "name": "Pear", "type": "fruit", "updated_time": datetime(2024, 1, 2)})
+        await db["items"].update_one({"_id": 1}, {"$set": {"name": "Plum", "updated_time": datetime(2024, 1, 3)}})
+        await asyncio.sleep(0.05)
+    assert [id for id, _ in index.search("fruit", 10)] == [2, 1]
+    assert index.search("apple", 10) == []
+    assert queries[0] == {"updated_time": {"$gte": datetime(2024, 1, 1)}}
+    assert queries[-1] == {"updated_time": {"$gte": datetime(2024, 1, 3)}}
+    await index.stop()
@@ -0,0 +1,50 @@
+import time
+from datetime import datetime
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+from src.api.item.models import Item
+from src.utils.common_models import PyObjectId
+from src.utils.serialization import document_to_json, documents_to_json
+
+
+def make_documents(count: int) -> List[dict]:
+    now = datetime(2024, 5, 6, 7, 8, 9, 123000)
+    return [
+        {"_id": PyObjectId(), "name": f"Test Item {i}", "type": "Test Type", "created_time": now, "updated_time": now}
+        for i in range(count)
+    ]
+
+
+def test_documents_to_json() -> None:
+    # The fast path must produce the same JSON as the Item model
+    documents = make_documents(3)
+    expected = [Item(**document).model_dump(mode="json") for document in documents]
+    assert orjson.loads(documents_to_json(documents)) == expected
+    assert orjson.loads(document_to_json(documents[0])) == expected[0]
+
+    # Partial documents from a projection are encoded as they are
+    assert orjson.loads(document_to_json({"_id": documents[0]["_id"]})) == {"id": str(documents[0]["_id"])}
+
+
+def test_serialization_benchmark() -> None:
+    """
+    Compare the per-item CPU cost of building Item models and validating them again against the
+    response model, as FastAPI does, with encoding the documents directly.
+    """
+    adapter = TypeAdapter(List[Item])
+
+    def model_path(documents):
+        return adapter.dump_json(adapter.validate_python([Item(**document) for document in documents]))
+
+    for count in (100, 10_000):
+        documents = make_documents(count)
+        timings = {}
+        for name, encode in (("model", model_path), ("fast", documents_to_json)):
+            start = time.process_time()
+            body = encode(documents)
+            timings[name] = (time.process_time() - start) / count * 1e6
+            assert orjson.loads(body)[0]["id"] == str(documents[0]["_id"])
+        print(f"\n{count} items: model {timings['model']:.2f}us/item, fast {timings['fast']:.2f}us/item")